@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+/api/questions/search 吞吐量基准测试
+
+对比两种数据库连接方式下的每秒请求数：
+  before - 每次数据库操作都 sqlite3.connect()/close()（连接池引入前的行为）
+  after  - 使用 db_pool 中按线程复用、已开启WAL的长连接
+
+用法：
+    python bench_search.py --questions 5000 --threads 4 --duration 10 --writers 1
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _seed_questions(question_manager, count: int):
+    """写入基准测试数据"""
+    tags_pool = ["立体几何", "导数题", "三角函数", "数列", "概率统计", "解析几何"]
+    for i in range(count):
+        question_manager.add_question(
+            latex_content=f"已知函数 $f(x)=x^{{{i % 7 + 2}}}-{i}x$，求 $f(x)$ 的极值。第{i}题",
+            tags=[tags_pool[i % len(tags_pool)], tags_pool[(i * 3) % len(tags_pool)]],
+            reference_answer=f"解：对 $f(x)$ 求导得 ...（{i}）",
+            source=f"基准测试卷{i % 50}",
+            user_id=1
+        )
+
+
+def _unpooled_connection(db_path: str) -> sqlite3.Connection:
+    """模拟连接池引入前的行为：每次操作新建连接（由调用方的cursor.close()后随GC释放）"""
+    return sqlite3.connect(db_path)
+
+
+def _run_load(app, duration: float, threads: int, writers: int, question_manager) -> float:
+    """并发压测搜索接口，返回每秒请求数"""
+    stop_at = time.time() + duration
+    counts = [0] * threads
+    queries = [
+        "/api/questions/search?limit=20",
+        "/api/questions/search?tags=导数题&tags=数列",
+        "/api/questions/search?keyword=极值",
+    ]
+
+    def reader(index: int):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        n = 0
+        while time.time() < stop_at:
+            response = client.get(queries[n % len(queries)])
+            response.get_data()
+            n += 1
+        counts[index] = n
+
+    def writer():
+        i = 0
+        while time.time() < stop_at:
+            question_manager.add_question(latex_content=f"写入压力题目 {i}", tags=["数列"], user_id=1)
+            i += 1
+
+    workers = [threading.Thread(target=reader, args=(i,)) for i in range(threads)]
+    workers += [threading.Thread(target=writer) for _ in range(writers)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return sum(counts) / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="搜索接口吞吐量基准测试")
+    parser.add_argument('--questions', type=int, default=5000, help='预置题目数量')
+    parser.add_argument('--threads', type=int, default=4, help='并发读请求线程数')
+    parser.add_argument('--writers', type=int, default=1, help='并发写入线程数')
+    parser.add_argument('--duration', type=float, default=10.0, help='每轮压测时长（秒）')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_search_')
+    os.chdir(workdir)
+
+    import question_manager as qm_module
+    import db_pool
+    import web_server
+    from question_manager import QuestionManager
+
+    db_path = os.path.join(workdir, 'bench_questions.db')
+    question_manager = QuestionManager(db_path=db_path, system_manager=web_server.system_manager)
+    web_server.question_manager = question_manager
+    _seed_questions(question_manager, args.questions)
+
+    results = {}
+    pooled_get_connection = qm_module.get_connection
+    for mode in ('before', 'after'):
+        db_pool.close_all_pools()
+        if mode == 'before':
+            # 恢复为默认的回滚日志模式，还原连接池引入前的并发行为
+            conn = sqlite3.connect(db_path)
+            conn.execute("PRAGMA journal_mode = DELETE")
+            conn.close()
+        qm_module.get_connection = _unpooled_connection if mode == 'before' else pooled_get_connection
+        rps = _run_load(web_server.app, args.duration, args.threads, args.writers, question_manager)
+        results[mode] = rps
+        print(f"[{mode:6}] {rps:8.1f} req/s  (题目数: {args.questions}, 读线程: {args.threads}, 写线程: {args.writers})")
+    qm_module.get_connection = pooled_get_connection
+
+    if results['before'] > 0:
+        print(f"提升: {results['after'] / results['before']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
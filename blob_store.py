@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+图片存储模块 - 按内容哈希寻址、两级分片目录、带引用计数的文件存储
+"""
+
+import glob
+import hashlib
+import os
+import re
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import SYSTEM_DATABASE_PATH, BLOB_STORE_CONFIG
+from db_pool import get_connection
+from logger import get_logger
+
+# 内容寻址文件的访问路径：/uploads/blobs/ab/cd/<sha256>.<ext>
+_BLOB_URL_RE = re.compile(r'^/uploads/blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(?:\.[A-Za-z0-9]+)?$')
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """
+    内容寻址的上传文件存储
+
+    文件以SHA-256命名并存放在 blobs/<前两位>/<三四位>/ 下，相同内容只保存一份；
+    引用计数记录有多少道题目引用了该文件，计数为0且超过保留期的文件可被回收。
+    """
+
+    def __init__(self, upload_folder: str, db_path: str = SYSTEM_DATABASE_PATH):
+        """
+        初始化文件存储
+
+        Args:
+            upload_folder: 上传根目录（/uploads/ 对应的目录）
+            db_path: 引用计数表所在的数据库文件路径
+        """
+        self.upload_folder = upload_folder
+        self.root = os.path.join(upload_folder, 'blobs')
+        self.tmp_dir = os.path.join(self.root, '.tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.db_path = db_path
+        self.logger = get_logger()
+        self.init_database()
+
+    def init_database(self):
+        """初始化引用计数表"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                ext TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                touched_at REAL NOT NULL, -- 最近一次上传或引用变化的时间，回收保留期从此算起
+                width INTEGER,
+                height INTEGER
+            )
+        ''')
+        
+        # 迁移：图片尺寸列
+        cursor.execute("PRAGMA table_info(blobs)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'width' not in columns:
+            cursor.execute('ALTER TABLE blobs ADD COLUMN width INTEGER')
+            cursor.execute('ALTER TABLE blobs ADD COLUMN height INTEGER')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_blobs_refcount ON blobs(refcount, touched_at)')
+
+        conn.commit()
+        cursor.close()
+
+    def put_chunks(self, chunks: Iterable[bytes], ext: str) -> Dict:
+        """
+        边写入边计算哈希地保存文件
+
+        先写入临时文件，完成后原子地移动到内容地址。同一内容只保存一份：
+        已存在的内容沿用首次上传时的扩展名，以不同扩展名重复上传不会产生未登记的副本。
+
+        Args:
+            chunks: 文件内容分块
+            ext: 扩展名（不含点）
+
+        Returns:
+            {'hash', 'size', 'ext', 'url'}，ext 为实际使用的扩展名
+        """
+        ext = (ext or '').lower().lstrip('.')
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        hasher = hashlib.sha256()
+        size = 0
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+
+            # 先登记（或刷新）记录再落盘：并发上传同一内容时都以记录中的扩展名为准
+            conn = get_connection(self.db_path)
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    INSERT INTO blobs (hash, ext, size, refcount, touched_at)
+                    VALUES (?, ?, ?, 0, ?)
+                    ON CONFLICT(hash) DO UPDATE SET touched_at = excluded.touched_at
+                ''', (digest, ext, size, time.time()))
+                cursor.execute('SELECT ext FROM blobs WHERE hash = ?', (digest,))
+                ext = cursor.fetchone()[0]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+            path = self.path_for(digest, ext)
+            # 内容相同则覆盖结果不变；总是替换也能补回被并发回收的文件
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return {'hash': digest, 'size': size, 'ext': ext, 'url': self.url_for(digest, ext)}
+
+    def put_stream(self, stream, ext: str) -> Dict:
+        """保存文件流（如上传的文件），参数与返回值同 put_chunks"""
+        return self.put_chunks(iter(lambda: stream.read(_CHUNK_SIZE), b''), ext)
+
+    def put_bytes(self, data: bytes, ext: str) -> Dict:
+        """保存内存中的文件内容，参数与返回值同 put_chunks"""
+        return self.put_chunks([data], ext)
+
+    def path_for(self, digest: str, ext: str) -> str:
+        """内容哈希对应的本地文件路径"""
+        name = f"{digest}.{ext}" if ext else digest
+        return os.path.join(self.root, digest[:2], digest[2:4], name)
+
+    def url_for(self, digest: str, ext: str) -> str:
+        """内容哈希对应的访问路径"""
+        name = f"{digest}.{ext}" if ext else digest
+        return f"/uploads/blobs/{digest[:2]}/{digest[2:4]}/{name}"
+
+    @staticmethod
+    def hash_from_url(url: str) -> Optional[str]:
+        """从访问路径中解析内容哈希，旧的非内容寻址路径返回None"""
+        match = _BLOB_URL_RE.match(url or '')
+        return match.group(1) if match else None
+
+    def set_dimensions(self, digest: str, width: int, height: int):
+        """记录图片尺寸"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('UPDATE blobs SET width = ?, height = ? WHERE hash = ?', (width, height, digest))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def get_dimensions(self, digest: str) -> Optional[Tuple[int, int]]:
+        """读取图片尺寸，未记录时返回None"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT width, height FROM blobs WHERE hash = ?', (digest,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+        return (row[0], row[1]) if row and row[0] is not None else None
+
+    def add_refs(self, urls: List[str]):
+        """题目引用了这些文件：增加引用计数（旧路径忽略）"""
+        self._adjust_refs(urls, 1)
+
+    def release_refs(self, urls: List[str]):
+        """题目不再引用这些文件：减少引用计数（旧路径忽略）"""
+        self._adjust_refs(urls, -1)
+
+    def _adjust_refs(self, urls: List[str], sign: int):
+        counts = Counter(digest for digest in map(self.hash_from_url, urls or []) if digest)
+        if not counts:
+            return
+
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        try:
+            now = time.time()
+            cursor.executemany('UPDATE blobs SET refcount = MAX(0, refcount + ?), touched_at = ? WHERE hash = ?',
+                               [(sign * count, now, digest) for digest, count in counts.items()])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def collect_garbage(self, grace_seconds: float = None, on_remove=None) -> int:
+        """
+        删除没有任何题目引用、且超过保留期没有再被上传或引用的文件
+
+        保留期用于覆盖“已上传但题目尚未保存”的时间窗口。
+
+        Args:
+            grace_seconds: 保留期（秒），默认取配置
+            on_remove: 每删除一个文件后以其哈希调用（用于清理衍生文件）
+
+        Returns:
+            删除的文件数
+        """
+        if grace_seconds is None:
+            grace_seconds = BLOB_STORE_CONFIG["orphan_grace_seconds"]
+        cutoff = time.time() - grace_seconds
+
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT hash, ext FROM blobs WHERE refcount = 0 AND touched_at < ?', (cutoff,))
+            orphans = cursor.fetchall()
+            removed = 0
+            for digest, ext in orphans:
+                # 删除前再次确认仍未被引用，避免与并发的引用竞争
+                cursor.execute('DELETE FROM blobs WHERE hash = ? AND refcount = 0 AND touched_at < ?', (digest, cutoff))
+                if not cursor.rowcount:
+                    continue
+                # 提交前（仍持有写锁）把文件移为墓碑：并发上传同一内容的登记要等本事务提交，
+                # 之后写回的文件不会再被删除
+                tombstones = self._move_to_tombstones(digest, ext)
+                try:
+                    conn.commit()
+                except Exception:
+                    self._restore_tombstones(tombstones)
+                    raise
+                for _, tombstone in tombstones:
+                    os.remove(tombstone)
+                if on_remove:
+                    on_remove(digest)
+                removed += 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        if removed:
+            self.logger.log_system_info(f"回收未被引用的上传文件 {removed} 个")
+        return removed
+
+    def _move_to_tombstones(self, digest: str, ext: str) -> List[Tuple[str, str]]:
+        """
+        把内容哈希对应的文件（连同旧版本以其它扩展名重复保存的副本）移到临时目录
+
+        Returns:
+            (原路径, 墓碑路径) 列表
+        """
+        tombstones = []
+        try:
+            for path in {self.path_for(digest, ext), *glob.glob(self.path_for(digest, '*'))}:
+                tombstone = os.path.join(self.tmp_dir, f'{uuid.uuid4().hex}.deleted')
+                try:
+                    os.rename(path, tombstone)
+                except FileNotFoundError:
+                    continue
+                tombstones.append((path, tombstone))
+        except Exception:
+            self._restore_tombstones(tombstones)
+            raise
+        return tombstones
+
+    def _restore_tombstones(self, tombstones: List[Tuple[str, str]]):
+        """删除记录未能提交时把墓碑移回原路径"""
+        for path, tombstone in tombstones:
+            try:
+                os.replace(tombstone, path)
+            except OSError as e:
+                self.logger.log_error(e, f"恢复待回收文件失败: {path}")
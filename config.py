@@ -45,6 +45,132 @@ WEB_CONFIG = {
 # 其他配置
 MAX_QUESTION_LENGTH = 10000  # 题目最大长度
 MAX_ANSWER_LENGTH = 5000     # 答案最大长度
+MAX_BULK_QUESTIONS = 200     # 批量保存的最大题目数
 
 # OCR服务配置
-OCR_BASE_URL = "http://192.168.31.65:5000"
\ No newline at end of file
+OCR_BASE_URL = "http://192.168.31.65:5000"
+OCR_CLIENT_CONFIG = {
+    "connect_timeout": 5,       # 建立连接超时（秒）
+    "read_timeout": 600,        # 等待响应超时（秒），CPU推理一页可能需要数分钟
+    "max_retries": 3,           # 连接失败或5xx时的最大重试次数
+    "backoff_factor": 1.0,      # 指数退避基数：1s, 2s, 4s...
+    "max_backoff": 60,          # 单次退避（含服务端Retry-After）的最长等待（秒）
+    "pool_maxsize": 8,          # 连接池中保持的连接数
+    # 本地OCR结果缓存（按图片内容SHA-256），重复上传同一试卷时不再请求OCR服务
+    "cache_enabled": True,
+    "cache_db_path": "ocr_cache.db",
+    "cache_ttl_seconds": 30 * 24 * 3600,
+    "cache_max_entries": 2000,
+    "cache_max_bytes": 500 * 1024 * 1024
+}
+
+# SQLite连接配置（连接池中每个连接创建时执行一次）
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",       # 读写并发：读不再阻塞于写
+    "synchronous": "NORMAL",     # WAL模式下兼顾安全与性能
+    "mmap_size": 268435456,      # 256MB内存映射
+    "cache_size": -65536,        # 64MB页缓存（负数表示KB）
+    "busy_timeout": 5000,        # 写锁等待时间（毫秒）
+    "temp_store": "MEMORY"
+}
+
+# SQLite连接池配置（连接按线程持有，线程结束后归还）
+SQLITE_POOL_CONFIG = {
+    "max_connections": 64,       # 同时被线程持有的最大连接数
+    "max_idle": 16,              # 线程结束后保留复用的空闲连接数，超出的直接关闭
+    "acquire_timeout": 30        # 连接数达到上限时的最长等待时间（秒）
+}
+
+# 搜索配置
+SEARCH_CONFIG = {
+    # 关键词命中过多时，只在最新的N条命中里按BM25排序，避免对全部命中打分
+    "rank_window": 5000,
+    "default_limit": 20,   # 每页默认数量
+    "max_limit": 100,      # 每页数量的服务端上限
+    "count_cap": 10000     # 总数统计上限，超过时返回估计值
+}
+
+# 大模型响应缓存配置（相同题目重复打标时直接返回缓存结果）
+LLM_CACHE_CONFIG = {
+    "enabled": True,
+    "db_path": "llm_cache.db",
+    "ttl_seconds": 30 * 24 * 3600,       # 缓存有效期
+    "max_entries": 20000,                # 最大缓存条数
+    "max_bytes": 200 * 1024 * 1024,      # 缓存响应最大总字节数
+    "evict_interval": 100                # 每写入多少条响应执行一次过期清理和容量淘汰
+}
+
+# 大模型并发配置
+LLM_CONCURRENCY_CONFIG = {
+    "max_workers": 8,             # 同时进行的大模型请求数上限
+    "requests_per_minute": 60,    # 每个服务商每分钟请求数上限（0为不限制）
+    "max_batch_size": 50          # 批量打标单次最多题目数
+}
+
+# 后台任务队列配置（OCR解析等耗时任务）
+JOB_QUEUE_CONFIG = {
+    "max_workers": 2,             # 后台工作线程数
+    "poll_interval": 1.0,         # 空闲时轮询新任务的间隔（秒）
+    "lease_seconds": 120,         # 任务租约时长，进程退出后租约过期的任务会被重新领取
+    "max_attempts": 3,            # 单个任务最多尝试次数
+    "retry_delay": 10,            # 失败重试的基础延迟（秒），按尝试次数递增
+    "retention_days": 7           # 已结束任务的保留天数
+}
+
+# 标签使用计数配置（计数先在内存中合并，后台定期批量写入）
+TAG_USAGE_CONFIG = {
+    "flush_interval": 5.0,        # 写入数据库的间隔（秒）
+    "flush_threshold": 200,       # 累计的计数增量达到该值时提前写入
+    "vocabulary_ttl": 30          # 内存中标签列表的最长有效期（秒），兜底其它进程对标签表的修改
+}
+
+# 上传文件存储配置
+BLOB_STORE_CONFIG = {
+    # 没有题目引用的文件（上传后未保存题目、题目已删除）保留多久后回收
+    "orphan_grace_seconds": 7 * 24 * 3600
+}
+
+# 图片衍生图配置（缩略图/网页优化图，需要Pillow）
+IMAGE_DERIVATIVE_CONFIG = {
+    "variants": {
+        "thumb": {"max_size": 320, "quality": 75},    # 列表中的缩略图
+        "web": {"max_size": 1280, "quality": 82}      # 详情中的网页优化图
+    },
+    "immutable_max_age": 365 * 24 * 3600,   # 内容寻址文件及其衍生图的浏览器缓存时间
+    "max_age": 24 * 3600,                   # 旧路径文件的浏览器缓存时间（之后按ETag条件请求）
+    "fallback_max_age": 300                 # 衍生图生成失败、退回原图时的缓存时间（之后重新尝试生成）
+}
+
+# PDF导出配置
+PDF_EXPORT_CONFIG = {
+    # 默认排版引擎：latex（xelatex编译，排版质量高）或 reportlab（进程内直接生成，无需TeX环境，速度快）
+    "default_engine": "latex",
+    "compile_timeout": 60,            # 单次xelatex编译超时（秒）
+    # 把固定的导言区（ctex等宏包）预编译为格式文件，需要mylatexformat宏包；不可用时自动退回普通编译
+    "use_preamble_format": True,
+    # reportlab引擎的公式渲染（需要matplotlib，否则公式以近似文本显示）
+    "formula_cache_size": 4096,       # 内存中缓存的已渲染公式数
+    "formula_dpi": 300                # 公式图片分辨率
+}
+
+# Word导出配置
+DOCX_EXPORT_CONFIG = {
+    "omml_cache_size": 4096           # 内存中缓存的公式转换结果数（LaTeX -> Word公式）
+}
+
+# 导出服务配置（Word/PDF在独立进程中生成）
+EXPORT_SERVICE_CONFIG = {
+    "max_workers": 2,               # 同时生成的导出数（工作进程数）
+    "max_pending": 20,              # 排队与进行中的导出总数上限，超出时返回503
+    "result_ttl_seconds": 3600,     # 导出完成后可下载的时间（秒）
+    "retry_after": 5                # 导出繁忙时建议客户端重试的间隔（秒）
+}
+
+# 导出临时区配置（导出结果、PDF缓存、公式图片和编译中间文件，与上传图片分开存放）
+EXPORT_SCRATCH_CONFIG = {
+    "root": "export_scratch",             # 临时区根目录
+    "max_bytes": 1024 * 1024 * 1024,      # 总大小上限，超出时按最久未使用淘汰
+    "max_age_seconds": 7 * 24 * 3600,     # 超过该时间未使用的文件被删除（应长于导出结果的下载有效期）
+    "build_max_age_seconds": 3600,        # 编译中间文件的保留时间（应长于单次编译超时）
+    "sweep_interval": 600                 # 后台清理间隔（秒）
+}
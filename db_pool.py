@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite连接池模块 - 按线程复用长连接
+"""
+
+import os
+import sqlite3
+import threading
+import weakref
+from typing import Dict, List
+from config import SQLITE_PRAGMAS, SQLITE_POOL_CONFIG
+
+
+class _ConnectionHolder:
+    """线程本地存储中的连接持有者，线程结束时随线程本地数据释放"""
+
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+class ConnectionPool:
+    """按线程复用的SQLite连接池
+
+    每个线程持有一条长连接，连接创建时统一设置WAL等PRAGMA，
+    之后的每次数据库操作直接复用，不再重复connect/close。
+    线程结束时连接归还到空闲队列供新线程复用（超出空闲上限则关闭），
+    同时被线程持有的连接数不超过 max_connections，超出时等待其他线程结束。
+    """
+
+    def __init__(self, db_path: str, pragmas: Dict = None, max_connections: int = None,
+                 max_idle: int = None, acquire_timeout: float = None):
+        """
+        初始化连接池
+
+        Args:
+            db_path: 数据库文件路径
+            pragmas: 连接创建时执行的PRAGMA配置
+            max_connections: 同时被线程持有的最大连接数
+            max_idle: 空闲队列中保留的最大连接数
+            acquire_timeout: 连接数达到上限时的最长等待时间（秒）
+        """
+        self.db_path = db_path
+        self.pragmas = pragmas if pragmas is not None else SQLITE_PRAGMAS
+        self.max_connections = max_connections or SQLITE_POOL_CONFIG["max_connections"]
+        self.max_idle = max_idle if max_idle is not None else SQLITE_POOL_CONFIG["max_idle"]
+        self.acquire_timeout = acquire_timeout or SQLITE_POOL_CONFIG["acquire_timeout"]
+        self._lock = threading.Lock()
+        self._init_state()
+
+    def _init_state(self):
+        """初始化（或在fork/close_all后重置）连接池状态"""
+        # 先切换代数，旧线程本地数据释放时触发的归还直接忽略
+        self._generation = getattr(self, '_generation', 0) + 1
+        self._pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._idle: List[sqlite3.Connection] = []
+        # 只弱引用持有者，线程结束后持有者被回收，不会因这里的引用而泄漏连接
+        self._holders = weakref.WeakSet()
+        self._local = threading.local()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        获取当前线程的数据库连接，不存在时从空闲队列取出或新建
+
+        Returns:
+            当前线程专用的数据库连接
+
+        Raises:
+            sqlite3.OperationalError: 等待超时仍没有可用连接
+        """
+        # 多进程部署时fork出的子进程不能沿用父进程的连接
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = self._checkout()
+            self._local.holder = holder
+        return holder.conn
+
+    def _checkout(self) -> _ConnectionHolder:
+        """为当前线程分配连接，并在线程结束时自动归还"""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise sqlite3.OperationalError(f"数据库连接数已达上限({self.max_connections})，等待超时")
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._create_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+        holder = _ConnectionHolder(conn)
+        with self._lock:
+            self._holders.add(holder)
+        weakref.finalize(holder, self._release, conn, self._generation)
+        return holder
+
+    def _release(self, conn: sqlite3.Connection, generation: int):
+        """线程结束后归还连接：放回空闲队列或关闭"""
+        if generation != self._generation or self._pid != os.getpid():
+            # 连接池已被close_all/fork重置，连接已关闭或不属于本进程
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn = None
+        with self._lock:
+            keep = conn is not None and generation == self._generation and len(self._idle) < self.max_idle
+            if keep:
+                self._idle.append(conn)
+        if conn is not None and not keep:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._slots.release()
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """创建新连接并应用PRAGMA配置"""
+        # 连接只在所属线程内使用，关闭checks以便close_all可以在任意线程回收连接
+        conn = sqlite3.connect(self.db_path, timeout=self.pragmas.get('busy_timeout', 5000) / 1000,
+                               check_same_thread=False)
+        cursor = conn.cursor()
+        for name in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout', 'temp_store'):
+            if name in self.pragmas:
+                cursor.execute(f"PRAGMA {name} = {self.pragmas[name]}")
+        cursor.close()
+        return conn
+
+    def _reset_after_fork(self):
+        """fork后丢弃继承自父进程的连接"""
+        self._lock = threading.Lock()
+        self._init_state()
+
+    def close_all(self):
+        """关闭连接池中的全部连接（包括仍被线程持有的连接）"""
+        with self._lock:
+            connections = self._idle + [holder.conn for holder in list(self._holders)]
+            # 旧的线程本地数据在锁外释放，避免归还回调在持锁时重入
+            old_local = self._local
+            self._init_state()
+        del old_local
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """
+    获取指定数据库的全局连接池，多个管理器共享同一个池
+
+    Args:
+        db_path: 数据库文件路径
+
+    Returns:
+        连接池实例
+    """
+    key = os.path.abspath(db_path) if db_path != ':memory:' else db_path
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(db_path)
+                _pools[key] = pool
+    return pool
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """
+    获取指定数据库在当前线程上的连接
+
+    Args:
+        db_path: 数据库文件路径
+
+    Returns:
+        数据库连接
+    """
+    return get_pool(db_path).get_connection()
+
+
+def close_all_pools():
+    """关闭所有连接池"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+试卷切分模块 - 在本地把OCR得到的markdown切分为逐题文本块
+"""
+
+import re
+from typing import Dict, List
+
+# 图片引用，如 ![](images/0.jpg)
+IMAGE_REF_RE = re.compile(r'!\[[^\]]*\]\(\s*([^)\s]+)\s*\)')
+
+# 行首的markdown修饰（标题、加粗、列表符号）
+_LINE_PREFIX = r'^\s*(?:#{1,6}\s*)?(?:[-*]\s+)?(?:\*\*|__)?\s*'
+
+# 大题分节，如 "一、选择题"
+_SECTION_RE = re.compile(_LINE_PREFIX + r'[一二三四五六七八九十]{1,3}\s*[、\.．]')
+
+# 题号，如 "1."、"1．"、"1、"（排除 "1.5" 这样的小数）
+_ARABIC_RE = re.compile(_LINE_PREFIX + r'(\d{1,3})\s*(?:\*\*|__)?\s*(?:[\.．、](?!\d))')
+
+# 括号题号，如 "（1）"、"(1)"；通常是小问，只在没有阿拉伯数字题号时作为题号
+_PAREN_RE = re.compile(_LINE_PREFIX + r'[（(]\s*(\d{1,3})\s*[）)]')
+
+
+def segment_exam_markdown(markdown: str) -> List[Dict]:
+    """
+    按题号把试卷markdown切分为题目块
+
+    每个形如题号的行都作为题目起点，不要求题号连续（OCR漏识别、各大题重新编号、
+    跳号的试卷都不会丢题）。试卷分大题且第一个大题后的题号从头编起时，
+    第一个大题标题之前的编号行视为卷首注意事项，不作为题目；第一道题之前的内容会被丢弃。
+
+    Args:
+        markdown: OCR识别的markdown内容
+
+    Returns:
+        题目块列表，每项包含 number（题号）、section（所属大题标题）、
+        text（题目原文）和 images（引用的图片文件名），识别出的题目少于两道时返回空列表
+    """
+    if not markdown:
+        return []
+
+    lines = markdown.splitlines()
+    blocks = _split_by_pattern(lines, _ARABIC_RE)
+    if len(blocks) < 2:
+        blocks = _split_by_pattern(lines, _PAREN_RE)
+    return blocks if len(blocks) >= 2 else []
+
+
+def _question_starts(lines: List[str], number_re) -> Dict[int, int]:
+    """
+    找出作为题目起点的题号行
+
+    Returns:
+        {行号: 题号}
+    """
+    starts: Dict[int, int] = {}
+    first_section = None
+    for index, line in enumerate(lines):
+        if _SECTION_RE.match(line):
+            if first_section is None:
+                first_section = index
+            continue
+        match = number_re.match(line)
+        if match:
+            starts[index] = int(match.group(1))
+
+    # 卷首注意事项：位于第一个大题标题之前，且大题中的题号又从不大于它们的编号开始
+    if first_section is not None:
+        before = [number for index, number in starts.items() if index < first_section]
+        after = [number for index, number in starts.items() if index > first_section]
+        if before and after and after[0] <= max(before):
+            starts = {index: number for index, number in starts.items() if index > first_section}
+    return starts
+
+
+def _split_by_pattern(lines: List[str], number_re) -> List[Dict]:
+    """按给定的题号模式切分，返回题目块列表"""
+    starts = _question_starts(lines, number_re)
+    blocks: List[Dict] = []
+    current = None
+    section = ''
+
+    for index, line in enumerate(lines):
+        if index in starts:
+            if current is not None:
+                blocks.append(_finish_block(current))
+            current = {'number': starts[index], 'section': section, 'lines': [line]}
+            continue
+
+        if _SECTION_RE.match(line):
+            section = line.strip().strip('#*_ ').strip()
+            if current is not None:
+                blocks.append(_finish_block(current))
+                current = None
+            continue
+
+        if current is not None:
+            current['lines'].append(line)
+
+    if current is not None:
+        blocks.append(_finish_block(current))
+    return blocks
+
+
+def _finish_block(block: Dict) -> Dict:
+    """整理题目块文本并提取其中的图片引用"""
+    text = '\n'.join(block['lines']).strip()
+    images = list(dict.fromkeys(IMAGE_REF_RE.findall(text)))
+    return {
+        'number': block['number'],
+        'section': block['section'],
+        'text': text,
+        'images': images
+    }
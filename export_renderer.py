@@ -3,35 +3,65 @@
 导出渲染器 - 专业试卷导出功能
 """
 
+import hashlib
+import json
 import os
+import subprocess
+import threading
+import time
 import uuid
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_TABLE_ALIGNMENT
-from docx.oxml.shared import OxmlElement, qn
-from docx.oxml.ns import nsdecls
 from docx.oxml import parse_xml
 import re
-try:
-    from latex2mathml.converter import convert as latex_to_mathml
-    LATEX2MATHML_AVAILABLE = True
-except ImportError:
-    LATEX2MATHML_AVAILABLE = False
+from config import PDF_EXPORT_CONFIG
+from blob_store import BlobStore
+from logger import get_logger
+from omml_converter import latex_to_omml
+from reportlab_renderer import ReportlabRenderer, REPORTLAB_AVAILABLE
+from scratch_manager import ScratchManager, BUILD_DIR
+
+# PDF排版引擎
+PDF_ENGINES = ('latex', 'reportlab')
+
+# 数学公式：$$...$$、\[...\]、$...$、\(...\)
+_MATH_RE = re.compile(r'\$\$(.+?)\$\$|\\\[(.+?)\\\]|\$(.+?)\$|\\\((.+?)\\\)', re.S)
+
+# 固定的导言区：与试卷内容无关，可预编译为格式文件
+LATEX_PREAMBLE = """\\documentclass[12pt,a4paper]{article}
+\\usepackage[UTF8]{ctex}
+\\usepackage{amsmath}
+\\usepackage{amssymb}
+\\usepackage{geometry}
+\\usepackage{graphicx}
+\\usepackage{enumerate}
+\\geometry{left=2.5cm,right=2.5cm,top=2.5cm,bottom=2.5cm}
+"""
 
 class ExportRenderer:
     """导出渲染器类"""
     
-    def __init__(self, upload_folder: str = "uploads"):
+    def __init__(self, upload_folder: str = "uploads", scratch: ScratchManager = None):
         """
         初始化导出渲染器
         
         Args:
-            upload_folder: 上传文件夹路径
+            upload_folder: 上传文件夹路径（读取题目图片）
+            scratch: 导出临时区，生成的文件都写在其中，默认按配置创建
         """
         self.upload_folder = upload_folder
+        self.logger = get_logger()
+        self.scratch = scratch or ScratchManager()
+        self.docx_dir = self.scratch.path('docx')
+        self.pdf_cache_dir = self.scratch.path('pdf')
+        self.build_dir = self.scratch.path(BUILD_DIR)
+        self._format_lock = threading.Lock()
+        self._format_failed = False
+        self.reportlab_renderer = ReportlabRenderer(upload_folder, self.scratch.path('formulas'))
     
     def render_latex(self, questions: List[Dict], mode: str, title: str) -> str:
         """
@@ -48,15 +78,8 @@ class ExportRenderer:
         # 获取当前日期
         current_date = datetime.now().strftime("%Y年%m月%d日")
         
-        content = f"""\\documentclass[12pt,a4paper]{{article}}
-\\usepackage[UTF8]{{ctex}}
-\\usepackage{{amsmath}}
-\\usepackage{{amssymb}}
-\\usepackage{{geometry}}
-\\usepackage{{graphicx}}
-\\usepackage{{enumerate}}
-\\usepackage{{itemize}}
-\\geometry{{left=2.5cm,right=2.5cm,top=2.5cm,bottom=2.5cm}}
+        # 使用预编译格式时，格式文件只包含 endofdump 之前的导言区；普通编译时该命令展开为空
+        content = LATEX_PREAMBLE + f"""\\csname endofdump\\endcsname
 
 \\title{{{title}}}
 \\author{{}}
@@ -82,9 +105,10 @@ class ExportRenderer:
             # 处理图片
             images = question.get('image', [])
             for img_path in images:
-                if img_path and os.path.exists(img_path.replace('/uploads/', self.upload_folder + '/')):
+                local_path = self._local_image_path(img_path)
+                if local_path:
                     content += f"\\begin{{center}}\n"
-                    content += f"\\includegraphics[width=0.8\\textwidth]{{{img_path}}}\n"
+                    content += f"\\includegraphics[width=0.8\\textwidth]{{{local_path}}}\n"
                     content += f"\\end{{center}}\n\n"
             
             # 如果包含答案模式，添加参考解答
@@ -142,9 +166,8 @@ class ExportRenderer:
             # 题目内容
             latex_content = question.get('latex_content', '')
             if latex_content:
-                # 将LaTeX转换为可读文本
-                readable_content = self._latex_to_readable(latex_content)
-                doc.add_paragraph(readable_content)
+                # 文字转换为可读文本，公式转换为Word公式
+                self._add_rich_content(doc, latex_content)
             
             # 处理图片
             images = question.get('image', [])
@@ -159,9 +182,7 @@ class ExportRenderer:
             # 如果包含答案模式，添加参考解答
             if mode == 'with-answers' and question.get('reference_answer'):
                 answer_heading = doc.add_heading('参考解答', level=2)
-                answer_content = question['reference_answer']
-                readable_answer = self._latex_to_readable(answer_content)
-                doc.add_paragraph(readable_answer)
+                self._add_rich_content(doc, question['reference_answer'])
             
             # 添加分隔
             if i < len(questions):
@@ -172,68 +193,218 @@ class ExportRenderer:
         
         # 保存文件
         filename = f'paper_{uuid.uuid4().hex[:8]}.docx'
-        file_path = os.path.join(self.upload_folder, filename)
+        file_path = os.path.join(self.docx_dir, filename)
         doc.save(file_path)
         
         return file_path
     
-    def render_pdf(self, questions: List[Dict], mode: str, title: str) -> str:
+    def render_pdf(self, questions: List[Dict], mode: str, title: str, engine: str = None) -> str:
         """
-        生成PDF格式试卷（通过LaTeX编译）
+        生成PDF格式试卷
+        
+        结果按“排版引擎 + 题目内容 + 导出模式 + 标题 + 引用图片内容”的哈希缓存，重复导出同一试卷直接返回缓存。
+        缓存键不含日期，试卷上的日期在生成PDF时写入，命中缓存时沿用首次生成的日期。
+        latex引擎通过xelatex编译，未命中时优先使用预编译的导言区格式文件，省去每次加载ctex和字体的时间；
+        reportlab引擎在进程内直接排版，不需要TeX环境。
         
         Args:
             questions: 题目列表
             mode: 导出模式 (questions/with-answers)
             title: 试卷标题
+            engine: 排版引擎 (latex/reportlab)，默认取配置
             
         Returns:
-            文件路径
+            文件路径（latex引擎编译失败时为LaTeX文件路径）
         """
-        # 首先生成LaTeX内容
-        latex_content = self.render_latex(questions, mode, title)
+        engine = engine or PDF_EXPORT_CONFIG["default_engine"]
+        if engine not in PDF_ENGINES:
+            raise ValueError(f"不支持的PDF排版引擎: {engine}")
+        if engine == 'reportlab' and not REPORTLAB_AVAILABLE:
+            self.logger.log_warning("reportlab不可用，改用LaTeX编译", "PDF导出")
+            engine = 'latex'
+        
+        cache_key = self._pdf_cache_key(questions, mode, title)
+        suffix = '.pdf' if engine == 'latex' else f'.{engine}.pdf'
+        cached_path = os.path.join(self.pdf_cache_dir, f'{cache_key}{suffix}')
+        try:
+            # 更新访问时间，供临时区按最久未使用淘汰
+            os.utime(cached_path)
+            return cached_path
+        except FileNotFoundError:
+            pass
+        
+        if engine == 'reportlab':
+            return self._render_pdf_reportlab(questions, mode, title, cached_path)
         
-        # 保存LaTeX文件
-        tex_filename = f'paper_{uuid.uuid4().hex[:8]}.tex'
-        tex_path = os.path.join(self.upload_folder, tex_filename)
+        # 未命中缓存时才生成LaTeX内容（含当天日期）
+        latex_content = self.render_latex(questions, mode, title)
         
+        # 每次编译使用独立的作业名，相同试卷并发导出时互不覆盖
+        jobname = f'paper_{cache_key[:16]}_{uuid.uuid4().hex[:8]}'
+        tex_path = os.path.join(self.build_dir, f'{jobname}.tex')
         with open(tex_path, 'w', encoding='utf-8') as f:
             f.write(latex_content)
         
-        # 尝试编译为PDF
+        start_time = time.time()
+        format_name = self._ensure_preamble_format()
+        success = self._compile(jobname, format_name)
+        if not success and format_name:
+            # 格式文件与当前TeX环境不兼容（如字体无法随格式保存），以后不再使用
+            self.logger.log_warning("使用预编译格式编译失败，改为普通编译", "PDF导出")
+            self._discard_preamble_format(format_name)
+            success = self._compile(jobname)
+        
+        self._cleanup_build_files(jobname, keep_tex=not success)
+        if not success:
+            # 如果编译失败，返回LaTeX文件
+            return tex_path
+        
+        os.replace(os.path.join(self.build_dir, f'{jobname}.pdf'), cached_path)
+        self.logger.log_performance("PDF编译", time.time() - start_time,
+                                    f"预编译格式: {'是' if format_name and not self._format_failed else '否'}")
+        return cached_path
+    
+    def _render_pdf_reportlab(self, questions: List[Dict], mode: str, title: str, cached_path: str) -> str:
+        """用reportlab生成PDF并放入缓存"""
+        start_time = time.time()
+        tmp_path = os.path.join(self.build_dir, f'paper_{uuid.uuid4().hex[:8]}.pdf')
+        try:
+            self.reportlab_renderer.render(questions, mode, title, tmp_path,
+                                           datetime.now().strftime("%Y年%m月%d日"))
+            os.replace(tmp_path, cached_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        self.logger.log_performance("PDF生成(reportlab)", time.time() - start_time, f"题目数: {len(questions)}")
+        return cached_path
+    
+    def _local_image_path(self, img_path: str) -> Optional[str]:
+        """
+        把题目中的图片访问路径转换为本地绝对路径（供LaTeX引用）
+        
+        Returns:
+            本地路径（使用 / 分隔），文件不存在时返回None
+        """
+        if not img_path or not img_path.startswith('/uploads/'):
+            return None
+        local_path = os.path.abspath(os.path.join(self.upload_folder, *img_path[len('/uploads/'):].split('/')))
+        if not os.path.exists(local_path):
+            return None
+        return local_path.replace(os.sep, '/')
+    
+    def _pdf_cache_key(self, questions: List[Dict], mode: str, title: str) -> str:
+        """
+        计算PDF缓存键：导言区、导出模式、标题、题目内容与引用图片内容的哈希
+        
+        不包含导出日期，同一试卷跨天导出仍能命中缓存。
+        内容寻址的图片直接使用路径中的哈希；旧路径的图片按文件内容计算，图片被替换时缓存随之失效。
+        """
+        paper = {
+            'preamble': LATEX_PREAMBLE,
+            'mode': mode,
+            'title': title,
+            'questions': [
+                [question.get('latex_content', ''),
+                 question.get('reference_answer') if mode == 'with-answers' else None,
+                 question.get('image', []) or []]
+                for question in questions
+            ],
+        }
+        hasher = hashlib.sha256(json.dumps(paper, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        for question in questions:
+            for img_path in question.get('image', []) or []:
+                local_path = self._local_image_path(img_path)
+                if not local_path:
+                    continue
+                digest = BlobStore.hash_from_url(img_path)
+                if not digest:
+                    with open(local_path, 'rb') as f:
+                        digest = hashlib.sha256(f.read()).hexdigest()
+                hasher.update(f'\n{img_path}:{digest}'.encode('utf-8'))
+        return hasher.hexdigest()
+    
+    def _compile(self, jobname: str, format_name: str = None) -> bool:
+        """在构建目录中运行xelatex，返回是否生成了PDF"""
+        command = ['xelatex', '-interaction=nonstopmode', '-halt-on-error']
+        if format_name:
+            command.append(f'-fmt={format_name}')
+        command.append(f'{jobname}.tex')
+        
         try:
-            import subprocess
-            pdf_filename = tex_filename.replace('.tex', '.pdf')
-            pdf_path = os.path.join(self.upload_folder, pdf_filename)
+            result = subprocess.run(command, cwd=self.build_dir, capture_output=True, text=True,
+                                    timeout=PDF_EXPORT_CONFIG["compile_timeout"])
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.logger.log_error(e, "PDF编译失败")
+            return False
+        
+        return result.returncode == 0 and os.path.exists(os.path.join(self.build_dir, f'{jobname}.pdf'))
+    
+    def _ensure_preamble_format(self) -> Optional[str]:
+        """
+        获取导言区格式文件，不存在时生成
+        
+        格式文件以导言区内容的哈希命名，修改导言区后自动重新生成。
+        
+        Returns:
+            格式名（不含 .fmt），未启用或生成失败时返回None
+        """
+        if not PDF_EXPORT_CONFIG["use_preamble_format"] or self._format_failed:
+            return None
+        
+        format_name = f"preamble_{hashlib.sha256(LATEX_PREAMBLE.encode('utf-8')).hexdigest()[:12]}"
+        if os.path.exists(os.path.join(self.build_dir, f'{format_name}.fmt')):
+            return format_name
+        
+        with self._format_lock:
+            if self._format_failed:
+                return None
+            if os.path.exists(os.path.join(self.build_dir, f'{format_name}.fmt')):
+                return format_name
             
-            # 使用xelatex编译（支持中文）
-            result = subprocess.run([
-                'xelatex', 
-                '-output-directory', self.upload_folder,
-                '-interaction=nonstopmode',
-                tex_path
-            ], capture_output=True, text=True, timeout=30)
+            source_path = os.path.join(self.build_dir, f'{format_name}.tex')
+            with open(source_path, 'w', encoding='utf-8') as f:
+                f.write(LATEX_PREAMBLE + "\\begin{document}\n\\end{document}\n")
             
-            if result.returncode == 0 and os.path.exists(pdf_path):
-                # 清理临时文件
-                try:
-                    os.remove(tex_path)
-                    # 清理其他LaTeX生成的文件
-                    for ext in ['.aux', '.log', '.out']:
-                        temp_file = tex_path.replace('.tex', ext)
-                        if os.path.exists(temp_file):
-                            os.remove(temp_file)
-                except:
-                    pass
-                
-                return pdf_path
-            else:
-                # 如果编译失败，返回LaTeX文件
-                return tex_path
-                
-        except Exception as e:
-            print(f"PDF编译失败: {e}")
-            # 如果编译失败，返回LaTeX文件
-            return tex_path
+            start_time = time.time()
+            try:
+                # mylatexformat 读取导言区直到 \begin{document}，并把已加载的宏包保存为格式文件
+                result = subprocess.run([
+                    'xelatex', '-ini', '-interaction=nonstopmode', '-halt-on-error',
+                    f'-jobname={format_name}', '&xelatex', 'mylatexformat.ltx', f'{format_name}.tex'
+                ], cwd=self.build_dir, capture_output=True, text=True,
+                    timeout=PDF_EXPORT_CONFIG["compile_timeout"])
+                success = result.returncode == 0
+            except (OSError, subprocess.TimeoutExpired) as e:
+                self.logger.log_error(e, "生成导言区格式文件失败")
+                success = False
+            
+            if not success or not os.path.exists(os.path.join(self.build_dir, f'{format_name}.fmt')):
+                self.logger.log_warning("生成导言区格式文件失败，PDF导出将使用普通编译", "PDF导出")
+                self._format_failed = True
+                return None
+            
+            self.logger.log_performance("生成导言区格式文件", time.time() - start_time)
+            return format_name
+    
+    def _discard_preamble_format(self, format_name: str):
+        """删除不可用的格式文件，并在本进程内停用预编译格式"""
+        self._format_failed = True
+        try:
+            os.remove(os.path.join(self.build_dir, f'{format_name}.fmt'))
+        except FileNotFoundError:
+            pass
+    
+    def _cleanup_build_files(self, jobname: str, keep_tex: bool = False):
+        """清理编译产生的临时文件"""
+        extensions = ['.aux', '.log', '.out'] if keep_tex else ['.tex', '.aux', '.log', '.out']
+        for ext in extensions:
+            temp_file = os.path.join(self.build_dir, f'{jobname}{ext}')
+            try:
+                os.remove(temp_file)
+            except FileNotFoundError:
+                pass
     
     def _clean_latex_content(self, content: str) -> str:
         """
@@ -302,33 +473,74 @@ class ExportRenderer:
         
         return content.strip()
     
-    def _add_mathml_to_paragraph(self, paragraph, latex_math: str):
+    def _add_rich_content(self, doc, content: str):
+        """
+        把含LaTeX公式的文本写入Word文档：行内公式嵌入段落，行间公式单独成段
+        
+        Args:
+            doc: Word文档对象
+            content: 题目或解答内容
+        """
+        paragraph = None
+        position = 0
+        for match in _MATH_RE.finditer(content):
+            paragraph = self._add_plain_text(doc, paragraph, content[position:match.start()])
+            position = match.end()
+            display_math = match.group(1) or match.group(2)
+            if display_math is not None:
+                self._add_math_paragraph(doc, display_math.strip())
+                paragraph = None
+            else:
+                paragraph = paragraph or doc.add_paragraph()
+                self._add_math_to_paragraph(paragraph, (match.group(3) or match.group(4)).strip())
+        self._add_plain_text(doc, paragraph, content[position:])
+    
+    def _add_plain_text(self, doc, paragraph, text: str):
+        """
+        写入公式之间的文字：空行处分段，单个换行转为段内换行
+        
+        Returns:
+            当前段落（尚未创建时为None）
+        """
+        text = re.sub(r'\\begin\{(?:enumerate|itemize)\}(?:\[[^\]]*\])?|\\end\{(?:enumerate|itemize)\}', '\n', text)
+        text = text.replace('\\\\', '\n')
+        text = re.sub(r'\\item\s*', '\n• ', text)
+        text = re.sub(r'\\[a-zA-Z]+\{([^{}]*)\}', r'\1', text)
+        text = re.sub(r'\\[a-zA-Z]+', '', text)
+        text = re.sub(r'[ \t]+', ' ', text)
+        
+        for index, block in enumerate(re.split(r'\n\s*\n', text)):
+            if index > 0:
+                paragraph = None
+            for line_index, line in enumerate(block.split('\n')):
+                if line_index > 0 and paragraph is not None:
+                    paragraph.add_run().add_break()
+                if line.strip():
+                    paragraph = paragraph or doc.add_paragraph()
+                    paragraph.add_run(line)
+        return paragraph
+    
+    def _add_math_to_paragraph(self, paragraph, latex_math: str):
         """
-        将LaTeX数学公式转换为MathML并添加到段落中
+        将LaTeX数学公式转换为Word公式（OMML）并添加到段落中
         
         Args:
             paragraph: Word段落对象
             latex_math: LaTeX数学公式
         """
-        if not LATEX2MATHML_AVAILABLE or not latex_math:
-            return
-        
-        try:
-            # 转换LaTeX为MathML
-            mathml = latex_to_mathml(latex_math)
-            
-            # 创建MathML元素
-            math_element = OxmlElement('m:oMath')
-            math_element.set(qn('xmlns:m'), 'http://schemas.openxmlformats.org/officeDocument/2006/math')
-            
-            # 解析MathML并添加到元素中
-            mathml_xml = parse_xml(f'<math xmlns="http://www.w3.org/1998/Math/MathML">{mathml}</math>')
-            math_element.append(mathml_xml)
-            
-            # 添加到段落
-            paragraph._element.append(math_element)
-            
-        except Exception as e:
-            print(f"MathML转换失败: {e}")
-            # 如果转换失败，添加原始文本
-            paragraph.add_run(latex_math)
+        omml = latex_to_omml(latex_math)
+        if omml:
+            paragraph._p.append(parse_xml(omml))
+        else:
+            # 如果转换失败，添加可读文本
+            paragraph.add_run(self._latex_to_readable(f'${latex_math}$')).italic = True
+    
+    def _add_math_paragraph(self, doc, latex_math: str):
+        """添加单独成段、居中的行间公式"""
+        omml = latex_to_omml(latex_math, display=True)
+        paragraph = doc.add_paragraph()
+        if omml:
+            paragraph._p.append(parse_xml(omml))
+        else:
+            paragraph.add_run(self._latex_to_readable(f'${latex_math}$')).italic = True
+            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+导出服务模块 - 在有界进程池中生成Word/PDF试卷，请求线程只负责提交和查询
+"""
+
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+from config import EXPORT_SERVICE_CONFIG
+from logger import get_logger
+
+# 由导出服务在子进程中生成的格式
+SERVICE_FORMATS = ('docx', 'pdf')
+
+# 子进程内复用的渲染器（每个工作进程启动时创建一次）
+_worker_renderer = None
+
+
+def _init_worker(upload_folder: str):
+    """工作进程初始化：加载渲染器"""
+    global _worker_renderer
+    from export_renderer import ExportRenderer
+    _worker_renderer = ExportRenderer(upload_folder)
+
+
+def _run_export(format_type: str, questions: List[Dict], mode: str, title: str,
+                pdf_engine: Optional[str]) -> str:
+    """
+    在工作进程中生成导出文件
+
+    Returns:
+        生成的文件路径
+    """
+    if format_type == 'docx':
+        return _worker_renderer.render_docx(questions, mode, title)
+    return _worker_renderer.render_pdf(questions, mode, title, engine=pdf_engine)
+
+
+class ExportQueueFull(Exception):
+    """等待中的导出任务已达上限"""
+
+
+class ExportService:
+    """
+    导出任务服务
+
+    同时运行的导出数受进程池大小限制，排队数受 max_pending 限制；
+    内容完全相同的导出在完成前重复提交时合并为同一个任务。
+    任务状态保存在内存中，结果在 result_ttl_seconds 后过期。
+    """
+
+    def __init__(self, upload_folder: str, max_workers: int = None):
+        """
+        初始化导出服务
+
+        Args:
+            upload_folder: 上传根目录（传给工作进程中的渲染器）
+            max_workers: 工作进程数，默认取配置
+        """
+        self.upload_folder = upload_folder
+        self.max_workers = max_workers or EXPORT_SERVICE_CONFIG["max_workers"]
+        self.max_pending = EXPORT_SERVICE_CONFIG["max_pending"]
+        self.result_ttl = EXPORT_SERVICE_CONFIG["result_ttl_seconds"]
+        self.logger = get_logger()
+        self._executor = None
+        self._jobs: Dict[str, Dict] = {}
+        self._inflight: Dict[str, str] = {}  # 导出内容哈希 -> 任务ID
+        self._lock = threading.Lock()
+
+    def submit(self, format_type: str, questions: List[Dict], mode: str, title: str,
+               pdf_engine: str = None, user_id: int = None) -> str:
+        """
+        提交导出任务
+
+        Args:
+            format_type: 导出格式 (docx/pdf)
+            questions: 题目列表
+            mode: 导出模式 (questions/with-answers)
+            title: 试卷标题
+            pdf_engine: PDF排版引擎
+            user_id: 提交任务的用户ID
+
+        Returns:
+            任务ID（与进行中的相同导出合并时为已有任务的ID）
+
+        Raises:
+            ValueError: 不支持的格式
+            ExportQueueFull: 进行中的导出任务已达上限
+        """
+        if format_type not in SERVICE_FORMATS:
+            raise ValueError(f"不支持的导出格式: {format_type}")
+        if format_type != 'pdf':
+            pdf_engine = None
+
+        key = hashlib.sha256(json.dumps([format_type, mode, title, pdf_engine, questions],
+                                        ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+        with self._lock:
+            self._purge_expired()
+
+            job_id = self._inflight.get(key)
+            if job_id:
+                self._jobs[job_id]['user_ids'].add(user_id)
+                return job_id
+
+            if len(self._inflight) >= self.max_pending:
+                raise ExportQueueFull("导出任务过多，请稍后重试")
+
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            job = {
+                'id': job_id,
+                'key': key,
+                'format': format_type,
+                'title': title,
+                'user_ids': {user_id},
+                'status': 'queued',
+                'file_path': None,
+                'error': None,
+                'created_at': now,
+                'finished_at': None
+            }
+            args = (_run_export, format_type, questions, mode, title, pdf_engine)
+            try:
+                job['future'] = self._get_executor().submit(*args)
+            except BrokenProcessPool:
+                # 工作进程异常退出后进程池不可再用，重建后重新提交
+                self.logger.log_warning("导出进程池已损坏，重新创建", "导出服务")
+                self._executor = None
+                job['future'] = self._get_executor().submit(*args)
+            self._jobs[job_id] = job
+            self._inflight[key] = job_id
+
+        job['future'].add_done_callback(lambda future, _job_id=job_id: self._on_done(_job_id, future))
+        return job_id
+
+    def get_job(self, job_id: str, user_id: int = None) -> Optional[Dict]:
+        """
+        查询导出任务
+
+        Args:
+            job_id: 任务ID
+            user_id: 用户ID，指定时只返回该用户提交过的任务
+
+        Returns:
+            任务信息（id/format/title/status/error/file_path），不存在或已过期时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or (user_id is not None and user_id not in job['user_ids']):
+                return None
+
+            status = job['status']
+            if status == 'queued' and job['future'].running():
+                status = 'running'
+            return {
+                'id': job['id'],
+                'format': job['format'],
+                'title': job['title'],
+                'status': status,
+                'error': job['error'],
+                'file_path': job['file_path'],
+                'created_at': job['created_at']
+            }
+
+    def shutdown(self):
+        """关闭进程池（不等待进行中的导出）"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        按需创建进程池
+
+        使用spawn启动工作进程：创建进程池时父进程已运行任务队列、标签计数、临时区清理等后台线程，
+        fork出的子进程可能继承被这些线程持有的锁而死锁。spawn会在子进程中重新导入Web入口模块，
+        入口中的后台线程和启动时回收按进程名判断，在子进程中不会运行（重新导入时 parent_process() 尚未设置）。
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker, initargs=(self.upload_folder,))
+            self.logger.log_system_info(f"导出进程池已启动，工作进程数: {self.max_workers}")
+        return self._executor
+
+    def _on_done(self, job_id: str, future):
+        """记录导出结果，并解除内容合并"""
+        try:
+            file_path, error = future.result(), None
+        except Exception as e:
+            file_path, error = None, str(e) or e.__class__.__name__
+            self.logger.log_error(e, f"导出任务失败 - 任务ID: {job_id}")
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            job['status'] = 'failed' if error else 'succeeded'
+            job['file_path'] = file_path
+            job['error'] = error
+            job['finished_at'] = time.time()
+            job['future'] = None
+            self._inflight.pop(job['key'], None)
+
+        if not error:
+            self.logger.log_performance(f"导出{job['format']}", job['finished_at'] - job['created_at'],
+                                        f"任务ID: {job_id}")
+
+    def _purge_expired(self):
+        """删除结果已过期的任务记录（调用方持有锁）"""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished_at'] is not None and job['finished_at'] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
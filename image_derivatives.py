@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+图片衍生图模块 - 缩略图与网页优化图的生成和缓存
+"""
+
+import hashlib
+import os
+import uuid
+from typing import Optional, Tuple
+from config import IMAGE_DERIVATIVE_CONFIG
+from blob_store import BlobStore
+from logger import get_logger
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+class ImageDerivatives:
+    """
+    按需生成并缓存图片的缩小版本
+
+    衍生图保存在 uploads/derived/<规格>/ 下并按来源文件分片；来源为内容寻址文件时以其哈希命名，
+    旧路径的文件以“路径 + 修改时间”的哈希命名。生成时顺带记录原图尺寸。
+    """
+
+    def __init__(self, upload_folder: str, blob_store: BlobStore):
+        """
+        初始化衍生图服务
+
+        Args:
+            upload_folder: 上传根目录
+            blob_store: 上传文件存储（记录图片尺寸）
+        """
+        self.upload_folder = upload_folder
+        self.blob_store = blob_store
+        self.variants = IMAGE_DERIVATIVE_CONFIG["variants"]
+        self.logger = get_logger()
+
+    def derive(self, source_path: str, filename: str, variant: str) -> Optional[str]:
+        """
+        获取图片指定规格的衍生图，不存在时生成
+
+        Args:
+            source_path: 原图的本地路径
+            filename: 原图相对于上传根目录的路径
+            variant: 规格名（见 IMAGE_DERIVATIVE_CONFIG）
+
+        Returns:
+            衍生图相对于上传根目录的路径；Pillow不可用或原图无法解码时返回None（应返回原图）
+
+        Raises:
+            ValueError: 未知的规格名
+        """
+        if variant not in self.variants:
+            raise ValueError(f"未知的图片规格: {variant}")
+        if not PIL_AVAILABLE:
+            return None
+
+        blob_hash = BlobStore.hash_from_url(f"/uploads/{filename}")
+        if blob_hash:
+            key = blob_hash
+        else:
+            mtime = os.stat(source_path).st_mtime_ns
+            key = hashlib.sha256(f"{filename}|{mtime}".encode('utf-8')).hexdigest()
+
+        relative_path = f"derived/{variant}/{key[:2]}/{key[2:4]}/{key}.jpg"
+        derived_path = os.path.join(self.upload_folder, *relative_path.split('/'))
+        if os.path.exists(derived_path):
+            return relative_path
+
+        try:
+            size = self._render(source_path, derived_path, self.variants[variant])
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            self.logger.log_warning(f"生成{variant}衍生图失败: {filename}, {e}", "图片衍生图")
+            return None
+
+        if blob_hash:
+            self.blob_store.set_dimensions(blob_hash, *size)
+        return relative_path
+
+    def prepare(self, blob: dict) -> Optional[Tuple[int, int]]:
+        """
+        上传时预先生成缩略图并记录图片尺寸
+
+        Args:
+            blob: BlobStore.put_* 的返回值
+
+        Returns:
+            (宽, 高)，无法处理时返回None
+        """
+        filename = blob['url'][len('/uploads/'):]
+        source_path = os.path.join(self.upload_folder, *filename.split('/'))
+        if self.derive(source_path, filename, 'thumb') is None:
+            return None
+        return self.blob_store.get_dimensions(blob['hash'])
+
+    def remove(self, blob_hash: str):
+        """删除内容寻址文件的全部衍生图（原文件被回收时调用）"""
+        for variant in self.variants:
+            path = os.path.join(self.upload_folder, 'derived', variant, blob_hash[:2], blob_hash[2:4],
+                                f"{blob_hash}.jpg")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _render(source_path: str, derived_path: str, spec: dict) -> Tuple[int, int]:
+        """
+        缩放并编码为渐进式JPEG，先写临时文件再原子替换
+
+        Returns:
+            原图尺寸 (宽, 高)
+        """
+        with Image.open(source_path) as image:
+            image = ImageOps.exif_transpose(image)
+            original_size = image.size
+
+            # 透明背景铺白，避免转为JPEG后变黑
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            image.thumbnail((spec["max_size"], spec["max_size"]), Image.LANCZOS)
+
+            os.makedirs(os.path.dirname(derived_path), exist_ok=True)
+            tmp_path = f"{derived_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                image.save(tmp_path, 'JPEG', quality=spec["quality"], optimize=True, progressive=True)
+                os.replace(tmp_path, derived_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        return original_size
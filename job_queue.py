@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+后台任务队列模块 - 基于SQLite的持久化任务表与工作线程池
+
+任务由若干有序阶段组成，每个阶段完成后把输出写回任务状态；
+服务重启后，未完成的任务从最后一个已完成阶段之后继续执行。
+"""
+
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+from config import SYSTEM_DATABASE_PATH, JOB_QUEUE_CONFIG
+from db_pool import get_connection
+from logger import get_logger
+
+# 阶段函数：接收任务状态和进度回调 report(阶段内进度0~1, 部分结果)，返回要合并进任务状态的输出
+StageFunc = Callable[[Dict, Callable], Dict]
+
+_JOB_FIELDS = ['id', 'kind', 'user_id', 'status', 'stage', 'progress', 'result', 'error',
+               'attempts', 'created_at', 'updated_at']
+
+
+class JobQueue:
+    """持久化后台任务队列"""
+
+    def __init__(self, db_path: str = SYSTEM_DATABASE_PATH, max_workers: int = None):
+        """
+        初始化任务队列
+
+        Args:
+            db_path: 任务表所在的数据库文件路径
+            max_workers: 工作线程数
+        """
+        self.db_path = db_path
+        self.max_workers = max_workers or JOB_QUEUE_CONFIG["max_workers"]
+        self.poll_interval = JOB_QUEUE_CONFIG["poll_interval"]
+        self.lease_seconds = JOB_QUEUE_CONFIG["lease_seconds"]
+        self.max_attempts = JOB_QUEUE_CONFIG["max_attempts"]
+        self.retry_delay = JOB_QUEUE_CONFIG["retry_delay"]
+        self.logger = get_logger()
+        self._pipelines: Dict[str, List[Tuple[str, StageFunc]]] = {}
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.init_database()
+
+    def init_database(self):
+        """初始化任务表结构"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                user_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'queued', -- queued/running/succeeded/failed
+                stage TEXT,
+                stage_index INTEGER NOT NULL DEFAULT 0, -- 已完成的阶段数
+                progress REAL NOT NULL DEFAULT 0,
+                state TEXT NOT NULL, -- JSON: 任务参数与各阶段输出
+                result TEXT, -- JSON
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_after REAL NOT NULL DEFAULT 0,
+                lease_expires REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)')
+
+        conn.commit()
+        cursor.close()
+
+    def register(self, kind: str, stages: List[Tuple[str, StageFunc]]):
+        """
+        注册任务类型及其阶段
+
+        Args:
+            kind: 任务类型
+            stages: 有序的 (阶段名, 阶段函数) 列表，最后一个阶段的输出作为任务结果
+        """
+        self._pipelines[kind] = list(stages)
+
+    def start(self):
+        """启动工作线程（重复调用无副作用；在子进程中不启动，如以spawn方式创建的导出进程）"""
+        if self._threads or multiprocessing.current_process().name != 'MainProcess':
+            return
+
+        self.purge_finished(JOB_QUEUE_CONFIG["retention_days"] * 24 * 3600)
+        self._stop.clear()
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        self.logger.log_system_info(f"后台任务队列已启动，工作线程数: {self.max_workers}")
+
+    def stop(self, timeout: float = 5.0):
+        """停止工作线程，正在执行的任务在租约过期后会被重新领取"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, kind: str, payload: Dict, user_id: int = None) -> str:
+        """
+        提交任务
+
+        Args:
+            kind: 任务类型（必须已注册）
+            payload: 任务参数，作为初始任务状态
+            user_id: 提交任务的用户ID
+
+        Returns:
+            任务ID
+        """
+        if kind not in self._pipelines:
+            raise ValueError(f"未注册的任务类型: {kind}")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                INSERT INTO jobs (id, kind, user_id, status, state, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', ?, ?, ?)
+            ''', (job_id, kind, user_id, json.dumps(payload, ensure_ascii=False), now, now))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        self._wakeup.set()
+        return job_id
+
+    def get_job(self, job_id: str, user_id: int = None) -> Optional[Dict]:
+        """
+        查询任务状态
+
+        Args:
+            job_id: 任务ID
+            user_id: 用户ID，指定时只返回该用户提交的任务
+
+        Returns:
+            任务信息字典，不存在时返回None
+        """
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            query = f"SELECT {', '.join(_JOB_FIELDS)} FROM jobs WHERE id = ?"
+            params = [job_id]
+            if user_id is not None:
+                query += ' AND user_id = ?'
+                params.append(user_id)
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+
+        if not row:
+            return None
+        job = dict(zip(_JOB_FIELDS, row))
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def purge_finished(self, older_than_seconds: float) -> int:
+        """
+        删除早于指定时间结束的任务
+
+        Returns:
+            删除的任务数
+        """
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?
+            ''', (time.time() - older_than_seconds,))
+            conn.commit()
+            return cursor.rowcount
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _worker_loop(self):
+        """工作线程：领取并执行任务，没有任务时等待提交通知或轮询超时"""
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                self.logger.log_error(e, "领取后台任务失败")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            with self._running_lock:
+                self._running.add(job['id'])
+            try:
+                self._run(job)
+            finally:
+                with self._running_lock:
+                    self._running.discard(job['id'])
+
+    def _claim(self) -> Optional[Dict]:
+        """
+        原子地领取一个可执行的任务：排队中且已到重试时间，或执行中但租约已过期（进程退出遗留）
+
+        租约过期的任务同样计入尝试次数：已用完尝试次数的（如每次都使工作进程崩溃）直接标记为失败，不再领取。
+
+        Returns:
+            任务字典（含 state 和 stage_index），没有可执行任务时返回None
+        """
+        now = time.time()
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            # IMMEDIATE事务先取得写锁，多个线程/进程不会领取到同一任务
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                UPDATE jobs SET status = 'failed', lease_expires = NULL, updated_at = ?,
+                       error = '执行中断次数过多（工作进程异常退出）'
+                WHERE status = 'running' AND lease_expires < ? AND attempts >= ?
+            ''', (now, now, self.max_attempts))
+            if cursor.rowcount:
+                self.logger.log_warning(f"{cursor.rowcount} 个后台任务租约过期且已达最大尝试次数，标记为失败", "后台任务队列")
+            cursor.execute('''
+                SELECT id, kind, state, stage_index, attempts FROM jobs
+                WHERE (status = 'queued' AND run_after <= ?)
+                   OR (status = 'running' AND lease_expires < ? AND attempts < ?)
+                ORDER BY created_at LIMIT 1
+            ''', (now, now, self.max_attempts))
+            row = cursor.fetchone()
+            if not row:
+                conn.commit()
+                return None
+
+            job_id, kind, state, stage_index, attempts = row
+            cursor.execute('''
+                UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                       lease_expires = ?, updated_at = ?
+                WHERE id = ?
+            ''', (now + self.lease_seconds, now, job_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        return {'id': job_id, 'kind': kind, 'state': json.loads(state),
+                'stage_index': stage_index, 'attempts': attempts + 1}
+
+    def _run(self, job: Dict):
+        """从第一个未完成的阶段开始执行任务"""
+        job_id = job['id']
+        stages = self._pipelines.get(job['kind'])
+        if stages is None:
+            self._finish(job_id, 'failed', error=f"未注册的任务类型: {job['kind']}")
+            return
+
+        state = job['state']
+        start_time = time.time()
+        if job['stage_index']:
+            self.logger.log_system_info(f"后台任务 {job_id} 从第 {job['stage_index'] + 1} 个阶段恢复执行")
+
+        try:
+            output = None
+            for index in range(job['stage_index'], len(stages)):
+                name, func = stages[index]
+                self._update(job_id, stage=name, progress=index / len(stages))
+
+                def report(fraction: float, partial: Dict = None, _index=index):
+                    progress = (_index + min(max(fraction, 0.0), 1.0)) / len(stages)
+                    self._update(job_id, progress=progress, result=partial)
+
+                output = func(state, report) or {}
+                state.update(output)
+                self._update(job_id, stage_index=index + 1, progress=(index + 1) / len(stages),
+                             state=state)
+
+            self._finish(job_id, 'succeeded', result=output)
+            self.logger.log_performance(f"后台任务 {job['kind']}", time.time() - start_time, f"任务ID: {job_id}")
+
+        except Exception as e:
+            self.logger.log_error(e, f"后台任务执行失败 - 任务ID: {job_id}, 第 {job['attempts']} 次尝试")
+            if job['attempts'] < self.max_attempts:
+                self._update(job_id, status='queued', error=str(e),
+                             run_after=time.time() + self.retry_delay * job['attempts'])
+            else:
+                self._finish(job_id, 'failed', error=str(e))
+
+    def _heartbeat_loop(self):
+        """定期续约本进程正在执行的任务，长时间运行的阶段不会被其它进程误领取"""
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            with self._running_lock:
+                running = list(self._running)
+            for job_id in running:
+                try:
+                    self._update(job_id, lease_expires=time.time() + self.lease_seconds)
+                except Exception as e:
+                    self.logger.log_error(e, f"后台任务续约失败 - 任务ID: {job_id}")
+
+    def _finish(self, job_id: str, status: str, result: Dict = None, error: str = None):
+        """记录任务最终状态"""
+        fields = {'status': status, 'lease_expires': None, 'error': error}
+        if status == 'succeeded':
+            fields.update(progress=1.0, result=result)
+        self._update(job_id, **fields)
+
+    def _update(self, job_id: str, **fields):
+        """更新任务字段（state/result 自动序列化为JSON）"""
+        for key in ('state', 'result'):
+            if key in fields and fields[key] is not None:
+                fields[key] = json.dumps(fields[key], ensure_ascii=False)
+        if 'result' in fields and fields['result'] is None:
+            del fields['result']
+        fields['updated_at'] = time.time()
+
+        assignments = ', '.join(f'{key} = ?' for key in fields)
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', list(fields.values()) + [job_id])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
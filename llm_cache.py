@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+大模型响应缓存模块 - 按内容哈希持久化缓存LLM响应
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from typing import Iterable, Optional
+from config import LLM_CACHE_CONFIG
+from db_pool import get_connection
+
+
+class LLMResponseCache:
+    """基于SQLite的大模型响应缓存（TTL过期 + LRU淘汰 + 容量上限）"""
+
+    def __init__(self, db_path: str = None, ttl_seconds: int = None,
+                 max_entries: int = None, max_bytes: int = None):
+        """
+        初始化响应缓存
+
+        Args:
+            db_path: 缓存数据库文件路径
+            ttl_seconds: 缓存有效期（秒）
+            max_entries: 最大缓存条数
+            max_bytes: 缓存响应的最大总字节数
+        """
+        self.db_path = db_path or LLM_CACHE_CONFIG["db_path"]
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else LLM_CACHE_CONFIG["ttl_seconds"]
+        self.max_entries = max_entries if max_entries is not None else LLM_CACHE_CONFIG["max_entries"]
+        self.max_bytes = max_bytes if max_bytes is not None else LLM_CACHE_CONFIG["max_bytes"]
+        self.evict_interval = LLM_CACHE_CONFIG["evict_interval"]
+        self._evict_lock = threading.Lock()
+        self._puts_lock = threading.Lock()
+        self._puts_since_evict = 0
+        self.init_database()
+
+    def init_database(self):
+        """初始化缓存表结构"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)')
+
+        conn.commit()
+        cursor.close()
+
+    @staticmethod
+    def make_key(content: str, model: str, prompt_version, vocabulary: Iterable[str] = ()) -> str:
+        """
+        生成缓存键：规范化内容 + 模型 + 提示词模板版本 + 标签词表 的SHA-256
+
+        Args:
+            content: 题目内容
+            model: 模型名称
+            prompt_version: 提示词模板版本
+            vocabulary: 提示词中使用的标签词表（按集合计算，与顺序无关）
+
+        Returns:
+            十六进制哈希字符串
+        """
+        normalized = unicodedata.normalize('NFKC', content or '')
+        normalized = re.sub(r'\s+', ' ', normalized).strip()
+        payload = json.dumps([prompt_version, model, sorted(set(vocabulary)), normalized],
+                             ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """
+        读取缓存的响应，过期条目视为未命中并删除
+
+        Args:
+            cache_key: 缓存键
+
+        Returns:
+            缓存的响应文本，未命中返回None
+        """
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('SELECT response, created_at FROM llm_cache WHERE cache_key = ?', (cache_key,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+
+            now = time.time()
+            if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                cursor.execute('DELETE FROM llm_cache WHERE cache_key = ?', (cache_key,))
+                conn.commit()
+                return None
+
+            cursor.execute('UPDATE llm_cache SET last_access = ? WHERE cache_key = ?', (now, cache_key))
+            conn.commit()
+            return row[0]
+
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def put(self, cache_key: str, response: str):
+        """
+        写入响应；每写入 evict_interval 条执行一次淘汰（统计全表，不在每次写入时执行）
+
+        Args:
+            cache_key: 缓存键
+            response: 响应文本
+        """
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        now = time.time()
+
+        try:
+            cursor.execute('''
+                INSERT OR REPLACE INTO llm_cache (cache_key, response, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (cache_key, response, len(response.encode('utf-8')), now, now))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        with self._puts_lock:
+            self._puts_since_evict += 1
+            due = self._puts_since_evict >= self.evict_interval
+            if due:
+                self._puts_since_evict = 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        删除过期条目，再按LRU淘汰到条数和字节数上限以内
+
+        Returns:
+            删除的条目数
+        """
+        if not self._evict_lock.acquire(blocking=False):
+            return 0
+
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            removed = 0
+            if self.ttl_seconds:
+                cursor.execute('DELETE FROM llm_cache WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+                removed += cursor.rowcount
+
+            cursor.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache')
+            count, total_bytes = cursor.fetchone()
+
+            if self.max_entries and count > self.max_entries:
+                cursor.execute('''
+                    DELETE FROM llm_cache WHERE cache_key IN (
+                        SELECT cache_key FROM llm_cache ORDER BY last_access ASC LIMIT ?
+                    )
+                ''', (count - self.max_entries,))
+                removed += cursor.rowcount
+                cursor.execute('SELECT COALESCE(SUM(size), 0) FROM llm_cache')
+                total_bytes = cursor.fetchone()[0]
+
+            if self.max_bytes and total_bytes > self.max_bytes:
+                cursor.execute('SELECT cache_key, size FROM llm_cache ORDER BY last_access ASC')
+                victims = []
+                for key, size in cursor.fetchall():
+                    if total_bytes <= self.max_bytes:
+                        break
+                    victims.append((key,))
+                    total_bytes -= size
+                cursor.executemany('DELETE FROM llm_cache WHERE cache_key = ?', victims)
+                removed += len(victims)
+
+            conn.commit()
+            return removed
+
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            self._evict_lock.release()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+大模型并发调用模块 - 有界线程池与按服务商的速率限制
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from config import LLM_CONCURRENCY_CONFIG
+
+
+class RateLimiter:
+    """令牌桶速率限制器，限制每分钟发往同一服务商的请求数"""
+
+    def __init__(self, requests_per_minute: int):
+        """
+        初始化速率限制器
+
+        Args:
+            requests_per_minute: 每分钟允许的请求数，0表示不限制
+        """
+        self.requests_per_minute = requests_per_minute
+        self.capacity = max(1, requests_per_minute)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待"""
+        if not self.requests_per_minute:
+            return
+
+        rate = self.requests_per_minute / 60.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / rate
+            time.sleep(wait)
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_executor = None
+_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> RateLimiter:
+    """
+    获取服务商对应的速率限制器（同一服务商在进程内共享）
+
+    Args:
+        provider: 服务商标识，通常为API地址
+
+    Returns:
+        速率限制器
+    """
+    with _lock:
+        limiter = _rate_limiters.get(provider)
+        if limiter is None:
+            limiter = RateLimiter(LLM_CONCURRENCY_CONFIG["requests_per_minute"])
+            _rate_limiters[provider] = limiter
+        return limiter
+
+
+def get_llm_executor() -> ThreadPoolExecutor:
+    """
+    获取进程内共享的大模型调用线程池，并发数由配置限定
+
+    Returns:
+        线程池
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY_CONFIG["max_workers"],
+                                           thread_name_prefix='llm')
+        return _executor
@@ -1,21 +1,117 @@
+import hashlib
+import json
+import mimetypes
+import os
+import time
+import uuid
 import requests
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from config import OCR_CLIENT_CONFIG
+from llm_cache import LLMResponseCache
+
+# 可重试的HTTP状态码（服务端临时错误或过载）
+RETRY_STATUS = {500, 502, 503, 504}
+
+
+class MultipartFileBody:
+    """
+    流式 multipart/form-data 请求体
+
+    按需从磁盘读取文件内容，上传大尺寸扫描件时不会把整个请求体读入内存；
+    实现了 read/seek/tell/__len__，requests 据此设置 Content-Length 并分块发送。
+    """
+
+    def __init__(self, field_name: str, file_path: Path, content_type: str):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._file_path = file_path
+        self._head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{file_path.name}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode('utf-8')
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode('utf-8')
+        self._file_size = file_path.stat().st_size
+        self._file = None
+        self._pos = 0
+
+    def __len__(self):
+        return len(self._head) + self._file_size + len(self._tail)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += len(self)
+        self._pos = max(0, min(offset, len(self)))
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self) - self._pos
+        parts = []
+        while size > 0 and self._pos < len(self):
+            if self._pos < len(self._head):
+                chunk = self._head[self._pos:self._pos + size]
+            elif self._pos < len(self._head) + self._file_size:
+                if self._file is None:
+                    self._file = open(self._file_path, 'rb')
+                self._file.seek(self._pos - len(self._head))
+                chunk = self._file.read(min(size, len(self._head) + self._file_size - self._pos))
+                if not chunk:
+                    raise IOError(f"File changed during upload: {self._file_path}")
+            else:
+                offset = self._pos - len(self._head) - self._file_size
+                chunk = self._tail[offset:offset + size]
+            parts.append(chunk)
+            self._pos += len(chunk)
+            size -= len(chunk)
+        return b''.join(parts)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
 
 class DeepSeekOCRClient:
-    def __init__(self, base_url: str = "http://localhost:5000"):
+    def __init__(self, base_url: str = "http://localhost:5000", config: dict = None):
         """
         初始化 OCR 客户端
         
         :param base_url: OCR 服务的根地址，例如 "http://localhost:5000"
+        :param config: 超时、重试与连接池配置，默认使用 OCR_CLIENT_CONFIG
         """
         self.base_url = base_url.rstrip('/')
         self.ocr_endpoint = f"{self.base_url}/ocr"
+        self.config = {**OCR_CLIENT_CONFIG, **(config or {})}
+        self.timeout = (self.config["connect_timeout"], self.config["read_timeout"])
+
+        # 持久会话：复用到OCR服务的TCP连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.config["pool_maxsize"])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
-    def ocr_image(self, image_path: str) -> dict:
+        # 本地结果缓存复用响应缓存的TTL + LRU淘汰实现，使用单独的数据库文件
+        self.cache = None
+        if self.config["cache_enabled"]:
+            self.cache = LLMResponseCache(db_path=self.config["cache_db_path"],
+                                          ttl_seconds=self.config["cache_ttl_seconds"],
+                                          max_entries=self.config["cache_max_entries"],
+                                          max_bytes=self.config["cache_max_bytes"])
+
+    def ocr_image(self, image_path: str, image_mode: str = "ref") -> dict:
         """
         上传本地图片并获取 OCR 结果（Markdown 格式）
         
         :param image_path: 本地图片路径（支持 PNG/JPG）
+        :param image_mode: "ref" 时图片只返回引用（含 'url'），需用 download_image 下载；
+                           "inline" 时图片以base64内嵌在 'data' 中
         :return: 包含 'request_id', 'markdown' 和 'images' 的字典
         :raises: requests.HTTPError, FileNotFoundError 等
         """
@@ -27,18 +123,120 @@ class DeepSeekOCRClient:
         if image_path.suffix.lower() not in {'.png', '.jpg', '.jpeg'}:
             raise ValueError("Only PNG/JPG images are supported")
 
-        with open(image_path, 'rb') as f:
-            files = {'file': (image_path.name, f, 'image/png')}
-            response = requests.post(self.ocr_endpoint, files=files)
+        # 相同图片内容（及图片返回方式）直接使用本地缓存的结果
+        cache_key = None
+        if self.cache:
+            cache_key = f"{self.base_url}|{image_mode}|{self._file_sha256(image_path)}"
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return json.loads(cached)
 
-        # 抛出 HTTP 错误
-        response.raise_for_status()
+        content_type = mimetypes.guess_type(image_path.name)[0] or 'application/octet-stream'
+        body = MultipartFileBody('file', image_path, content_type)
+        try:
+            # 推理耗时长且不幂等，读超时不重试，只重试连接失败和5xx
+            response = self._request('POST', self.ocr_endpoint, retry_read_timeout=False,
+                                     params={'images': image_mode}, data=body,
+                                     headers={'Content-Type': body.content_type},
+                                     before_attempt=lambda: body.seek(0))
+        finally:
+            body.close()
 
         result = response.json()
+        if cache_key:
+            self.cache.put(cache_key, json.dumps(result, ensure_ascii=False))
         
-        # OCR服务器已经返回base64编码的图片数据，直接返回
+        # 图片为base64数据或下载引用，由调用方保存
         return result
 
+    def iter_image(self, url: str, chunk_size: int = 64 * 1024):
+        """
+        以流式分块读取 OCR 生成的图片，不在内存中保留整张图片
+        
+        :param url: OCR 结果中图片的 'url'（相对于服务根地址）
+        :param chunk_size: 每块的字节数
+        :return: 图片内容分块的迭代器
+        :raises: requests.HTTPError 等
+        """
+        with self._request('GET', f"{self.base_url}{url}", stream=True) as response:
+            yield from response.iter_content(chunk_size=chunk_size)
+
+    def download_image(self, url: str, dest_path: str, chunk_size: int = 64 * 1024) -> int:
+        """
+        以流式分块下载 OCR 生成的图片到本地文件
+        
+        先写入临时文件，下载完整后再原子地替换为目标文件。
+        
+        :param url: OCR 结果中图片的 'url'（相对于服务根地址）
+        :param dest_path: 本地保存路径
+        :param chunk_size: 每次写入的字节数
+        :return: 写入的字节数
+        :raises: requests.HTTPError 等
+        """
+        tmp_path = f"{dest_path}.part"
+        written = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in self.iter_image(url, chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_path, dest_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return written
+
+    @staticmethod
+    def _file_sha256(path: Path) -> str:
+        """分块计算文件内容的SHA-256"""
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def close(self):
+        """关闭会话及其连接池"""
+        self.session.close()
+
+    def _request(self, method: str, url: str, retry_read_timeout: bool = True,
+                 before_attempt=None, **kwargs) -> requests.Response:
+        """
+        发送请求，连接失败、超时或5xx时按指数退避重试
+
+        服务端返回 Retry-After（如OCR队列已满时的503）时按其等待，但不超过 max_backoff。
+
+        :param retry_read_timeout: 读超时是否重试
+        :param before_attempt: 每次发送前调用（用于把请求体重置到开头）
+        :raises: requests.HTTPError, requests.ConnectionError, requests.Timeout
+        """
+        max_retries = self.config["max_retries"]
+        for attempt in range(max_retries + 1):
+            if before_attempt:
+                before_attempt()
+            delay = min(self.config["backoff_factor"] * (2 ** attempt), self.config["max_backoff"])
+
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.ReadTimeout:
+                if not retry_read_timeout or attempt == max_retries:
+                    raise
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == max_retries:
+                    # 抛出 HTTP 错误
+                    response.raise_for_status()
+                    return response
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = min(int(retry_after), self.config["max_backoff"])
+                response.close()
+
+            time.sleep(delay)
+
 
 # ----------------------------
 # 使用示例
@@ -51,4 +249,4 @@ if __name__ == "__main__":
         print("Markdown Result:\n")
         print(result["markdown"])
     except Exception as e:
-        print("Error:", e)
\ No newline at end of file
+        print("Error:", e)
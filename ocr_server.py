@@ -1,7 +1,15 @@
 import os
+import re
+import hashlib
+import shutil
+import math
+import queue
+import threading
+import time
 import uuid
+from concurrent.futures import Future
 from pathlib import Path
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_from_directory, abort
 from transformers import AutoModel, AutoTokenizer
 import torch
 import base64
@@ -12,6 +20,13 @@ import base64
 MODEL_PATH = r'C:\dev\DeepSeek-OCR'
 DEVICE = "cpu"  # 可根据环境改为 "cuda" 或 "mps"
 
+# 推理调度：所有请求进入有界队列，由单个推理线程独占模型顺序处理
+QUEUE_MAX_SIZE = 8          # 排队请求上限，超过时返回503
+MAX_BATCH_SIZE = 4          # 每批最多合并的页数（模型支持批量推理时生效）
+BATCH_WAIT_SECONDS = 0.05   # 凑批时等待后续请求的最长时间
+INFER_KWARGS = dict(base_size=1024, image_size=640, crop_mode=True, test_compress=True, save_results=True)
+PROMPT = "<image>\n<|grounding|>Convert the document to markdown."
+
 # ----------------------------
 # 初始化模型（全局加载一次）
 # ----------------------------
@@ -24,14 +39,153 @@ model = AutoModel.from_pretrained(
     use_safetensors=True
 )
 model = model.eval().to(DEVICE)
+if DEVICE == "cpu":
+    # 同一时间只有推理线程在用模型，把全部CPU核心交给它
+    torch.set_num_threads(os.cpu_count() or 1)
 print("Model loaded.")
 
+
+# ----------------------------
+# 推理调度器
+# ----------------------------
+class InferenceScheduler:
+    """有界请求队列 + 独占模型的推理线程，可选地把排队的多页合并为一批推理"""
+
+    def __init__(self, max_queue_size: int, max_batch_size: int, batch_wait: float):
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait
+        # 模型提供批量接口时才合并推理，否则同一批内逐页推理
+        self.batch_infer = getattr(model, 'infer_batch', None) if max_batch_size > 1 else None
+        self.avg_seconds = 30.0  # 单页推理耗时的滑动平均，用于估算Retry-After
+        self.worker = threading.Thread(target=self._run, name='ocr-inference', daemon=True)
+        self.worker.start()
+
+    def submit(self, image_file: str, output_path: str) -> Future:
+        """
+        提交一页推理请求
+
+        :raises queue.Full: 队列已满
+        """
+        future = Future()
+        self.queue.put_nowait((image_file, output_path, future))
+        return future
+
+    def retry_after(self) -> int:
+        """按当前排队深度和平均推理耗时估算客户端应等待的秒数"""
+        return max(1, math.ceil((self.queue.qsize() + 1) * self.avg_seconds))
+
+    def status(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "avg_inference_seconds": round(self.avg_seconds, 2),
+            "batching": self.batch_infer is not None
+        }
+
+    def _next_batch(self) -> list:
+        """阻塞取出第一项，再在短暂等待内收集后续请求凑成一批"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.monotonic()
+            if self.batch_infer is not None and len(batch) > 1:
+                self._infer_batch(batch)
+            else:
+                for image_file, output_path, future in batch:
+                    self._infer_one(image_file, output_path, future)
+            per_page = (time.monotonic() - start) / len(batch)
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * per_page
+
+    def _infer_one(self, image_file: str, output_path: str, future: Future):
+        try:
+            with torch.inference_mode():
+                # 执行 OCR 推理（会生成 result.mmd）
+                model.infer(
+                    tokenizer=tokenizer,
+                    prompt=PROMPT,
+                    image_file=image_file,
+                    output_path=output_path,
+                    **INFER_KWARGS
+                )
+            future.set_result(True)
+        except Exception as e:
+            future.set_exception(e)
+
+    def _infer_batch(self, batch: list):
+        try:
+            with torch.inference_mode():
+                self.batch_infer(
+                    tokenizer=tokenizer,
+                    prompt=PROMPT,
+                    image_files=[item[0] for item in batch],
+                    output_paths=[item[1] for item in batch],
+                    **INFER_KWARGS
+                )
+            for _, _, future in batch:
+                future.set_result(True)
+        except Exception as e:
+            # 批量失败时逐页重试，避免一页出错拖累同批的其它请求
+            print(f"Batch inference failed, falling back to single pages: {e}")
+            for image_file, output_path, future in batch:
+                self._infer_one(image_file, output_path, future)
+
+
+scheduler = InferenceScheduler(QUEUE_MAX_SIZE, MAX_BATCH_SIZE, BATCH_WAIT_SECONDS)
+
 # ----------------------------
 # Flask App
 # ----------------------------
 app = Flask(__name__)
 RESULT_BASE = Path("results")
 RESULT_BASE.mkdir(exist_ok=True)
+REQUEST_ID_RE = re.compile(r'^[0-9a-fA-F-]{8,64}$')
+# 结果目录以图片内容的SHA-256命名；推理成功后写入该标记，之后相同图片直接复用结果
+COMPLETE_MARKER = ".complete"
+
+# 正在推理中的图片哈希 -> Future，同一图片的并发上传共享一次推理
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _result_images(request_dir: Path) -> list:
+    """按文件名排序列出结果目录中生成的图片，确保顺序一致"""
+    images_dir = request_dir / "images"
+    if not images_dir.exists():
+        return []
+    return sorted(images_dir.glob("*.jpg")) + sorted(images_dir.glob("*.png"))
+
+
+def _image_entries(request_id: str, request_dir: Path, mode: str) -> list:
+    """
+    生成返回给客户端的图片列表
+
+    :param mode: "inline" 把图片以base64内嵌在JSON中；"ref" 只返回引用，由客户端通过
+                 GET /ocr/<request_id>/images/<name> 以二进制流下载
+    """
+    image_data = []
+    for img_file in _result_images(request_dir):
+        entry = {"filename": "images/" + img_file.name}
+        if mode == "ref":
+            entry["url"] = f"/ocr/{request_id}/images/{img_file.name}"
+            entry["size"] = img_file.stat().st_size
+        else:
+            with open(img_file, 'rb') as f:
+                entry["data"] = base64.b64encode(f.read()).decode('utf-8')
+        image_data.append(entry)
+    return image_data
 
 # ✅ 新增：根路径，用于服务状态检查
 @app.route('/', methods=['GET'])
@@ -42,6 +196,11 @@ def home():
     <p>Example: <code>curl -F "file=@image.png" http://localhost:5000/ocr</code></p>
     """, 200
 
+# 推理队列状态
+@app.route('/status', methods=['GET'])
+def status():
+    return jsonify(scheduler.status())
+
 # OCR调试用接口，读取本地已有结果并固定返回a9fad0c3-9303-4326-a230-3be6cf801678下的结果
 @app.route('/ocr/test', methods=['POST'])
 def ocr_test_endpoint():
@@ -51,14 +210,7 @@ def ocr_test_endpoint():
         return jsonify({"error": "Request ID not found"}), 404
     with open(request_dir / "result.mmd", 'r', encoding='utf-8') as f:
         markdown_content = f.read()
-    image_data = []
-    images_dir = request_dir / "images"
-    for img_file in sorted(images_dir.glob("*.jpg")):
-        with open(img_file, 'rb') as f:
-            image_data.append({
-                "filename": "images/" + img_file.name,
-                "data": base64.b64encode(f.read()).decode('utf-8')
-            })
+    image_data = _image_entries(request_id, request_dir, request.args.get('images', 'inline'))
     return jsonify({"request_id": request_id, "markdown": markdown_content, "images": image_data})
 
 # OCR 接口
@@ -74,72 +226,101 @@ def ocr_endpoint():
     if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
         return jsonify({"error": "Only PNG/JPG images are allowed"}), 400
 
-    # 创建唯一请求目录
-    request_id = str(uuid.uuid4())
+    image_mode = request.args.get('images', 'inline')
+
+    # 边保存边计算内容哈希，哈希即请求ID
+    incoming_path = RESULT_BASE / f".upload-{uuid.uuid4().hex}"
+    hasher = hashlib.sha256()
+    with open(incoming_path, 'wb') as out:
+        for chunk in iter(lambda: file.stream.read(1024 * 1024), b''):
+            hasher.update(chunk)
+            out.write(chunk)
+    request_id = hasher.hexdigest()
     request_dir = RESULT_BASE / request_id
-    request_dir.mkdir(parents=True, exist_ok=True)
 
-    # 保存上传的图片
-    input_image_path = request_dir / "input.png"
-    file.save(input_image_path)
+    # 完成标记的检查与推理登记在同一把锁内：推理方先写标记再注销，
+    # 并发的相同请求要么看到标记、要么加入进行中的推理，不会重复推理到同一目录
+    with _inflight_lock:
+        # 相同图片已经识别过：直接返回已有结果（在锁外读取结果）
+        completed = (request_dir / COMPLETE_MARKER).exists()
+        future = _inflight.get(request_id)
+        owner = future is None and not completed
+        if completed:
+            incoming_path.unlink()
+        elif owner:
+            # 队列已满时直接拒绝，告知客户端按排队深度估算的重试时间
+            if scheduler.queue.full():
+                incoming_path.unlink()
+                return _busy_response()
 
-    try:
-        # prompt = "<image>\nFree OCR."
-        prompt = "<image>\n<|grounding|>Convert the document to markdown."
-        output_path = str(request_dir)
-
-        # 执行 OCR 推理（会生成 result.mmd）
-        model.infer(
-            tokenizer=tokenizer,
-            prompt=prompt,
-            image_file=str(input_image_path),
-            output_path=output_path,
-            base_size=1024,
-            image_size=640,
-            crop_mode=True,
-            test_compress=True,
-            save_results=True
-        )
-
-        # 读取 result.mmd
-        mmd_file = request_dir / "result.mmd"
-        if mmd_file.exists():
-            with open(mmd_file, 'r', encoding='utf-8') as f:
-                markdown_content = f.read()
+            request_dir.mkdir(parents=True, exist_ok=True)
+            input_image_path = request_dir / "input.png"
+            os.replace(incoming_path, input_image_path)
+            try:
+                future = scheduler.submit(str(input_image_path), str(request_dir))
+            except queue.Full:
+                shutil.rmtree(request_dir, ignore_errors=True)
+                return _busy_response()
+            _inflight[request_id] = future
         else:
-            markdown_content = ""
-
-        # 查找生成的图片文件并读取内容
-        images_dir = request_dir / "images"
-        image_data = []
-        if images_dir.exists():
-            # 按文件名排序，确保顺序一致
-            for img_file in sorted(images_dir.glob("*.jpg")):
-                with open(img_file, 'rb') as f:
-                    image_data.append({
-                        "filename": "images/" + img_file.name,
-                        "data": base64.b64encode(f.read()).decode('utf-8')
-                    })
-            for img_file in sorted(images_dir.glob("*.png")):
-                with open(img_file, 'rb') as f:
-                    image_data.append({
-                        "filename": "images/" + img_file.name,
-                        "data": base64.b64encode(f.read()).decode('utf-8')
-                    })
-
-        return jsonify({
-            "request_id": request_id,
-            "markdown": markdown_content,
-            "images": image_data
-        })
+            incoming_path.unlink()
+
+    if completed:
+        return _ocr_response(request_id, request_dir, image_mode)
+
+    try:
+        future.result()
+        if owner:
+            (request_dir / COMPLETE_MARKER).touch()
+        return _ocr_response(request_id, request_dir, image_mode)
 
     except Exception as e:
-        import shutil
-        shutil.rmtree(request_dir, ignore_errors=True)
+        if owner:
+            shutil.rmtree(request_dir, ignore_errors=True)
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+    finally:
+        if owner:
+            with _inflight_lock:
+                _inflight.pop(request_id, None)
+
+
+def _ocr_response(request_id: str, request_dir: Path, image_mode: str):
+    """读取结果目录中的 result.mmd 和图片，生成OCR响应"""
+    # 读取 result.mmd
+    mmd_file = request_dir / "result.mmd"
+    if mmd_file.exists():
+        with open(mmd_file, 'r', encoding='utf-8') as f:
+            markdown_content = f.read()
+    else:
+        markdown_content = ""
+
+    # 查找生成的图片文件（内嵌或仅返回引用）
+    image_data = _image_entries(request_id, request_dir, image_mode)
+
+    return jsonify({
+        "request_id": request_id,
+        "markdown": markdown_content,
+        "images": image_data
+    })
+
+
+# 按引用下载OCR生成的图片（二进制流，不经过base64）
+@app.route('/ocr/<request_id>/images/<name>', methods=['GET'])
+def ocr_image_file(request_id, name):
+    if not REQUEST_ID_RE.match(request_id):
+        abort(404)
+    return send_from_directory(RESULT_BASE / request_id / "images", name)
+
+
+def _busy_response():
+    response = jsonify({"error": "OCR service is busy, please retry later", **scheduler.status()})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(scheduler.retry_after())
+    return response
+
 
 if __name__ == '__main__':
     print("Starting DeepSeek-OCR Web Server on http://localhost:5000")
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
\ No newline at end of file
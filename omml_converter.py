@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+公式转换模块 - LaTeX → MathML → Word公式（OMML）
+"""
+
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from typing import List, Optional
+from config import DOCX_EXPORT_CONFIG
+try:
+    from latex2mathml.converter import convert as latex_to_mathml
+    LATEX2MATHML_AVAILABLE = True
+except ImportError:
+    LATEX2MATHML_AVAILABLE = False
+
+OMML_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/math'
+
+ET.register_namespace('m', OMML_NS)
+
+# 重音符号：MathML中 mover 的上标字符 -> Word公式使用的组合字符
+_ACCENTS = {
+    '\u2192': '\u20d7',  # → \vec
+    '^': '\u0302',       # \hat
+    '\u02c6': '\u0302',
+    '~': '\u0303',       # \tilde
+    '\u02dc': '\u0303',
+    '.': '\u0307',       # \dot
+    '\u02d9': '\u0307',
+    '\u00a8': '\u0308',  # \ddot
+}
+
+# 上划线（\overline）
+_BAR_CHARS = {'\u00af', '\u2015', '\u203e', '_', '\u0332'}
+
+# 这些元素只是容器，直接展开子元素
+_TRANSPARENT = {'math', 'mrow', 'mstyle', 'mpadded', 'semantics', 'menclose', 'mtd'}
+
+
+def _m(tag: str) -> str:
+    return f'{{{OMML_NS}}}{tag}'
+
+
+def _local(element) -> str:
+    """去掉命名空间的标签名"""
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _sub(parent, tag: str, **attrs):
+    element = ET.SubElement(parent, _m(tag))
+    for key, value in attrs.items():
+        element.set(_m(key), value)
+    return element
+
+
+def _run(parent, text: str, upright: bool = False):
+    """公式中的文本：变量默认斜体，数字、运算符和文本直立"""
+    run = _sub(parent, 'r')
+    if upright:
+        _sub(_sub(run, 'rPr'), 'sty', val='p')
+    t = _sub(run, 't')
+    t.text = text
+    if text != text.strip():
+        t.set('{http://www.w3.org/XML/1998/namespace}space', 'preserve')
+
+
+def _container(parent, tag: str, children: List):
+    """创建 m:e / m:num 等参数容器并填入转换后的子元素"""
+    element = _sub(parent, tag)
+    for child in children:
+        _convert(child, element)
+    return element
+
+
+def _is_fence(element, form: str) -> bool:
+    return _local(element) == 'mo' and element.get('fence') == 'true' and element.get('form') == form
+
+
+def _convert_row(children: List, parent):
+    """转换一组并列的元素；\\left...\\right 形式的定界符转换为 m:d"""
+    if len(children) >= 2 and _is_fence(children[0], 'prefix'):
+        end_char = ''
+        inner = children[1:]
+        if _is_fence(children[-1], 'postfix'):
+            end_char = children[-1].text or ''
+            inner = children[1:-1]
+        delimiter = _sub(parent, 'd')
+        properties = _sub(delimiter, 'dPr')
+        _sub(properties, 'begChr', val=children[0].text or '')
+        _sub(properties, 'endChr', val=end_char)
+        _container(delimiter, 'e', inner)
+        return
+
+    for child in children:
+        _convert(child, parent)
+
+
+def _convert(element, parent):
+    """把一个MathML元素转换为OMML并追加到 parent"""
+    tag = _local(element)
+    children = list(element)
+
+    if tag in _TRANSPARENT:
+        _convert_row(children, parent)
+    elif tag == 'mi':
+        _run(parent, element.text or '', upright=len(element.text or '') > 1)
+    elif tag in ('mn', 'mo', 'mtext', 'ms'):
+        if element.text:
+            _run(parent, element.text, upright=True)
+    elif tag == 'mspace':
+        _run(parent, ' ', upright=True)
+    elif tag == 'mphantom':
+        return
+    elif tag == 'msup' and len(children) == 2:
+        script = _sub(parent, 'sSup')
+        _container(script, 'e', children[:1])
+        _container(script, 'sup', children[1:])
+    elif tag == 'msub' and len(children) == 2:
+        script = _sub(parent, 'sSub')
+        _container(script, 'e', children[:1])
+        _container(script, 'sub', children[1:])
+    elif tag == 'msubsup' and len(children) == 3:
+        script = _sub(parent, 'sSubSup')
+        _container(script, 'e', children[:1])
+        _container(script, 'sub', children[1:2])
+        _container(script, 'sup', children[2:])
+    elif tag == 'mfrac' and len(children) == 2:
+        fraction = _sub(parent, 'f')
+        if element.get('linethickness') in ('0', '0px', '0em'):
+            _sub(_sub(fraction, 'fPr'), 'type', val='noBar')
+        _container(fraction, 'num', children[:1])
+        _container(fraction, 'den', children[1:])
+    elif tag == 'msqrt':
+        radical = _sub(parent, 'rad')
+        _sub(_sub(radical, 'radPr'), 'degHide', val='1')
+        _sub(radical, 'deg')
+        _container(radical, 'e', children)
+    elif tag == 'mroot' and len(children) == 2:
+        radical = _sub(parent, 'rad')
+        _container(radical, 'deg', children[1:])
+        _container(radical, 'e', children[:1])
+    elif tag == 'mover' and len(children) == 2:
+        mark = (children[1].text or '').strip() if _local(children[1]) == 'mo' else None
+        if mark in _BAR_CHARS:
+            bar = _sub(parent, 'bar')
+            _sub(_sub(bar, 'barPr'), 'pos', val='top')
+            _container(bar, 'e', children[:1])
+        elif mark:
+            accent = _sub(parent, 'acc')
+            _sub(_sub(accent, 'accPr'), 'chr', val=_ACCENTS.get(mark, mark))
+            _container(accent, 'e', children[:1])
+        else:
+            limit = _sub(parent, 'limUpp')
+            _container(limit, 'e', children[:1])
+            _container(limit, 'lim', children[1:])
+    elif tag == 'munder' and len(children) == 2:
+        limit = _sub(parent, 'limLow')
+        _container(limit, 'e', children[:1])
+        _container(limit, 'lim', children[1:])
+    elif tag == 'munderover' and len(children) == 3:
+        lower = _sub(parent, 'limLow')
+        upper = _sub(_sub(lower, 'e'), 'limUpp')
+        _container(upper, 'e', children[:1])
+        _container(upper, 'lim', children[2:])
+        _container(lower, 'lim', children[1:2])
+    elif tag == 'mtable':
+        matrix = _sub(parent, 'm')
+        for row in children:
+            matrix_row = _sub(matrix, 'mr')
+            for cell in list(row):
+                _container(matrix_row, 'e', [cell])
+    else:
+        # 未支持的元素（如 mfenced、mmultiscripts）按顺序展开子元素，尽量保留内容
+        if element.text and element.text.strip():
+            _run(parent, element.text.strip(), upright=True)
+        _convert_row(children, parent)
+
+
+@lru_cache(maxsize=DOCX_EXPORT_CONFIG["omml_cache_size"])
+def latex_to_omml(latex: str, display: bool = False) -> Optional[str]:
+    """
+    把LaTeX公式转换为OMML的XML字符串（按公式内容缓存，同一公式在各份试卷中只转换一次）
+
+    Args:
+        latex: LaTeX公式（不含 $ 等定界符）
+        display: 是否为行间公式（外层包 m:oMathPara，单独成段）
+
+    Returns:
+        OMML XML字符串；latex2mathml不可用或无法转换时返回None
+    """
+    if not LATEX2MATHML_AVAILABLE or not latex.strip():
+        return None
+    try:
+        mathml = ET.fromstring(latex_to_mathml(latex))
+    except Exception:
+        return None
+
+    omath = ET.Element(_m('oMath'))
+    _convert(mathml, omath)
+    if display:
+        paragraph = ET.Element(_m('oMathPara'))
+        paragraph.append(omath)
+        omath = paragraph
+    return ET.tostring(omath, encoding='unicode')
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+分页工具模块 - 键集分页游标的编码与解码
+"""
+
+import base64
+import json
+from typing import List, Sequence, Tuple
+
+
+def encode_cursor(kind: str, key: List) -> str:
+    """
+    将分页位置编码为不透明的游标字符串
+
+    Args:
+        kind: 查询类型（all/tags/keyword），防止游标被用于其它查询
+        key: 上一页最后一条记录的排序键
+
+    Returns:
+        URL安全的游标字符串
+    """
+    payload = json.dumps({'k': kind, 'v': list(key)}, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, kind: str, shape: Sequence = None) -> Tuple:
+    """
+    解码游标字符串
+
+    Args:
+        cursor: encode_cursor 生成的游标
+        kind: 期望的查询类型
+        shape: 排序键各项允许的类型（类型或类型元组），给出时校验键的长度与类型
+
+    Returns:
+        排序键元组
+
+    Raises:
+        ValueError: 游标格式错误或与查询类型不匹配
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        key = payload['v']
+        cursor_kind = payload['k']
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("无效的分页游标") from e
+    if cursor_kind != kind or not isinstance(key, list):
+        raise ValueError("分页游标与当前查询条件不匹配")
+    if shape is not None and (len(key) != len(shape) or not all(
+            isinstance(value, types) and not isinstance(value, bool) for value, types in zip(key, shape))):
+        raise ValueError("无效的分页游标")
+    return tuple(key)
@@ -3,37 +3,67 @@
 高考题目录入和自动打标系统核心类
 """
 
-import sqlite3
 import json
+import sqlite3
 import requests
 import re
 import time
-from typing import List, Dict, Optional, Tuple
-from config import DATABASE_PATH, LLM_CONFIG, MAX_QUESTION_LENGTH, MAX_ANSWER_LENGTH
+from typing import List, Dict, Iterator, Optional, Tuple
+from concurrent.futures import as_completed
+from config import DATABASE_PATH, LLM_CONFIG, LLM_CACHE_CONFIG, MAX_QUESTION_LENGTH, MAX_ANSWER_LENGTH, MAX_BULK_QUESTIONS, SEARCH_CONFIG
 from openai import OpenAI
 from logger import get_logger
+from db_pool import get_connection
+from question_record import Question, QuestionRowDecoder
+from search_index import FTS_TOKENIZE, build_match_query, segment_text
+from pagination import encode_cursor, decode_cursor
+from llm_cache import LLMResponseCache
+from llm_executor import get_llm_executor, get_rate_limiter
+from exam_segmenter import segment_exam_markdown, IMAGE_REF_RE
+from stream_json import IncrementalJSONParser
 from json_repair import repair_json
 
+# 单条 IN (...) 查询的最大参数个数（低于旧版SQLite的999个参数上限）
+_MAX_IN_PARAMS = 900
+
+# 各查询类型的分页键结构：(created_at, id)；全文检索为 (bm25得分, id, 排序窗口下界)
+_CURSOR_SHAPES = {
+    'all': (str, int),
+    'tags': (str, int),
+    'keyword': ((int, float), int, int),
+    'keyword_like': (str, int),
+}
+
+# 题目可见范围的合法取值
+_VISIBILITY_VALUES = ('public', 'private')
+
 class QuestionManager:
     """高考题目管理器类"""
     
-    def __init__(self, db_path: str = DATABASE_PATH, system_manager=None):
+    # 自动打标提示词模板版本，修改提示词时递增以使旧的缓存响应失效
+    AUTO_TAG_PROMPT_VERSION = 1
+    
+    def __init__(self, db_path: str = DATABASE_PATH, system_manager=None, blob_store=None):
         """
         初始化题目管理器
         
         Args:
             db_path: 数据库文件路径
             system_manager: 系统管理器实例
+            blob_store: 上传文件存储实例，用于维护题目图片的引用计数
         """
         self.db_path = db_path
         self.system_manager = system_manager
+        self.blob_store = blob_store
         self.llm_client = OpenAI(api_key=LLM_CONFIG["api_key"],base_url=LLM_CONFIG["api_url"])
+        self.llm_cache = LLMResponseCache() if LLM_CACHE_CONFIG["enabled"] else None
+        self.rate_limiter = get_rate_limiter(LLM_CONFIG["api_url"])
         self.logger = get_logger()
         self.init_database()
     
     def init_database(self):
         """初始化数据库表结构"""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         # 创建题目表
@@ -62,14 +92,197 @@ class QuestionManager:
         if 'visibility' not in columns:
             cursor.execute("ALTER TABLE questions ADD COLUMN visibility TEXT DEFAULT 'public'")
         
-        # 创建索引
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tags ON questions(tags)')
+        # 迁移完成后重新解析一次列布局，供行解码器使用
+        if 'user_id' not in columns or 'visibility' not in columns:
+            cursor.execute("PRAGMA table_info(questions)")
+            columns = [column[1] for column in cursor.fetchall()]
+        QuestionRowDecoder.invalidate()
+        self._row_decoder = QuestionRowDecoder(columns)
+        
+        # 创建索引（JSON文本上的idx_tags无法服务标签查询，已由question_tags表取代）
+        cursor.execute('DROP INDEX IF EXISTS idx_tags')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_source ON questions(source)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_id ON questions(user_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_visibility ON questions(visibility)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON questions(created_at, id)')
+        
+        # 创建题目-标签索引表，由触发器随questions表的增删改同步维护
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS question_tags (
+                question_id INTEGER NOT NULL,
+                tag TEXT NOT NULL,
+                PRIMARY KEY (tag, question_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_question_tags_qid ON question_tags(question_id)')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_question_tags_insert AFTER INSERT ON questions BEGIN
+                INSERT OR IGNORE INTO question_tags (question_id, tag)
+                SELECT new.id, value FROM json_each({self._JSON_TAGS.format(col='new.tags')});
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_question_tags_delete AFTER DELETE ON questions BEGIN
+                DELETE FROM question_tags WHERE question_id = old.id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_question_tags_update AFTER UPDATE OF tags ON questions BEGIN
+                DELETE FROM question_tags WHERE question_id = old.id;
+                INSERT OR IGNORE INTO question_tags (question_id, tag)
+                SELECT new.id, value FROM json_each({self._JSON_TAGS.format(col='new.tags')});
+            END
+        ''')
+        
+        conn.commit()
+        
+        # 创建全文检索索引（SQLite未编译FTS5时退化为LIKE搜索）
+        self.fts_enabled = self._init_fulltext_index(cursor)
+        conn.commit()
+        
+        # 数据迁移：回填已有题目的标签索引
+        if self._get_schema_version(cursor) < 1:
+            self._backfill_question_tags(conn, cursor)
+            self._set_schema_version(conn, cursor, 1)
+        
+        # 数据迁移：重建全文检索索引
+        if self.fts_enabled and self._get_schema_version(cursor) < 2:
+            self._rebuild_fulltext_index(conn, cursor)
+            self._set_schema_version(conn, cursor, 2)
+        
+        cursor.close()
+    
+    # 全文检索各列的BM25权重：题目内容、参考解答、来源
+    _FTS_WEIGHTS = (1.0, 0.5, 2.0)
+    
+    def _init_fulltext_index(self, cursor) -> bool:
+        """
+        创建FTS5全文检索表
+        
+        索引为无内容表（content=''），写入的是 segment_text 分词后的文本，
+        原文仍只保存在questions表中。索引行由本类的写入方法在同一事务中维护，
+        不使用触发器：触发器无法调用应用内的分词函数，会使其它连接的写入失败。
+        
+        Returns:
+            FTS5是否可用
+        """
+        try:
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+                    latex_content, reference_answer, source,
+                    content='', tokenize="{FTS_TOKENIZE}"
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            self.logger.log_warning(f"FTS5不可用，关键词搜索将使用LIKE扫描: {e}", "初始化全文检索")
+            return False
+        
+        # 旧版本的同步触发器依赖只注册在连接池连接上的分词函数
+        for trigger in ('trg_questions_fts_insert', 'trg_questions_fts_delete', 'trg_questions_fts_update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        return True
+    
+    @staticmethod
+    def _fulltext_values(rows: List[Tuple]) -> List[Tuple]:
+        """(ID, 题目内容, 参考解答, 来源) -> 索引行 (rowid, 分词后的三列)"""
+        return [(row[0], segment_text(row[1]), segment_text(row[2]), segment_text(row[3])) for row in rows]
+    
+    def _index_fulltext(self, cursor, rows: List[Tuple]):
+        """
+        把题目写入全文检索索引（调用方负责提交事务）
+        
+        Args:
+            cursor: 写入题目所用连接上的游标
+            rows: (ID, 题目内容, 参考解答, 来源) 列表
+        """
+        if not self.fts_enabled or not rows:
+            return
+        cursor.executemany('''
+            INSERT INTO questions_fts (rowid, latex_content, reference_answer, source)
+            VALUES (?, ?, ?, ?)
+        ''', self._fulltext_values(rows))
+    
+    def _unindex_fulltext(self, cursor, rows: List[Tuple]):
+        """
+        从全文检索索引中删除题目（无内容表删除时须提供与写入时相同的原文，调用方负责提交事务）
+        
+        Args:
+            cursor: 删除题目所用连接上的游标
+            rows: 删除前的 (ID, 题目内容, 参考解答, 来源) 列表
+        """
+        if not self.fts_enabled or not rows:
+            return
+        cursor.executemany('''
+            INSERT INTO questions_fts (questions_fts, rowid, latex_content, reference_answer, source)
+            VALUES ('delete', ?, ?, ?, ?)
+        ''', self._fulltext_values(rows))
+    
+    def _rebuild_fulltext_index(self, conn, cursor):
+        """清空并按现有题目重建全文检索索引（单个事务内完成）"""
+        start_time = time.time()
+        indexed = 0
+        try:
+            cursor.execute("INSERT INTO questions_fts (questions_fts) VALUES ('delete-all')")
+            last_id = 0
+            while True:
+                cursor.execute('''
+                    SELECT id, latex_content, reference_answer, source FROM questions
+                    WHERE id > ? ORDER BY id LIMIT ?
+                ''', (last_id, self._MIGRATION_BATCH_SIZE))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                self._index_fulltext(cursor, rows)
+                indexed += len(rows)
+                last_id = rows[-1][0]
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self.logger.log_error(e, "重建全文检索索引失败")
+            raise e
         
+        duration = time.time() - start_time
+        self.logger.log_performance("重建全文检索索引", duration, f"索引题目数: {indexed}")
+    
+    # 非法JSON按空列表处理，避免触发器因脏数据中断写入
+    _JSON_TAGS = "CASE WHEN json_valid({col}) AND json_type({col}) = 'array' THEN {col} ELSE '[]' END"
+    
+    # 数据迁移每批处理的题目数，分批提交以免长时间占用写锁
+    _MIGRATION_BATCH_SIZE = 5000
+    
+    def _get_schema_version(self, cursor) -> int:
+        """获取数据库数据迁移版本"""
+        cursor.execute('PRAGMA user_version')
+        return cursor.fetchone()[0]
+    
+    def _set_schema_version(self, conn, cursor, version: int):
+        """记录数据库数据迁移版本"""
+        cursor.execute(f'PRAGMA user_version = {int(version)}')
         conn.commit()
-        conn.close()
+    
+    def _backfill_question_tags(self, conn, cursor):
+        """
+        在线回填question_tags表：按ID分批写入并逐批提交，
+        可重复执行（INSERT OR IGNORE），中途中断后下次启动继续
+        """
+        start_time = time.time()
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM questions')
+        max_id = cursor.fetchone()[0]
+        
+        last_id = 0
+        while last_id < max_id:
+            upper_id = last_id + self._MIGRATION_BATCH_SIZE
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO question_tags (question_id, tag)
+                SELECT q.id, j.value
+                FROM questions q, json_each({self._JSON_TAGS.format(col='q.tags')}) j
+                WHERE q.id > ? AND q.id <= ?
+            ''', (last_id, upper_id))
+            conn.commit()
+            last_id = upper_id
+        
+        duration = time.time() - start_time
+        self.logger.log_performance("回填题目标签索引", duration, f"最大题目ID: {max_id}")
     
     def add_question(self, latex_content: str, tags: List[str] = None, 
                     reference_answer: str = None, source: str = None, 
@@ -105,7 +318,7 @@ class QuestionManager:
         
         self.logger.log_database_operation("INSERT", "questions", details=f"用户ID: {user_id}, 标签: {tags}, 来源: {source}")
         
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -115,8 +328,12 @@ class QuestionManager:
             ''', (latex_content, tags_json, reference_answer, source, image_json, user_id, visibility))
             
             question_id = cursor.lastrowid
+            self._index_fulltext(cursor, [(question_id, latex_content, reference_answer, source)])
             conn.commit()
             
+            if self.blob_store:
+                self.blob_store.add_refs(image)
+            
             duration = time.time() - start_time
             self.logger.log_performance("添加题目", duration, f"题目ID: {question_id}")
             self.logger.log_database_operation("INSERT_SUCCESS", "questions", question_id, f"内容长度: {len(latex_content)}")
@@ -128,50 +345,163 @@ class QuestionManager:
             self.logger.log_error(e, f"添加题目失败 - 用户ID: {user_id}")
             raise e
         finally:
-            conn.close()
-    
-    def get_questions_by_tags(self, tags: List[str], current_user_id: int = None) -> List[Dict]:
+            cursor.close()
+
+    def add_questions_bulk(self, questions: List[Dict], user_id: int = None,
+                           visibility: str = 'public') -> List[int]:
         """
-        根据标签查询题目（考虑可见性）
+        批量添加题目（试卷解析后一次保存整套题）
+
+        先校验全部题目，任何一道不合法都不写入；之后在同一个事务中逐条插入，
+        只提交一次。标签索引由触发器随插入维护，全文索引在同一事务中写入。
+
+        Args:
+            questions: 题目列表，每项包含 latex_content 和可选的 tags/reference_answer/source/image
+            user_id: 上传用户ID
+            visibility: 可见范围
+
+        Returns:
+            新插入题目的ID列表，与输入顺序一致
+
+        Raises:
+            ValueError: 题目数量或任一题目内容不合法（消息中带题号）
+        """
+        start_time = time.time()
+
+        if not questions:
+            raise ValueError("题目列表不能为空")
+        if len(questions) > MAX_BULK_QUESTIONS:
+            raise ValueError("一次最多保存{}道题目".format(MAX_BULK_QUESTIONS))
+        if visibility not in _VISIBILITY_VALUES:
+            raise ValueError("可见范围只能是: {}".format(', '.join(_VISIBILITY_VALUES)))
+
+        rows = []
+        all_images = []
+        for index, item in enumerate(questions, 1):
+            if not isinstance(item, dict):
+                raise ValueError(f"第{index}道题目格式不正确")
+            latex_content = item.get('latex_content')
+            reference_answer = item.get('reference_answer') or None
+            source = item.get('source') or None
+            tags = item.get('tags') or []
+            image = item.get('image') or []
+
+            if not latex_content or not isinstance(latex_content, str) or len(latex_content) > MAX_QUESTION_LENGTH:
+                raise ValueError("第{}道题目：题目内容不能为空且长度不能超过{}字符".format(index, MAX_QUESTION_LENGTH))
+            if reference_answer is not None and not isinstance(reference_answer, str):
+                raise ValueError(f"第{index}道题目：参考解答必须是字符串")
+            if reference_answer and len(reference_answer) > MAX_ANSWER_LENGTH:
+                raise ValueError("第{}道题目：参考解答长度不能超过{}字符".format(index, MAX_ANSWER_LENGTH))
+            if source is not None and not isinstance(source, str):
+                raise ValueError(f"第{index}道题目：来源必须是字符串")
+            if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+                raise ValueError(f"第{index}道题目：标签必须是字符串列表")
+            if not isinstance(image, list) or not all(isinstance(url, str) for url in image):
+                raise ValueError(f"第{index}道题目：图片必须是路径列表")
+
+            rows.append((latex_content, json.dumps(tags, ensure_ascii=False), reference_answer,
+                         source, json.dumps(image, ensure_ascii=False), user_id, visibility))
+            all_images.extend(image)
+
+        self.logger.log_database_operation("BULK_INSERT", "questions", details=f"用户ID: {user_id}, 数量: {len(rows)}")
+
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            question_ids = []
+            for row in rows:
+                cursor.execute('''
+                    INSERT INTO questions (latex_content, tags, reference_answer, source, image, user_id, visibility)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', row)
+                question_ids.append(cursor.lastrowid)
+            self._index_fulltext(cursor, [(question_id, row[0], row[2], row[3])
+                                          for question_id, row in zip(question_ids, rows)])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self.logger.log_error(e, f"批量添加题目失败 - 用户ID: {user_id}")
+            raise e
+        finally:
+            cursor.close()
+
+        if self.blob_store:
+            self.blob_store.add_refs(all_images)
+        if self.system_manager:
+            self.system_manager.add_tags([tag for item in questions for tag in (item.get('tags') or [])])
+
+        duration = time.time() - start_time
+        self.logger.log_performance("批量添加题目", duration, f"数量: {len(question_ids)}")
+        return question_ids
+
+    def get_questions_by_tags(self, tags: List[str], current_user_id: int = None,
+                              match: str = 'any', limit: int = None, after: Tuple = None) -> List[Dict]:
+        """
+        根据标签查询题目（考虑可见性），按创建时间倒序
         
         Args:
             tags: 要查询的标签列表
             current_user_id: 当前用户ID
+            match: 匹配方式，any(包含任一标签) 或 all(包含全部标签)
+            limit: 返回数量上限，为None时返回全部匹配
+            after: 键集分页位置 (created_at, id)，只返回排在其后的题目
             
         Returns:
             匹配的题目列表
         """
         if not tags:
             return []
+        records, _ = self._query_by_tags(tags, current_user_id, match, limit, after)
+        return [record.to_dict() for record in records]
+    
+    def _query_by_tags(self, tags: List[str], current_user_id: int, match: str,
+                       limit: int, after: Tuple) -> Tuple[List[Question], List[Tuple]]:
+        """按标签查询，返回题目记录及其分页键 (created_at, id)"""
+        tag_filter, params = self._tag_filter_clause(tags, match)
+        params.append(current_user_id)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 构建查询条件
-        conditions = []
-        params = []
-        
-        for tag in tags:
-            conditions.append("tags LIKE ?")
-            params.append(f'%"{tag}"%')
+        keyset = ''
+        if after:
+            keyset = 'AND (created_at, id) < (?, ?)'
+            params.extend(after[:2])
+        params.append(limit if limit is not None else -1)
         
-        # 添加可见性条件
-        visibility_condition = "(visibility = 'public' OR user_id = ?)"
-        params.append(current_user_id)
+        # 一元加号阻止优化器选用低选择性的可见性索引，保证从标签索引表驱动查询
+        records, _ = self._fetch_records(f"""
+            SELECT * FROM questions
+            WHERE id IN ({tag_filter})
+            AND (+visibility = 'public' OR +user_id = ?)
+            {keyset}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        """, params)
+        return records, [(record.created_at, record.id) for record in records]
+    
+    def _tag_filter_clause(self, tags: List[str], match: str = 'any') -> Tuple[str, List]:
+        """
+        构建在question_tags索引表上筛选题目ID的子查询
         
-        query = f"SELECT * FROM questions WHERE ({' OR '.join(conditions)}) AND {visibility_condition} ORDER BY created_at DESC"
+        Args:
+            tags: 标签列表
+            match: any 或 all
+            
+        Returns:
+            (子查询SQL, 参数列表)
+        """
+        if match not in ('any', 'all'):
+            raise ValueError("标签匹配方式只能是 any 或 all")
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
+        unique_tags = list(dict.fromkeys(tags))
+        placeholders = ', '.join('?' * len(unique_tags))
+        clause = f"SELECT question_id FROM question_tags WHERE tag IN ({placeholders})"
+        params = list(unique_tags)
         
-        # 转换为字典格式
-        questions = []
-        for row in rows:
-            question = self._row_to_dict(row)
-            questions.append(question)
+        if match == 'all' and len(unique_tags) > 1:
+            clause += " GROUP BY question_id HAVING COUNT(*) = ?"
+            params.append(len(unique_tags))
         
-        return questions
+        return clause, params
     
     def get_question_by_id(self, question_id: int, current_user_id: int = None) -> Optional[Dict]:
         """
@@ -184,7 +514,7 @@ class QuestionManager:
         Returns:
             题目信息字典，如果不存在或无权访问返回None
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -192,12 +522,40 @@ class QuestionManager:
             WHERE id = ? AND (visibility = 'public' OR user_id = ?)
         ''', (question_id, current_user_id))
         row = cursor.fetchone()
-        conn.close()
+        cursor.close()
         
         if row:
             return self._row_to_dict(row)
         return None
     
+    def get_questions_by_ids(self, question_ids: List[int], current_user_id: int = None) -> List[Dict]:
+        """
+        批量获取题目详情（考虑可见性），一次查询取回全部题目
+        
+        Args:
+            question_ids: 题目ID列表
+            current_user_id: 当前用户ID
+            
+        Returns:
+            按 question_ids 顺序排列的题目列表，不存在或无权访问的题目被跳过，重复的ID只返回一次
+        """
+        ordered_ids = list(dict.fromkeys(question_ids or []))
+        if not ordered_ids:
+            return []
+        
+        records = []
+        # 分批以免超过SQLite的参数个数上限
+        for start in range(0, len(ordered_ids), _MAX_IN_PARAMS):
+            batch = ordered_ids[start:start + _MAX_IN_PARAMS]
+            placeholders = ', '.join('?' * len(batch))
+            batch_records, _ = self._fetch_records(f'''
+                SELECT * FROM questions
+                WHERE id IN ({placeholders}) AND (visibility = 'public' OR user_id = ?)
+            ''', batch + [current_user_id])
+            records.extend(batch_records)
+        
+        by_id = {record.id: record for record in records}
+        return [by_id[question_id].to_dict() for question_id in ordered_ids if question_id in by_id]
     
     def auto_tag_and_answer(self, content: str, source: str = None) -> Tuple[List[str], str, str]:
         """
@@ -210,21 +568,85 @@ class QuestionManager:
         Returns:
             (标签列表, 参考解答, LaTeX格式的题目内容)
         """
+        try:
+            return self._auto_tag(content)
+        except Exception as e:
+            self.logger.log_error(e, "自动打标失败")
+            return [], "自动生成解答失败，请手动输入", content
+    
+    def _auto_tag(self, content: str) -> Tuple[List[str], str, str]:
+        """
+        自动打标的实际实现，失败时抛出异常（供批量打标区分成功与失败）
+        
+        Returns:
+            (标签列表, 参考解答, LaTeX格式的题目内容)
+        """
+        start_time = time.time()
+        
+        tag_hint = self._tag_hint()
+        cache_key, response = self._lookup_auto_tag_cache(content, tag_hint)
+        if response is None:
+            response = self._chat(self._auto_tag_prompt(content, tag_hint), "自动打标和LaTeX格式化")
+        else:
+            cache_key = None  # 命中时不重写缓存，有效期从首次写入起算
+        
+        valid_tags, answer, latex_content = self._finish_auto_tag(response, content, cache_key)
+        
+        duration = time.time() - start_time
+        self.logger.log_performance("自动打标和LaTeX格式化", duration, f"标签数量: {len(valid_tags)}")
+        
+        return valid_tags, answer, latex_content
+    
+    def auto_tag_and_answer_stream(self, content: str, source: str = None) -> Iterator[Tuple]:
+        """
+        流式版本的自动打标：大模型逐段输出时，每个字段完整后立即产出
+        
+        Args:
+            content: 题目内容（可能是普通文本或LaTeX格式）
+            source: 题目来源
+            
+        Returns:
+            事件迭代器：先产出若干 ('field', 字段名, 值)，
+            最后产出 ('done', (标签列表, 参考解答, LaTeX格式的题目内容))
+        """
         start_time = time.time()
         
         try:
-            # 获取当前可用的标签
-            available_tags = []
-            if self.system_manager:
-                tags = self.system_manager.get_all_tags(limit=50)
-                available_tags = [tag['name'] for tag in tags]
-            
-            # 构建提示词
-            prompt = f"""
+            tag_hint = self._tag_hint()
+            cache_key, response = self._lookup_auto_tag_cache(content, tag_hint)
+            if response is None:
+                chunks = self._chat_stream(self._auto_tag_prompt(content, tag_hint), "自动打标和LaTeX格式化")
+            else:
+                chunks = [response]
+                cache_key = None  # 命中时不重写缓存，有效期从首次写入起算
+            
+            parser = IncrementalJSONParser()
+            fields = {}
+            for chunk in chunks:
+                for event in parser.feed(chunk):
+                    if event[0] == 'field':
+                        fields[event[1]] = event[2]
+                        yield event
+            
+            result = self._finish_auto_tag(parser.buffer, content, cache_key,
+                                           fields if parser.done else None)
+            
+            duration = time.time() - start_time
+            self.logger.log_performance("流式自动打标和LaTeX格式化", duration, f"标签数量: {len(result[0])}")
+            
+            yield ('done', result)
+                
+        except Exception as e:
+            self.logger.log_error(e, "流式自动打标失败")
+            yield ('done', ([], "自动生成解答失败，请手动输入", content))
+    
+    def _auto_tag_prompt(self, content: str, tag_hint: str) -> str:
+        """构建自动打标提示词"""
+        return f"""
 请分析以下高考数学题目，并完成以下任务：
 
 1. 将题目内容格式化为标准的LaTeX格式，确保数学公式、符号、格式都正确
-2. 请给这个题目所涉及的知识点打上几个标签，可以参考以下标签：{', '.join(available_tags) if available_tags else '立体几何, 导数题, 极值点偏移, 三角函数, 数列, 概率统计, 解析几何, 函数与方程, 不等式, 向量, 复数, 算法与程序框图'}
+2. 请给这个题目所涉及的知识点打上几个标签，可以参考以下标签：{tag_hint}
 3. 生成详细的参考解答
 
 题目内容：
@@ -237,57 +659,170 @@ class QuestionManager:
     "answer": "详细的参考解答，包含解题步骤和最终答案"
 }}
 """
+    
+    def _lookup_auto_tag_cache(self, content: str, tag_hint: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        查询自动打标响应缓存
+        
+        Returns:
+            (缓存键, 缓存的响应)，未启用缓存时缓存键为None，未命中时响应为None
+        """
+        # 相同内容、模型、提示词版本和标签词表的请求直接复用缓存的响应；
+        # 词表按集合参与计算，使用计数变化只改变标签顺序时不影响命中
+        if not self.llm_cache:
+            return None, None
+        
+        cache_key = LLMResponseCache.make_key(content, LLM_CONFIG["model"],
+                                              self.AUTO_TAG_PROMPT_VERSION, tag_hint.split(', '))
+        response = self.llm_cache.get(cache_key)
+        if response is not None:
+            self.logger.log_system_info(f"自动打标命中响应缓存 - 缓存键: {cache_key[:16]}")
+        return cache_key, response
+    
+    def _finish_auto_tag(self, response: str, content: str, cache_key: Optional[str],
+                         result: Dict = None) -> Tuple[List[str], str, str]:
+        """
+        解析自动打标响应、登记标签并写入缓存
+        
+        Args:
+            response: 大模型响应文本
+            content: 原始题目内容
+            cache_key: 缓存键，为None时不写缓存（未启用缓存或命中缓存）
+            result: 已经解析好的响应对象（流式解析得到），为None时从响应文本解析
             
-            self.logger.log_llm_prompt(prompt, "自动打标和LaTeX格式化")
-            
-            # 调用大语言模型API
-            response = self.llm_client.chat.completions.create(
-                model=LLM_CONFIG["model"],
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=LLM_CONFIG["max_tokens"],
-                temperature=LLM_CONFIG["temperature"]
-            )
-            response = response.choices[0].message.content
-            
-            self.logger.log_llm_response(response, "自动打标和LaTeX格式化")
-            
-            # 解析响应
-            try:
+        Returns:
+            (标签列表, 参考解答, LaTeX格式的题目内容)
+        """
+        # 解析响应
+        try:
+            if result is None:
                 match = re.search(r'\{.*?\}', response, re.DOTALL).group(0)
                 match = repair_json(match)
                 result = json.loads(match)
-                latex_content = result.get('latex_content', content)
-                tags = result.get('tags', [])
-                answer = result.get('answer', '')
-                
-                # 验证标签并添加到数据库
-                valid_tags = []
-                for tag in tags:
-                    if self.system_manager:
-                        # 添加标签到数据库（如果不存在则创建，存在则增加使用计数）
-                        self.system_manager.add_tag(tag)
-                        valid_tags.append(tag)
-                    else:
-                        # 如果没有系统管理器，直接使用标签
-                        valid_tags.append(tag)
-                
-                duration = time.time() - start_time
-                self.logger.log_performance("自动打标和LaTeX格式化", duration, f"标签数量: {len(valid_tags)}")
-                
-                return valid_tags, answer, latex_content
-                
-            except json.JSONDecodeError as e:
-                self.logger.log_error(e, "JSON解析失败 - 自动打标")
-                raise e
-                
-        except Exception as e:
-            self.logger.log_error(e, "自动打标失败")
-            return [], "自动生成解答失败，请手动输入", content
+            latex_content = result.get('latex_content', content)
+            tags = result.get('tags', [])
+            answer = result.get('answer', '')
+        except json.JSONDecodeError as e:
+            self.logger.log_error(e, "JSON解析失败 - 自动打标")
+            raise e
+        
+        # 登记标签使用计数（由系统管理器在内存中合并，后台批量写入，不阻塞本次请求）
+        valid_tags = list(tags)
+        if self.system_manager:
+            self.system_manager.add_tags(valid_tags)
+        
+        # 只缓存能成功解析的响应
+        if cache_key:
+            self.llm_cache.put(cache_key, response)
+        
+        return valid_tags, answer, latex_content
+    
+    def auto_tag_batch(self, items: List[Dict]) -> Iterator[Tuple[int, Optional[Tuple[List[str], str, str]], Optional[str]]]:
+        """
+        并发地对多道题目自动打标，按完成顺序逐个产出结果
+        
+        并发数受共享线程池大小限制，每次调用都经过服务商速率限制。
+        迭代器被提前关闭（如客户端断开连接）时，取消尚未开始执行的调用。
+        
+        Args:
+            items: 题目列表，每项包含 content 和可选的 source
+            
+        Returns:
+            (题目在输入中的下标, (标签列表, 参考解答, LaTeX格式的题目内容), 错误信息) 的迭代器，
+            成功时错误信息为None，失败时结果为None
+        """
+        executor = get_llm_executor()
+        futures = {
+            executor.submit(self._auto_tag, item.get('content', '')): index
+            for index, item in enumerate(items)
+        }
+        try:
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    yield index, future.result(), None
+                except Exception as e:
+                    self.logger.log_error(e, f"批量自动打标失败 - 题目下标: {index}")
+                    yield index, None, str(e) or e.__class__.__name__
+        finally:
+            cancelled = sum(1 for future in futures if future.cancel())
+            if cancelled:
+                self.logger.log_warning(f"批量自动打标提前结束，已取消 {cancelled} 个未开始的调用", "批量自动打标")
+    
+    def _tag_hint(self) -> str:
+        """提示词中供大模型参考的标签列表（复用系统管理器缓存的拼接结果）"""
+        available_tags = ''
+        if self.system_manager:
+            available_tags = self.system_manager.get_tag_vocabulary(limit=50)['joined']
+        
+        return available_tags if available_tags else '立体几何, 导数题, 极值点偏移, 三角函数, 数列, 概率统计, 解析几何, 函数与方程, 不等式, 向量, 复数, 算法与程序框图'
+    
+    def _chat(self, prompt: str, context: str) -> str:
+        """
+        调用大语言模型（经过速率限制）并记录提示词和响应
+        
+        Args:
+            prompt: 提示词
+            context: 日志上下文
+            
+        Returns:
+            模型回复文本
+        """
+        self.logger.log_llm_prompt(prompt, context)
+        
+        # 调用大语言模型API
+        self.rate_limiter.acquire()
+        response = self.llm_client.chat.completions.create(
+            model=LLM_CONFIG["model"],
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=LLM_CONFIG["max_tokens"],
+            temperature=LLM_CONFIG["temperature"]
+        )
+        response = response.choices[0].message.content
+        
+        self.logger.log_llm_response(response, context)
+        return response
+    
+    def _chat_stream(self, prompt: str, context: str) -> Iterator[str]:
+        """
+        以流式模式调用大语言模型（经过速率限制），逐段产出回复文本，结束后记录完整响应
+        
+        Args:
+            prompt: 提示词
+            context: 日志上下文
+            
+        Returns:
+            回复文本片段的迭代器
+        """
+        self.logger.log_llm_prompt(prompt, context)
+        
+        self.rate_limiter.acquire()
+        stream = self.llm_client.chat.completions.create(
+            model=LLM_CONFIG["model"],
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=LLM_CONFIG["max_tokens"],
+            temperature=LLM_CONFIG["temperature"],
+            stream=True
+        )
+        
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        
+        self.logger.log_llm_response(''.join(parts), context)
     
     def parse_exam_paper(self, markdown_content: str, image_filename_mapping: Dict[str, str] = None) -> List[Dict]:
         """
         解析试卷内容，提取题目
         
+        先在本地按题号把试卷切分为题目块，每道题并发调用一次大模型后按原顺序合并；
+        识别不出题号（不足两道题）时退回整卷一次性解析。
+        
         Args:
             markdown_content: OCR识别的markdown内容
             image_filename_mapping: 图片文件名映射关系 {原始文件名: 本地路径}
@@ -298,19 +833,117 @@ class QuestionManager:
         start_time = time.time()
         
         try:
-            # 构建提示词
-            images_info = ""
-            if image_filename_mapping:
-                available_filenames = list(image_filename_mapping.keys())
-                images_info = f"\n可用的图片文件：{', '.join(available_filenames)}"
-            
-            # 获取当前可用的标签
-            available_tags = []
-            if self.system_manager:
-                tags = self.system_manager.get_all_tags(limit=50)
-                available_tags = [tag['name'] for tag in tags]
-            
-            prompt = f"""
+            parsed = sorted(self.iter_exam_questions(markdown_content, image_filename_mapping),
+                            key=lambda item: item[0])
+            validated_questions = [question for _, question in parsed]
+            
+            # 验证解析结果
+            if not validated_questions:
+                self.logger.log_warning("大模型没有解析出任何题目", "试卷解析")
+                return []
+            
+            duration = time.time() - start_time
+            self.logger.log_performance("试卷解析", duration, f"解析出 {len(validated_questions)} 道题目")
+            self.logger.log_question_parsing(len(validated_questions), "试卷解析")
+            
+            return validated_questions
+                
+        except Exception as e:
+            self.logger.log_error(e, "解析试卷失败")
+            return []
+    
+    def iter_exam_questions(self, markdown_content: str,
+                            image_filename_mapping: Dict[str, str] = None) -> Iterator[Tuple[int, Dict]]:
+        """
+        逐题产出试卷解析结果，每道题解析完成后立即产出（不保证按题目顺序）
+        
+        本地切分成功时按各题并发调用的完成顺序产出；否则整卷流式调用大模型，
+        输出中的 questions 数组每完成一个元素就产出一道题。无效题目会被跳过。
+        
+        Args:
+            markdown_content: OCR识别的markdown内容
+            image_filename_mapping: 图片文件名映射关系 {原始文件名: 本地路径}
+            
+        Returns:
+            (题目在试卷中的序号, 题目字典) 的迭代器
+        """
+        tag_hint = self._tag_hint()
+        blocks = segment_exam_markdown(markdown_content)
+        
+        if blocks:
+            self.logger.log_system_info(f"试卷本地切分出 {len(blocks)} 道题目，开始并发解析")
+            executor = get_llm_executor()
+            futures = {executor.submit(self._parse_exam_block, block, tag_hint): index
+                       for index, block in enumerate(blocks)}
+            questions = ((futures[future], future.result()) for future in as_completed(futures))
+        else:
+            questions = self._iter_exam_whole(markdown_content, image_filename_mapping, tag_hint)
+        
+        # 确保每个题目都有必要的字段
+        for index, question in questions:
+            validated_question = self._validate_parsed_question(question, index, image_filename_mapping)
+            if validated_question:
+                yield index, validated_question
+    
+    def _parse_exam_block(self, block: Dict, tag_hint: str) -> Dict:
+        """
+        调用大模型解析单道题目块
+        
+        题目引用的图片由本地切分结果确定；大模型调用或解析失败时保留原文，
+        以免整卷中的一道题失败导致该题丢失。
+        
+        Args:
+            block: segment_exam_markdown 返回的题目块
+            tag_hint: 参考标签
+            
+        Returns:
+            包含 question/image/tags/answer 的题目字典
+        """
+        text = IMAGE_REF_RE.sub('[图]', block['text'])
+        section_info = f"（所属大题：{block['section']}）" if block.get('section') else ''
+        
+        prompt = f"""
+请分析以下试卷中的一道题目{section_info}，并完成以下任务：
+
+1. 去除OCR识别中的明显噪声和不合理内容
+2. 将题目内容转换为LaTeX格式，选择题选项优先使用enumerate环境
+3. 为题目生成其所考察的知识点标签并生成解答，标签可以参考：{tag_hint}
+
+题目内容：
+{text}
+
+请按以下JSON格式回复：
+{{
+    "question": "LaTeX格式的题目内容",
+    "tags": ["标签1", "标签2"],
+    "answer": "详细的参考解答"
+}}
+"""
+        
+        context = f"试卷解析 - 第{block['number']}题"
+        try:
+            response = self._chat(prompt, context)
+            match = re.search(r'\{.*\}', response, re.DOTALL).group(0)
+            result = json.loads(repair_json(match))
+            if not isinstance(result, dict):
+                raise ValueError("大模型返回的题目不是有效的字典格式")
+        except Exception as e:
+            self.logger.log_error(e, f"{context}失败，保留原文")
+            result = {'question': text, 'tags': [], 'answer': '自动生成解答失败，请手动输入'}
+        
+        result['image'] = block['images']
+        return result
+    
+    def _iter_exam_whole(self, markdown_content: str, image_filename_mapping: Dict[str, str],
+                         tag_hint: str) -> Iterator[Tuple[int, Dict]]:
+        """整卷交给大模型解析（本地切分失败时使用），流式输出中每完成一道题就产出"""
+        # 构建提示词
+        images_info = ""
+        if image_filename_mapping:
+            available_filenames = list(image_filename_mapping.keys())
+            images_info = f"\n可用的图片文件：{', '.join(available_filenames)}"
+        
+        prompt = f"""
 请分析以下试卷内容，提取所有题目并格式化为LaTeX格式。
 
 试卷内容：
@@ -321,7 +954,7 @@ class QuestionManager:
 2. 识别并分离每道题目
 3. 将题目内容转换为LaTeX格式，选择题选项优先使用enumerate环境
 4. 识别题目中引用的图片（如果有），从可用图片列表中选择合适的图片
-5. 为每道题目生成其所考察的知识点标签并生成解答，标签可以参考：{', '.join(available_tags) if available_tags else '立体几何, 导数题, 极值点偏移, 三角函数, 数列, 概率统计, 解析几何, 函数与方程, 不等式, 向量, 复数, 算法与程序框图'}
+5. 为每道题目生成其所考察的知识点标签并生成解答，标签可以参考：{tag_hint}
 6. 返回JSON格式，包含题目列表
 
 请按以下JSON格式回复：
@@ -336,77 +969,65 @@ class QuestionManager:
     ]
 }}
 """
-            
-            self.logger.log_llm_prompt(prompt, "试卷解析")
-            
-            # 调用大语言模型API
-            response = self.llm_client.chat.completions.create(
-                model=LLM_CONFIG["model"],
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=LLM_CONFIG["max_tokens"],
-                temperature=LLM_CONFIG["temperature"]
-            )
-            response = response.choices[0].message.content
-            
-            self.logger.log_llm_response(response, "试卷解析")
-            
-            # 解析响应
-            try:
-                match = re.search(r'\{.*\}', response, re.DOTALL).group(0)
-                match = repair_json(match)
-                result = json.loads(match)
-                questions = result.get('questions', [])
-                
-                # 验证解析结果
-                if not questions:
-                    self.logger.log_warning("大模型没有解析出任何题目", "试卷解析")
-                    return []
-                
-                # 确保每个题目都有必要的字段
-                validated_questions = []
-                for i, question in enumerate(questions):
-                    if not isinstance(question, dict):
-                        self.logger.log_warning(f"题目 {i+1} 不是有效的字典格式", "试卷解析")
-                        continue
-                    
-                    # 处理图片路径映射
-                    question_images = question.get('image', [])
-                    mapped_images = []
-                    if question_images and image_filename_mapping:
-                        for img_filename in question_images:
-                            if img_filename in image_filename_mapping:
-                                mapped_images.append(image_filename_mapping[img_filename])
-                                self.logger.log_image_processing(img_filename, image_filename_mapping[img_filename], "映射")
-                            else:
-                                self.logger.log_warning(f"图片文件 {img_filename} 在映射中未找到", "试卷解析")
-                    
-                    # 确保必要字段存在
-                    validated_question = {
-                        'question': question.get('question', ''),
-                        'image': mapped_images,  # 使用映射后的本地路径
-                        'tags': question.get('tags', []),
-                        'answer': question.get('answer', '')
-                    }
-                    
-                    if not validated_question['question']:
-                        self.logger.log_warning(f"题目 {i+1} 没有题目内容", "试卷解析")
-                        continue
-                    
-                    validated_questions.append(validated_question)
-                
-                duration = time.time() - start_time
-                self.logger.log_performance("试卷解析", duration, f"解析出 {len(validated_questions)} 道题目")
-                self.logger.log_question_parsing(len(validated_questions), "试卷解析")
-                
-                return validated_questions
-                
-            except json.JSONDecodeError as e:
-                self.logger.log_error(e, "JSON解析失败 - 试卷解析")
-                return []
-                
-        except Exception as e:
-            self.logger.log_error(e, "解析试卷失败")
-            return []
+        
+        parser = IncrementalJSONParser()
+        emitted = 0
+        for chunk in self._chat_stream(prompt, "试卷解析"):
+            for event in parser.feed(chunk):
+                if event[0] == 'item' and event[1] == 'questions':
+                    emitted += 1
+                    yield event[2], event[3]
+        
+        if emitted:
+            return
+        
+        # 输出不是规范的JSON时，修复整段响应后再解析
+        try:
+            match = re.search(r'\{.*\}', parser.buffer, re.DOTALL).group(0)
+            match = repair_json(match)
+            result = json.loads(match)
+            yield from enumerate(result.get('questions', []))
+        except (AttributeError, json.JSONDecodeError) as e:
+            self.logger.log_error(e, "JSON解析失败 - 试卷解析")
+    
+    def _validate_parsed_question(self, question, index: int,
+                                  image_filename_mapping: Dict[str, str] = None) -> Optional[Dict]:
+        """
+        校验大模型解析出的题目并把图片文件名映射为本地路径
+        
+        Returns:
+            规范化后的题目字典，无效时返回None
+        """
+        if not isinstance(question, dict):
+            self.logger.log_warning(f"题目 {index+1} 不是有效的字典格式", "试卷解析")
+            return None
+        
+        # 处理图片路径映射
+        question_images = question.get('image', [])
+        mapped_images = []
+        if question_images and image_filename_mapping:
+            for img_filename in question_images:
+                # markdown中的图片引用可能带有目录（如 images/0.jpg），映射表以文件名为键
+                key = img_filename if img_filename in image_filename_mapping else img_filename.rsplit('/', 1)[-1]
+                if key in image_filename_mapping:
+                    mapped_images.append(image_filename_mapping[key])
+                    self.logger.log_image_processing(img_filename, image_filename_mapping[key], "映射")
+                else:
+                    self.logger.log_warning(f"图片文件 {img_filename} 在映射中未找到", "试卷解析")
+        
+        # 确保必要字段存在
+        validated_question = {
+            'question': question.get('question', ''),
+            'image': mapped_images,  # 使用映射后的本地路径
+            'tags': question.get('tags', []),
+            'answer': question.get('answer', '')
+        }
+        
+        if not validated_question['question']:
+            self.logger.log_warning(f"题目 {index+1} 没有题目内容", "试卷解析")
+            return None
+        
+        return validated_question
     
     def delete_question(self, question_id: int, current_user_id: int = None) -> bool:
         """
@@ -419,81 +1040,280 @@ class QuestionManager:
         Returns:
             是否删除成功
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
+            cursor.execute('''
+                SELECT image, latex_content, reference_answer, source FROM questions WHERE id = ? AND user_id = ?
+            ''', (question_id, current_user_id))
+            row = cursor.fetchone()
+            if not row:
+                return False
+
             cursor.execute('DELETE FROM questions WHERE id = ? AND user_id = ?', (question_id, current_user_id))
+            deleted = cursor.rowcount > 0
+            if deleted:
+                self._unindex_fulltext(cursor, [(question_id, row[1], row[2], row[3])])
             conn.commit()
-            return cursor.rowcount > 0
+
+            if self.blob_store and deleted:
+                self.blob_store.release_refs(json.loads(row[0]) if row[0] else [])
+            return deleted
         except Exception as e:
             conn.rollback()
             raise e
         finally:
-            conn.close()
+            cursor.close()
     
-    def get_all_questions(self, limit: int = 100, offset: int = 0, current_user_id: int = None) -> List[Dict]:
+    def get_all_questions(self, limit: int = 100, offset: int = 0, current_user_id: int = None,
+                          after: Tuple = None) -> List[Dict]:
         """
-        获取所有题目（分页，考虑可见性）
+        获取所有题目（分页，考虑可见性），按创建时间倒序
         
         Args:
             limit: 每页数量
             offset: 偏移量
             current_user_id: 当前用户ID
+            after: 键集分页位置 (created_at, id)，给出时应使offset为0
             
         Returns:
             题目列表
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        records, _ = self._query_all(current_user_id, limit, offset, after)
+        return [record.to_dict() for record in records]
+    
+    def _query_all(self, current_user_id: int, limit: int, offset: int = 0,
+                   after: Tuple = None) -> Tuple[List[Question], List[Tuple]]:
+        """查询全部可见题目，返回题目记录及其分页键 (created_at, id)"""
+        params = [current_user_id]
+        keyset = ''
+        if after:
+            keyset = 'AND (created_at, id) < (?, ?)'
+            params.extend(after[:2])
+        params.extend([limit, offset])
         
-        cursor.execute('''
+        # 沿 (created_at, id) 索引倒序扫描，取满一页即停止
+        records, _ = self._fetch_records(f'''
             SELECT * FROM questions 
-            WHERE visibility = 'public' OR user_id = ?
-            ORDER BY created_at DESC 
+            WHERE (+visibility = 'public' OR +user_id = ?)
+            {keyset}
+            ORDER BY created_at DESC, id DESC
             LIMIT ? OFFSET ?
-        ''', (current_user_id, limit, offset))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        questions = []
-        for row in rows:
-            question = self._row_to_dict(row)
-            questions.append(question)
-        
-        return questions
+        ''', params)
+        return records, [(record.created_at, record.id) for record in records]
     
-    def search_questions(self, keyword: str, current_user_id: int = None) -> List[Dict]:
+    def search_questions(self, keyword: str, current_user_id: int = None,
+                         limit: int = None, offset: int = 0, after: Tuple = None) -> List[Dict]:
         """
-        根据关键词搜索题目（考虑可见性）
+        根据关键词搜索题目（考虑可见性），结果按BM25相关度排序
         
         Args:
-            keyword: 搜索关键词
+            keyword: 搜索关键词，多个关键词以空格分隔（需同时匹配）
             current_user_id: 当前用户ID
+            limit: 每页数量，为None时返回全部匹配
+            offset: 偏移量
+            after: 键集分页位置，取自上一页最后一条的分页键
             
         Returns:
             匹配的题目列表
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        records, _ = self._query_keyword(keyword, current_user_id, limit, offset, after)
+        return [record.to_dict() for record in records]
+    
+    def _query_keyword(self, keyword: str, current_user_id: int, limit: int, offset: int = 0,
+                       after: Tuple = None) -> Tuple[List[Question], List[Tuple]]:
+        """
+        关键词查询，返回题目记录及其分页键
         
-        cursor.execute('''
+        全文检索的分页键为 (bm25得分, id, 排序窗口下界)，窗口下界随游标传递，
+        保证翻页期间参与排序的命中集合不变；LIKE退化路径的分页键为 (created_at, id)。
+        """
+        match_query = build_match_query(keyword) if self.fts_enabled else ''
+        if not match_query:
+            return self._query_keyword_like(keyword, current_user_id, limit, offset, after)
+        
+        if after:
+            min_rowid = after[2]
+        else:
+            # 高频词（如 \frac）命中量巨大时，只对最新的 rank_window 条命中计算BM25
+            min_rowid = self._fts_rank_window_floor(match_query)
+        
+        score = f"bm25(questions_fts, {', '.join(str(w) for w in self._FTS_WEIGHTS)})"
+        params = [match_query, min_rowid, current_user_id]
+        keyset = ''
+        if after:
+            keyset = f'AND ({score} > ? OR ({score} = ? AND q.id < ?))'
+            params.extend([after[0], after[0], after[1]])
+        params.extend([limit if limit is not None else -1, offset])
+        
+        records, rows = self._fetch_records(f'''
+            SELECT q.*, {score} AS search_score FROM questions_fts f
+            JOIN questions q ON q.id = f.rowid
+            WHERE questions_fts MATCH ? AND f.rowid >= ?
+            AND (q.visibility = 'public' OR q.user_id = ?)
+            {keyset}
+            ORDER BY search_score, q.id DESC
+            LIMIT ? OFFSET ?
+        ''', params)
+        return records, [(row[-1], record.id, min_rowid) for row, record in zip(rows, records)]
+    
+    def _fts_rank_window_floor(self, match_query: str) -> int:
+        """
+        计算参与相关度排序的最小题目ID：命中数不超过排序窗口时为0，
+        否则为倒数第 rank_window 条命中的ID（FTS5按rowid倒序扫描可提前结束）
+        """
+        window = SEARCH_CONFIG.get("rank_window", 0)
+        if not window:
+            return 0
+        rows = self._fetch_rows('''
+            SELECT rowid FROM questions_fts WHERE questions_fts MATCH ?
+            ORDER BY rowid DESC LIMIT 1 OFFSET ?
+        ''', (match_query, window - 1))
+        return rows[0][0] if rows else 0
+    
+    def _query_keyword_like(self, keyword: str, current_user_id: int, limit: int, offset: int = 0,
+                            after: Tuple = None) -> Tuple[List[Question], List[Tuple]]:
+        """在FTS5不可用或关键词无法分词时使用的LIKE扫描搜索"""
+        params = [f'%{keyword}%', f'%{keyword}%', current_user_id]
+        keyset = ''
+        if after:
+            keyset = 'AND (created_at, id) < (?, ?)'
+            params.extend(after[:2])
+        params.extend([limit if limit is not None else -1, offset])
+        
+        records, _ = self._fetch_records(f'''
             SELECT * FROM questions 
             WHERE (latex_content LIKE ? OR source LIKE ?)
             AND (visibility = 'public' OR user_id = ?)
-            ORDER BY created_at DESC
-        ''', (f'%{keyword}%', f'%{keyword}%', current_user_id))
+            {keyset}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ? OFFSET ?
+        ''', params)
+        return records, [(record.created_at, record.id) for record in records]
+    
+    def search_page(self, current_user_id: int = None, tags: List[str] = None, match: str = 'any',
+                    keyword: str = None, limit: int = 20, cursor: str = None,
+                    count_cap: int = None) -> Dict:
+        """
+        键集分页搜索：标签、关键词、全部题目三种查询共用
         
-        rows = cursor.fetchall()
-        conn.close()
+        Args:
+            current_user_id: 当前用户ID
+            tags: 标签筛选（优先于关键词）
+            match: 标签匹配方式 any/all
+            keyword: 搜索关键词
+            limit: 每页数量
+            cursor: 上一页返回的 next_cursor，为None时从第一页开始
+            count_cap: 统计总数时的上限，超过上限时总数为估计值
+            
+        Returns:
+            {'questions', 'next_cursor', 'has_more', 'total', 'total_is_estimate'}，
+            总数只在第一页（cursor为None）时统计，之后的页为None
+            
+        Raises:
+            ValueError: 游标无效或与查询条件不匹配
+        """
+        kind = 'tags' if tags else ('keyword' if keyword else 'all')
+        if kind == 'keyword' and not (self.fts_enabled and build_match_query(keyword)):
+            # LIKE退化路径的分页键结构不同，使用单独的游标类型
+            kind = 'keyword_like'
+        after = decode_cursor(cursor, kind, _CURSOR_SHAPES[kind]) if cursor else None
+        
+        # 多取一条用于判断是否还有下一页
+        if kind == 'tags':
+            records, keys = self._query_by_tags(tags, current_user_id, match, limit + 1, after)
+        elif kind in ('keyword', 'keyword_like'):
+            records, keys = self._query_keyword(keyword, current_user_id, limit + 1, 0, after)
+        else:
+            records, keys = self._query_all(current_user_id, limit + 1, 0, after)
+        
+        has_more = len(records) > limit
+        records, keys = records[:limit], keys[:limit]
+        
+        total, total_is_estimate = None, False
+        if cursor is None:
+            total, total_is_estimate = self.count_questions(current_user_id, tags, match, keyword, count_cap)
+        
+        return {
+            'questions': [record.to_dict() for record in records],
+            'next_cursor': encode_cursor(kind, keys[-1]) if has_more and keys else None,
+            'has_more': has_more,
+            'total': total,
+            'total_is_estimate': total_is_estimate
+        }
+    
+    def count_questions(self, current_user_id: int = None, tags: List[str] = None, match: str = 'any',
+                        keyword: str = None, cap: int = None) -> Tuple[int, bool]:
+        """
+        统计搜索条件下的可见题目数
+        
+        Args:
+            current_user_id: 当前用户ID
+            tags: 标签筛选
+            match: 标签匹配方式 any/all
+            keyword: 搜索关键词
+            cap: 计数上限，为None时精确统计
+            
+        Returns:
+            (题目数, 是否为达到上限后的估计值)
+        """
+        match_query = build_match_query(keyword) if keyword and self.fts_enabled else ''
+        if tags:
+            tag_filter, params = self._tag_filter_clause(tags, match)
+            params.append(current_user_id)
+            inner = f"""
+                SELECT 1 FROM questions WHERE id IN ({tag_filter})
+                AND (+visibility = 'public' OR +user_id = ?)
+            """
+        elif match_query:
+            params = [match_query, current_user_id]
+            inner = """
+                SELECT 1 FROM questions_fts f JOIN questions q ON q.id = f.rowid
+                WHERE questions_fts MATCH ? AND (q.visibility = 'public' OR q.user_id = ?)
+            """
+        elif keyword:
+            params = [f'%{keyword}%', f'%{keyword}%', current_user_id]
+            inner = """
+                SELECT 1 FROM questions WHERE (latex_content LIKE ? OR source LIKE ?)
+                AND (visibility = 'public' OR user_id = ?)
+            """
+        else:
+            params = [current_user_id]
+            inner = "SELECT 1 FROM questions WHERE visibility = 'public' OR user_id = ?"
+        
+        params.append(cap + 1 if cap else -1)
+        rows = self._fetch_rows(f"SELECT COUNT(*) FROM ({inner} LIMIT ?)", params)
+        total = rows[0][0]
         
-        questions = []
-        for row in rows:
-            question = self._row_to_dict(row)
-            questions.append(question)
+        if cap and total > cap:
+            return cap, True
+        return total, False
+    
+    def _fetch_records(self, query: str, params) -> Tuple[List[Question], List[Tuple]]:
+        """执行查询，返回解码后的题目记录和原始行"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
         
-        return questions
+        try:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            records = self._rows_to_records(cursor, rows)
+        finally:
+            cursor.close()
+        
+        return records, rows
+    
+    def _fetch_rows(self, query: str, params) -> List[Tuple]:
+        """执行查询，返回原始行"""
+        conn = get_connection(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
     
     def get_question_stats(self, current_user_id: int = None) -> Dict:
         """
@@ -505,7 +1325,7 @@ class QuestionManager:
         Returns:
             统计信息字典
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         # 总题目数（可见的）
@@ -519,7 +1339,7 @@ class QuestionManager:
         cursor.execute('SELECT COUNT(*) FROM questions WHERE user_id = ?', (current_user_id,))
         my_questions = cursor.fetchone()[0]
         
-        conn.close()
+        cursor.close()
         
         return {
             'total': total,
@@ -527,37 +1347,15 @@ class QuestionManager:
         }
     
     def _row_to_dict(self, row) -> Dict:
-        """将数据库行转换为字典"""
+        """将数据库行转换为字典（按初始化时解析的列布局）"""
         if not row:
             return None
-        
-        # 获取列信息以正确处理ALTER TABLE后的列顺序
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA table_info(questions)")
-        columns_info = cursor.fetchall()
-        conn.close()
-        
-        # 创建列名到索引的映射
-        column_map = {col[1]: idx for idx, col in enumerate(columns_info)}
-        
-        # 安全地获取列值，处理可能不存在的列
-        def get_column_value(column_name, default=None):
-            if column_name in column_map:
-                idx = column_map[column_name]
-                if idx < len(row):
-                    return row[idx]
-            return default
-        
-        return {
-            'id': get_column_value('id'),
-            'latex_content': get_column_value('latex_content'),
-            'tags': json.loads(get_column_value('tags', '[]')),
-            'reference_answer': get_column_value('reference_answer'),
-            'source': get_column_value('source'),
-            'image': json.loads(get_column_value('image', '[]')) if get_column_value('image') else [],
-            'user_id': get_column_value('user_id'),
-            'visibility': get_column_value('visibility', 'public'),
-            'created_at': get_column_value('created_at'),
-            'updated_at': get_column_value('updated_at')
-        }
+        return self._row_decoder.decode(row).to_dict()
+    
+    def _rows_to_records(self, cursor, rows) -> List[Question]:
+        """按游标的列布局将多行解码为题目记录"""
+        return QuestionRowDecoder.for_cursor(cursor).decode_all(rows)
+    
+    def _rows_to_dicts(self, cursor, rows, fields: List[str] = None) -> List[Dict]:
+        """按游标的列布局将多行转换为字典，fields不含tags/image时不会解码对应JSON"""
+        return [question.to_dict(fields) for question in self._rows_to_records(cursor, rows)]
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+题目记录模块 - 数据库行解码与紧凑题目对象
+"""
+
+import json
+import threading
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+
+class Question:
+    """紧凑的题目记录，tags/image 的JSON在首次访问时才解码"""
+
+    __slots__ = ('id', 'latex_content', 'reference_answer', 'source', 'user_id',
+                 'visibility', 'created_at', 'updated_at',
+                 '_tags_raw', '_tags', '_image_raw', '_image')
+
+    def __init__(self, id=None, latex_content=None, tags_raw=None, reference_answer=None,
+                 source=None, image_raw=None, user_id=None, visibility='public',
+                 created_at=None, updated_at=None):
+        self.id = id
+        self.latex_content = latex_content
+        self.reference_answer = reference_answer
+        self.source = source
+        self.user_id = user_id
+        self.visibility = visibility
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self._tags_raw = tags_raw
+        self._tags = None
+        self._image_raw = image_raw
+        self._image = None
+
+    @property
+    def tags(self) -> List[str]:
+        """标签列表（惰性解码）"""
+        if self._tags is None:
+            self._tags = _decode_json_list(self._tags_raw)
+        return self._tags
+
+    @property
+    def image(self) -> List[str]:
+        """图片路径列表（惰性解码）"""
+        if self._image is None:
+            self._image = _decode_json_list(self._image_raw)
+        return self._image
+
+    def to_dict(self, fields: Iterable[str] = None) -> Dict:
+        """
+        转换为字典
+
+        Args:
+            fields: 需要输出的字段，为None时输出全部字段
+
+        Returns:
+            题目信息字典
+        """
+        names = QUESTION_FIELDS if fields is None else fields
+        return {name: getattr(self, name) for name in names}
+
+    def __repr__(self):
+        return f"Question(id={self.id!r}, source={self.source!r})"
+
+
+# 对外输出的题目字段（与原 _row_to_dict 返回的键保持一致）
+QUESTION_FIELDS = ('id', 'latex_content', 'tags', 'reference_answer', 'source', 'image',
+                   'user_id', 'visibility', 'created_at', 'updated_at')
+
+# 数据库列名 -> Question 构造参数名
+_COLUMN_TO_ARG = {
+    'id': 'id',
+    'latex_content': 'latex_content',
+    'tags': 'tags_raw',
+    'reference_answer': 'reference_answer',
+    'source': 'source',
+    'image': 'image_raw',
+    'user_id': 'user_id',
+    'visibility': 'visibility',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at'
+}
+
+
+def _decode_json_list(raw) -> List:
+    """解码JSON列表字段，空值返回空列表"""
+    if not raw or raw == '[]':
+        return []
+    return json.loads(raw)
+
+
+class QuestionRowDecoder:
+    """按预先计算的列索引把 questions 表的行映射为 Question
+
+    列布局只在首次遇到（或表结构迁移后列名变化）时解析一次，
+    之后每行只做下标取值，不再查询 PRAGMA table_info。
+    """
+
+    _cache: Dict[Tuple[str, ...], 'QuestionRowDecoder'] = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, column_names: Sequence[str]):
+        """
+        初始化行解码器
+
+        Args:
+            column_names: 查询结果的列名，顺序与行中的值一致
+        """
+        self.column_names = tuple(column_names)
+        self._plan = [(_COLUMN_TO_ARG[name], idx) for idx, name in enumerate(self.column_names)
+                      if name in _COLUMN_TO_ARG]
+
+    @classmethod
+    def for_cursor(cls, cursor) -> 'QuestionRowDecoder':
+        """
+        获取与游标结果列布局对应的解码器（按列名缓存）
+
+        Args:
+            cursor: 已执行查询的游标
+
+        Returns:
+            行解码器
+        """
+        column_names = tuple(col[0] for col in cursor.description)
+        decoder = cls._cache.get(column_names)
+        if decoder is None:
+            with cls._cache_lock:
+                decoder = cls._cache.setdefault(column_names, cls(column_names))
+        return decoder
+
+    @classmethod
+    def invalidate(cls):
+        """表结构迁移后清空已编译的解码器"""
+        with cls._cache_lock:
+            cls._cache.clear()
+
+    def decode(self, row) -> Question:
+        """
+        将单行解码为 Question
+
+        Args:
+            row: 数据库行
+
+        Returns:
+            题目记录
+        """
+        return Question(**{arg: row[idx] for arg, idx in self._plan})
+
+    def decode_all(self, rows) -> List[Question]:
+        """批量解码多行"""
+        decode = self.decode
+        return [decode(row) for row in rows]
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+reportlab PDF渲染器 - 不依赖TeX环境、在进程内直接排版试卷
+"""
+
+import hashlib
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+from config import PDF_EXPORT_CONFIG
+try:
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.platypus import HRFlowable, Image, Paragraph, SimpleDocTemplate, Spacer
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+try:
+    from matplotlib.font_manager import FontProperties
+    from matplotlib.mathtext import MathTextParser, math_to_image
+    MATPLOTLIB_AVAILABLE = True
+except ImportError:
+    MATPLOTLIB_AVAILABLE = False
+
+# 内置的中文CID字体，由PDF阅读器提供字形，无需字体文件
+CJK_FONT = 'STSong-Light'
+
+# 数学公式：$$...$$、\[...\]、$...$、\(...\)
+_MATH_RE = re.compile(r'\$\$(.+?)\$\$|\\\[(.+?)\\\]|\$(.+?)\$|\\\((.+?)\\\)', re.S)
+
+# 公式的文本回退中替换为Unicode字符的命令
+_SYMBOLS = {
+    'le': '≤', 'leq': '≤', 'ge': '≥', 'geq': '≥', 'ne': '≠', 'neq': '≠', 'times': '×', 'cdot': '·',
+    'div': '÷', 'pm': '±', 'infty': '∞', 'in': '∈', 'notin': '∉', 'subset': '⊂', 'subseteq': '⊆',
+    'cup': '∪', 'cap': '∩', 'emptyset': '∅', 'varnothing': '∅', 'forall': '∀', 'exists': '∃',
+    'rightarrow': '→', 'Rightarrow': '⇒', 'Leftrightarrow': '⇔', 'angle': '∠', 'perp': '⊥',
+    'parallel': '∥', 'triangle': '△', 'circ': '°', 'approx': '≈', 'sim': '∼', 'cdots': '⋯',
+    'ldots': '…', 'alpha': 'α', 'beta': 'β', 'gamma': 'γ', 'delta': 'δ', 'theta': 'θ',
+    'lambda': 'λ', 'mu': 'μ', 'pi': 'π', 'sigma': 'σ', 'varphi': 'φ', 'phi': 'φ', 'omega': 'ω',
+    'Delta': 'Δ', 'Omega': 'Ω'
+}
+
+_formula_lock = threading.Lock()
+_fonts_registered = False
+
+
+def _register_fonts():
+    """注册中文字体（只需一次）"""
+    global _fonts_registered
+    if not _fonts_registered:
+        pdfmetrics.registerFont(UnicodeCIDFont(CJK_FONT))
+        _fonts_registered = True
+
+
+@lru_cache(maxsize=PDF_EXPORT_CONFIG["formula_cache_size"])
+def _render_formula(formula_dir: str, formula: str, font_size: float) -> Optional[Tuple[str, float, float, float]]:
+    """
+    用matplotlib mathtext把公式渲染为PNG（按公式内容缓存，同一公式在各份试卷中只渲染一次）
+
+    Args:
+        formula_dir: 公式图片的缓存目录
+        formula: LaTeX公式（不含定界符）
+        font_size: 字号（磅）
+
+    Returns:
+        (图片路径, 宽, 高, 基线以下深度)，单位为磅；mathtext无法解析时返回None
+    """
+    # mathtext不支持中文，也不认识 \dfrac 等写法
+    if not MATPLOTLIB_AVAILABLE or not formula.isascii():
+        return None
+    expression = re.sub(r'\\[dt]frac\b', r'\\frac', formula)
+    expression = re.sub(r'\\text\b', r'\\mathrm', expression)
+    expression = f'${expression}$'
+
+    prop = FontProperties(size=font_size)
+    key = hashlib.sha256(f'{expression}|{font_size}'.encode('utf-8')).hexdigest()
+    path = os.path.join(formula_dir, f'{key}.png')
+    try:
+        with _formula_lock:
+            width, height, depth, _, _ = MathTextParser('path').parse(expression, dpi=72, prop=prop)
+            if not os.path.exists(path):
+                tmp_path = f'{path}.{threading.get_ident()}.tmp'
+                math_to_image(expression, tmp_path, prop=prop, dpi=PDF_EXPORT_CONFIG["formula_dpi"], format='png')
+                os.replace(tmp_path, path)
+    except (ValueError, RuntimeError):
+        return None
+    return path, width, height, depth
+
+
+def _formula_text(formula: str) -> str:
+    """公式无法渲染为图片时，转换为近似的可读文本（返回Paragraph标记）"""
+    text = formula
+    for _ in range(3):
+        text = re.sub(r'\\[dt]?frac\{([^{}]*)\}\{([^{}]*)\}', r'(\1)/(\2)', text)
+    text = re.sub(r'\\sqrt\{([^{}]*)\}', r'√(\1)', text)
+    text = re.sub(r'\\([A-Za-z]+)', lambda m: _SYMBOLS.get(m.group(1), '' if m.group(1) in ('left', 'right') else m.group(1)), text)
+    text = escape(text)
+    text = re.sub(r'\^\{([^{}]*)\}|\^(\S)', lambda m: f'<super>{m.group(1) or m.group(2)}</super>', text)
+    text = re.sub(r'_\{([^{}]*)\}|_(\S)', lambda m: f'<sub>{m.group(1) or m.group(2)}</sub>', text)
+    return f'<i>{text.replace("{", "").replace("}", "")}</i>'
+
+
+def _text_markup(text: str) -> str:
+    """把题目中公式以外的文本转换为Paragraph标记（列表、加粗等常见命令）"""
+    text = re.sub(r'\\begin\{(?:enumerate|itemize)\}(?:\[[^\]]*\])?|\\end\{(?:enumerate|itemize)\}', '\n', text)
+    text = text.replace('\\\\', '\n')
+    text = re.sub(r'\\item\s*', '\n• ', text)
+    text = escape(text)
+    text = re.sub(r'\\textbf\{([^{}]*)\}', r'<b>\1</b>', text)
+    text = re.sub(r'\\(?:textit|emph)\{([^{}]*)\}', r'<i>\1</i>', text)
+    text = re.sub(r'\\(?:text|mathrm)\{([^{}]*)\}', r'\1', text)
+    text = re.sub(r'\\q?quad\b', '　', text)
+    return text
+
+
+class ReportlabRenderer:
+    """用reportlab直接生成试卷PDF"""
+
+    def __init__(self, upload_folder: str, formula_dir: str):
+        """
+        初始化渲染器
+
+        Args:
+            upload_folder: 上传根目录（解析题目图片路径）
+            formula_dir: 公式图片的缓存目录
+        """
+        self.upload_folder = upload_folder
+        self.formula_dir = formula_dir
+        os.makedirs(formula_dir, exist_ok=True)
+        self.font_size = 11
+        self._styles = None
+
+    def render(self, questions: List[Dict], mode: str, title: str, output_path: str, date_text: str):
+        """
+        生成PDF文件
+
+        Args:
+            questions: 题目列表
+            mode: 导出模式 (questions/with-answers)
+            title: 试卷标题
+            output_path: 输出文件路径
+            date_text: 标题下方显示的日期
+        """
+        _register_fonts()
+        styles = self._get_styles()
+        doc = SimpleDocTemplate(output_path, pagesize=A4, title=title,
+                                leftMargin=2.5 * cm, rightMargin=2.5 * cm, topMargin=2.5 * cm, bottomMargin=2.5 * cm)
+
+        story = [
+            Paragraph(escape(title), styles['title']),
+            Paragraph(escape(date_text), styles['date']),
+            Spacer(1, 0.5 * cm),
+            HRFlowable(width='100%', thickness=0.8),
+            Spacer(1, 0.4 * cm)
+        ]
+
+        for i, question in enumerate(questions, 1):
+            story.append(Paragraph(f'题目 {i}', styles['heading']))
+            story.extend(self._content_flowables(question.get('latex_content', ''), styles['body']))
+
+            for img_path in question.get('image', []) or []:
+                image = self._image_flowable(img_path, doc.width, doc.height)
+                if image is not None:
+                    story.append(image)
+
+            if mode == 'with-answers' and question.get('reference_answer'):
+                story.append(Paragraph('参考解答', styles['subheading']))
+                story.extend(self._content_flowables(question['reference_answer'], styles['body']))
+
+            if i < len(questions):
+                story.extend([Spacer(1, 0.3 * cm), HRFlowable(width='100%', thickness=0.4),
+                              Spacer(1, 0.3 * cm)])
+
+        doc.build(story)
+
+    def _get_styles(self) -> Dict:
+        """段落样式（中文字体、按字符换行）"""
+        if self._styles is None:
+            base = getSampleStyleSheet()
+            self._styles = {
+                'title': ParagraphStyle('PaperTitle', parent=base['Title'], fontName=CJK_FONT, fontSize=18,
+                                        leading=24, wordWrap='CJK'),
+                'date': ParagraphStyle('PaperDate', parent=base['Normal'], fontName=CJK_FONT, fontSize=10,
+                                       alignment=TA_CENTER),
+                'heading': ParagraphStyle('QuestionHeading', parent=base['Heading2'], fontName=CJK_FONT,
+                                          fontSize=13, leading=18, wordWrap='CJK'),
+                'subheading': ParagraphStyle('AnswerHeading', parent=base['Heading3'], fontName=CJK_FONT,
+                                             fontSize=12, leading=16, wordWrap='CJK'),
+                'body': ParagraphStyle('QuestionBody', parent=base['Normal'], fontName=CJK_FONT,
+                                       fontSize=self.font_size, leading=self.font_size * 1.8, wordWrap='CJK',
+                                       spaceAfter=4),
+                'display': ParagraphStyle('DisplayMath', parent=base['Normal'], fontName=CJK_FONT,
+                                          fontSize=self.font_size, leading=self.font_size * 1.8,
+                                          alignment=TA_CENTER, spaceBefore=4, spaceAfter=4)
+            }
+        return self._styles
+
+    def _content_flowables(self, content: str, style) -> List:
+        """
+        把题目/解答文本排成段落：行内公式嵌入段落，行间公式单独居中成段
+
+        Args:
+            content: 含LaTeX公式的文本
+            style: 正文段落样式
+
+        Returns:
+            flowable列表
+        """
+        flowables = []
+        parts: List[str] = []
+
+        def flush():
+            markup = ''.join(parts).strip('\n').replace('\n', '<br/>')
+            parts.clear()
+            if markup.strip():
+                flowables.append(Paragraph(markup, style))
+
+        position = 0
+        for match in _MATH_RE.finditer(content or ''):
+            self._append_text(content[position:match.start()], parts, flush)
+            position = match.end()
+            display_formula = match.group(1) or match.group(2)
+            if display_formula is not None:
+                flush()
+                flowables.append(Paragraph(self._formula_markup(display_formula.strip(), self.font_size * 1.2),
+                                           self._get_styles()['display']))
+            else:
+                parts.append(self._formula_markup((match.group(3) or match.group(4)).strip(), self.font_size))
+        self._append_text(content[position:] if content else '', parts, flush)
+        flush()
+        return flowables
+
+    @staticmethod
+    def _append_text(text: str, parts: List[str], flush):
+        """追加普通文本，空行处分段"""
+        for index, block in enumerate(re.split(r'\n\s*\n', text)):
+            if index > 0:
+                flush()
+            parts.append(_text_markup(block))
+
+    def _formula_markup(self, formula: str, font_size: float) -> str:
+        """公式对应的Paragraph标记：渲染成功时为内嵌图片，否则为近似文本"""
+        rendered = _render_formula(self.formula_dir, formula, font_size)
+        if rendered is not None and not os.path.exists(rendered[0]):
+            # 图片已被临时区清理，绕过内存缓存重新渲染（文件名不变，缓存项随之恢复有效）
+            rendered = _render_formula.__wrapped__(self.formula_dir, formula, font_size)
+        if rendered is None:
+            return _formula_text(formula)
+        path, width, height, depth = rendered
+        return f'<img src="{escape(path)}" width="{width:.2f}" height="{height:.2f}" valign="{-depth:.2f}"/>'
+
+    def _image_flowable(self, img_path: str, max_width: float, max_height: float):
+        """题目图片，按版心宽度的80%和高度的60%等比缩放；文件不存在或无法读取时返回None"""
+        if not img_path or not img_path.startswith('/uploads/'):
+            return None
+        local_path = os.path.join(self.upload_folder, *img_path[len('/uploads/'):].split('/'))
+        if not os.path.exists(local_path):
+            return None
+        try:
+            width, height = ImageReader(local_path).getSize()
+        except Exception:
+            return None
+        scale = min(1.0, max_width * 0.8 / width, max_height * 0.6 / height)
+        return Image(local_path, width=width * scale, height=height * scale)
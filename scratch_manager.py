@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+导出临时区管理模块 - 导出文件与编译中间文件的容量上限、过期淘汰和后台清理
+"""
+
+import multiprocessing
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Tuple
+from config import EXPORT_SCRATCH_CONFIG
+from logger import get_logger
+
+# 编译中间文件所在的子目录，单独按较短的保留期清理
+BUILD_DIR = 'build'
+
+# 预编译的导言区格式文件（及其源文件）可长期复用，不参与清理
+_PERSISTENT_RE = re.compile(r'^preamble_[0-9a-f]+\.(?:fmt|tex)$')
+
+# 旧版本直接写在上传根目录中的导出文件
+_LEGACY_EXPORT_RE = re.compile(r'^paper_[0-9a-f]{8}\.(?:docx|tex|pdf|aux|log|out)$')
+
+
+class ScratchManager:
+    """
+    导出临时区
+
+    所有导出结果（Word、PDF缓存、公式图片）和编译中间文件都写在临时区中，与用户上传的图片分开。
+    后台线程定期清理：
+    1. 编译目录中超过 build_max_age_seconds 的中间文件（中断的编译遗留）；
+    2. 超过 max_age_seconds 未被使用的文件（按修改时间，PDF缓存命中时会更新）；
+    3. 总大小超过 max_bytes 时，按最久未使用的顺序删除直到低于上限。
+    """
+
+    def __init__(self, root: str = None, upload_folder: str = None):
+        """
+        初始化临时区
+
+        Args:
+            root: 临时区根目录，默认取配置
+            upload_folder: 上传根目录，清理时顺带删除旧版本遗留在其中的导出文件
+        """
+        self.root = root or EXPORT_SCRATCH_CONFIG["root"]
+        self.upload_folder = upload_folder
+        self.max_bytes = EXPORT_SCRATCH_CONFIG["max_bytes"]
+        self.max_age = EXPORT_SCRATCH_CONFIG["max_age_seconds"]
+        self.build_max_age = EXPORT_SCRATCH_CONFIG["build_max_age_seconds"]
+        self.sweep_interval = EXPORT_SCRATCH_CONFIG["sweep_interval"]
+        self.logger = get_logger()
+        os.makedirs(self.root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._metrics = {
+            'sweeps': 0,
+            'files_reclaimed': 0,
+            'bytes_reclaimed': 0,
+            'reclaimed_by_reason': {'build': 0, 'age': 0, 'size': 0, 'legacy': 0},
+            'files': 0,
+            'bytes': 0,
+            'last_sweep_at': None,
+            'last_sweep_seconds': None
+        }
+
+    def path(self, category: str) -> str:
+        """获取（并创建）临时区中某类文件的目录，如 pdf/docx/formulas/build"""
+        directory = os.path.join(self.root, category)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def start(self):
+        """启动后台清理线程（重复调用无副作用；在子进程中不启动）"""
+        if self._thread is not None or multiprocessing.current_process().name != 'MainProcess':
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sweep_loop, name='export-scratch-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台清理线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def sweep(self) -> Dict:
+        """
+        执行一次清理
+
+        Returns:
+            本次清理结果：{'files': 删除文件数, 'bytes': 释放字节数}
+        """
+        start_time = time.time()
+        now = start_time
+        reclaimed = {'build': [0, 0], 'age': [0, 0], 'size': [0, 0], 'legacy': [0, 0]}
+        kept: List[Tuple[float, int, str]] = []
+
+        build_root = os.path.join(self.root, BUILD_DIR)
+        for path, size, mtime in self._iter_files(self.root):
+            if _PERSISTENT_RE.match(os.path.basename(path)):
+                continue
+            in_build = os.path.dirname(path) == build_root
+            if in_build and now - mtime > self.build_max_age:
+                self._reclaim(path, size, reclaimed['build'])
+            elif now - mtime > self.max_age:
+                self._reclaim(path, size, reclaimed['age'])
+            else:
+                kept.append((mtime, size, path))
+
+        # 超出容量上限时按最久未使用淘汰
+        total = sum(size for _, size, _ in kept)
+        if total > self.max_bytes:
+            kept.sort()
+            while kept and total > self.max_bytes:
+                _, size, path = kept.pop(0)
+                if self._reclaim(path, size, reclaimed['size']):
+                    total -= size
+
+        if self.upload_folder:
+            for path, size, _ in self._iter_files(self.upload_folder, recursive=False):
+                if _LEGACY_EXPORT_RE.match(os.path.basename(path)):
+                    self._reclaim(path, size, reclaimed['legacy'])
+
+        files = sum(count for count, _ in reclaimed.values())
+        freed = sum(size for _, size in reclaimed.values())
+        elapsed = time.time() - start_time
+        with self._lock:
+            metrics = self._metrics
+            metrics['sweeps'] += 1
+            metrics['files_reclaimed'] += files
+            metrics['bytes_reclaimed'] += freed
+            for reason, (count, _) in reclaimed.items():
+                metrics['reclaimed_by_reason'][reason] += count
+            metrics['files'] = len(kept)
+            metrics['bytes'] = total
+            metrics['last_sweep_at'] = now
+            metrics['last_sweep_seconds'] = elapsed
+
+        if files:
+            self.logger.log_system_info(f"清理导出临时文件 {files} 个，释放 {freed / 1024 / 1024:.1f}MB")
+        return {'files': files, 'bytes': freed}
+
+    def get_metrics(self) -> Dict:
+        """获取清理统计（累计回收量与最近一次清理后的占用）"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['reclaimed_by_reason'] = dict(self._metrics['reclaimed_by_reason'])
+        metrics['max_bytes'] = self.max_bytes
+        return metrics
+
+    def _sweep_loop(self):
+        """后台线程：启动时清理一次，之后按间隔清理"""
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                self.logger.log_error(e, "清理导出临时文件失败")
+            if self._stop.wait(self.sweep_interval):
+                break
+
+    @staticmethod
+    def _iter_files(directory: str, recursive: bool = True):
+        """遍历目录中的文件，产出 (路径, 大小, 修改时间)"""
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        yield from ScratchManager._iter_files(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    yield entry.path, stat.st_size, stat.st_mtime
+            except FileNotFoundError:
+                continue
+
+    @staticmethod
+    def _reclaim(path: str, size: int, counter: List[int]) -> bool:
+        """删除文件并计数，文件已被删除时返回False"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        counter[0] += 1
+        counter[1] += size
+        return True
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+全文检索模块 - 面向中文与LaTeX的FTS5分词
+"""
+
+import re
+from typing import List
+
+# FTS5表使用unicode61分词器，并将反斜杠视为词内字符以保留LaTeX命令
+FTS_TOKENIZE = "unicode61 remove_diacritics 0 tokenchars '\\'"
+
+# 中日韩统一表意文字（含扩展A区与兼容区）
+_CJK_CHAR = r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]'
+
+# 分词：LaTeX控制序列、单个汉字、连续的字母数字
+_TOKEN_RE = re.compile(r'\\[A-Za-z]+|' + _CJK_CHAR + r'|[0-9A-Za-z\u00c0-\u024f\u0370-\u03ff]+')
+_CJK_RE = re.compile(_CJK_CHAR)
+
+
+def segment_text(text: str) -> str:
+    """
+    将文本切分为以空格分隔的词元，供FTS5的unicode61分词器索引
+
+    汉字逐字成词（查询时用短语匹配还原连续子串），
+    LaTeX控制序列（如 \\frac）作为独立词元保留反斜杠。
+    索引是无内容表，删除时依赖同样的分词结果，修改分词规则后需新增迁移重建索引。
+    分词在应用内完成，由题目管理器直接写入索引行（不依赖注册到连接上的SQL函数，
+    其它连接如sqlite3命令行写入questions表时不会因缺少函数而失败）。
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        空格分隔的词元串
+    """
+    if not text:
+        return ''
+    return ' '.join(_TOKEN_RE.findall(text)).lower()
+
+
+def build_match_query(keyword: str) -> str:
+    """
+    将用户关键词转换为FTS5 MATCH表达式
+
+    每个以空白分隔的关键词转换为一个短语（汉字相邻即连续子串匹配），
+    以字母数字结尾的短语按前缀匹配，多个关键词之间为AND关系。
+
+    Args:
+        keyword: 用户输入的关键词
+
+    Returns:
+        MATCH表达式，关键词中没有可检索的词元时返回空字符串
+    """
+    phrases: List[str] = []
+    for term in (keyword or '').split():
+        tokens = _TOKEN_RE.findall(term.lower())
+        if not tokens:
+            continue
+        phrase = '"' + ' '.join(token.replace('"', '""') for token in tokens) + '"'
+        if not _CJK_RE.fullmatch(tokens[-1]) and not tokens[-1].startswith('\\'):
+            phrase += ' *'
+        phrases.append(phrase)
+    return ' AND '.join(phrases)
+
@@ -329,6 +329,7 @@ async function handleReExport() {
     const title = document.getElementById('re-export-title').value || '数学试卷';
     const mode = document.querySelector('input[name="re-export-mode"]:checked').value;
     const format = document.querySelector('input[name="re-export-format"]:checked').value;
+    const pdfEngine = document.querySelector('input[name="re-pdf-engine"]:checked').value;
     
     try {
         showLoading(true);
@@ -339,14 +340,27 @@ async function handleReExport() {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                questions: window.currentReExportQuestions,
+                question_ids: window.currentReExportQuestions.map(question => question.id),
                 title: title,
                 mode: mode,
-                format: format
+                format: format,
+                pdf_engine: pdfEngine
             })
         });
         
-        if (response.ok) {
+        if (response.status === 202) {
+            // Word/PDF在后台生成，完成后下载
+            const submitted = await response.json();
+            await waitForExport(submitted.status_url);
+            const a = document.createElement('a');
+            a.href = submitted.download_url;
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            
+            showMessage('重新导出成功！', 'success');
+            closeReExportModal();
+        } else if (response.ok) {
             const blob = await response.blob();
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
@@ -370,6 +384,24 @@ async function handleReExport() {
     }
 }
 
+// 等待后台导出完成（Word/PDF在服务端进程池中生成）
+async function waitForExport(statusUrl, interval = 1000) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.message);
+        }
+        if (result.job.status === 'succeeded') {
+            return result.job;
+        }
+        if (result.job.status === 'failed') {
+            throw new Error(result.job.error || '导出失败');
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
 // 格式化日期
 function formatDate(dateString) {
     if (!dateString) return '-';
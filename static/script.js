@@ -1,6 +1,11 @@
 // 全局变量
 let currentPage = 1;
 let totalPages = 1;
+let pageCursors = [null]; // 题目管理列表每页的起始游标（键集分页）
+let hasNextPage = false;
+let questionListTotal = 0;
+let searchParams = new URLSearchParams(); // 当前搜索条件
+let searchNextCursor = null; // 搜索结果下一页游标
 let availableTags = [];
 let currentQuestions = [];
 let uploadedImages = [];
@@ -367,7 +372,69 @@ async function handleFormSubmit(e) {
     }
 }
 
-// 处理自动打标
+// 读取SSE响应（EventSource不支持POST，这里用fetch逐段读取）
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            const dataLines = [];
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            if (dataLines.length > 0) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
+// 按标签列表设置标签选择器的选中状态
+function applyTagSelection(selectedTags) {
+    tagSelector.querySelectorAll('.tag-item').forEach(tagElement => {
+        const checkbox = tagElement.querySelector('input[type="checkbox"]');
+        const tagValue = checkbox.value;
+        
+        if (selectedTags.includes(tagValue)) {
+            tagElement.classList.add('selected');
+            checkbox.checked = true;
+        } else {
+            tagElement.classList.remove('selected');
+            checkbox.checked = false;
+        }
+    });
+}
+
+// 把自动打标结果中的一个字段填入表单
+function applyAutoTagField(name, value) {
+    if (name === 'latex_content' && value) {
+        // 设置LaTeX格式化的题目内容
+        document.getElementById('latex-content').value = value;
+    } else if (name === 'tags' && Array.isArray(value)) {
+        // 设置标签
+        applyTagSelection(value);
+    } else if (name === 'answer' && typeof value === 'string') {
+        // 设置参考解答
+        document.getElementById('reference-answer').value = value;
+    }
+}
+
+// 处理自动打标（流式：每个字段生成完成后立即填入）
 async function handleAutoTag() {
     const content = document.getElementById('latex-content').value;
     const source = document.getElementById('source').value;
@@ -380,7 +447,7 @@ async function handleAutoTag() {
     try {
         showLoading(true);
         
-        const response = await fetch('/api/questions/auto-tag', {
+        const response = await fetch('/api/questions/auto-tag/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -391,35 +458,30 @@ async function handleAutoTag() {
             })
         });
         
-        const result = await response.json();
+        if (!response.ok) {
+            const result = await response.json();
+            showMessage('自动打标失败: ' + result.message, 'error');
+            return;
+        }
         
-        if (result.success) {
-            // 设置LaTeX格式化的题目内容
-            if (result.latex_content) {
-                document.getElementById('latex-content').value = result.latex_content;
+        let result = null;
+        await readEventStream(response, (event, data) => {
+            if (event === 'field') {
+                // 第一个字段到达后就可以让用户看到内容
+                showLoading(false);
+                applyAutoTagField(data.name, data.value);
+            } else if (event === 'done') {
+                result = data;
             }
-            
-            // 设置标签
-            const selectedTags = result.tags;
-            tagSelector.querySelectorAll('.tag-item').forEach(tagElement => {
-                const checkbox = tagElement.querySelector('input[type="checkbox"]');
-                const tagValue = checkbox.value;
-                
-                if (selectedTags.includes(tagValue)) {
-                    tagElement.classList.add('selected');
-                    checkbox.checked = true;
-                } else {
-                    tagElement.classList.remove('selected');
-                    checkbox.checked = false;
-                }
-            });
-            
-            // 设置参考解答
-            document.getElementById('reference-answer').value = result.answer;
-            
+        });
+        
+        if (result && result.success) {
+            applyAutoTagField('latex_content', result.latex_content);
+            applyAutoTagField('tags', result.tags);
+            applyAutoTagField('answer', result.answer);
             showMessage('自动打标和LaTeX格式化完成！', 'success');
         } else {
-            showMessage('自动打标失败: ' + result.message, 'error');
+            showMessage('自动打标失败: ' + (result ? result.message : '连接中断'), 'error');
         }
     } catch (error) {
         showMessage('自动打标失败: ' + error.message, 'error');
@@ -433,11 +495,13 @@ async function loadAllQuestions() {
     try {
         showLoading(true);
         
+        searchParams = new URLSearchParams();
         const response = await fetch('/api/questions/search');
         const result = await response.json();
         
         if (result.success) {
             currentQuestions = result.questions;
+            searchNextCursor = result.next_cursor;
             renderSearchResults();
         } else {
             showMessage('加载题目失败: ' + result.message, 'error');
@@ -471,12 +535,14 @@ async function handleSearch() {
         }
         
         url += params.toString();
+        searchParams = params;
         
         const response = await fetch(url);
         const result = await response.json();
         
         if (result.success) {
             currentQuestions = result.questions;
+            searchNextCursor = result.next_cursor;
             renderSearchResults();
         } else {
             showMessage('搜索失败: ' + result.message, 'error');
@@ -488,6 +554,33 @@ async function handleSearch() {
     }
 }
 
+// 加载下一页搜索结果
+async function loadMoreSearchResults() {
+    if (!searchNextCursor) return;
+    
+    try {
+        showLoading(true);
+        
+        const params = new URLSearchParams(searchParams);
+        params.set('cursor', searchNextCursor);
+        
+        const response = await fetch('/api/questions/search?' + params.toString());
+        const result = await response.json();
+        
+        if (result.success) {
+            currentQuestions = currentQuestions.concat(result.questions);
+            searchNextCursor = result.next_cursor;
+            renderSearchResults();
+        } else {
+            showMessage('加载更多失败: ' + result.message, 'error');
+        }
+    } catch (error) {
+        showMessage('加载更多失败: ' + error.message, 'error');
+    } finally {
+        showLoading(false);
+    }
+}
+
 // 渲染搜索结果（与题目预览保持一致的样式）
 function renderSearchResults() {
     if (currentQuestions.length === 0) {
@@ -513,6 +606,11 @@ function renderSearchResults() {
             <div class="question-content">
                 ${renderMathContent(question.latex_content)}
             </div>
+            ${question.image && question.image.length > 0 ? `
+                <div class="question-thumbs">
+                    ${question.image.map(img => `<img src="${imageVariant(img, 'thumb')}" loading="lazy" alt="题目图片">`).join('')}
+                </div>
+            ` : ''}
             <div class="question-actions">
                 <button class="btn btn-primary btn-sm" onclick="viewQuestion(${question.id})">
                     <i class="fas fa-eye"></i> 查看详情
@@ -524,6 +622,14 @@ function renderSearchResults() {
         </div>
     `).join('');
     
+    if (searchNextCursor) {
+        searchResults.innerHTML += `
+            <div class="load-more">
+                <button class="btn btn-secondary" onclick="loadMoreSearchResults()">加载更多</button>
+            </div>
+        `;
+    }
+    
     // 重新渲染数学公式
     renderMath();
 }
@@ -533,12 +639,24 @@ async function loadQuestions() {
     try {
         showLoading(true);
         
-        const response = await fetch(`/api/questions/search?page=${currentPage}&limit=10`);
+        const params = new URLSearchParams({ limit: 10 });
+        const pageCursor = pageCursors[currentPage - 1];
+        if (pageCursor) {
+            params.append('cursor', pageCursor);
+        }
+        
+        const response = await fetch(`/api/questions/search?${params.toString()}`);
         const result = await response.json();
         
         if (result.success) {
             currentQuestions = result.questions;
-            totalPages = Math.ceil(result.total / 10);
+            pageCursors[currentPage] = result.next_cursor;
+            hasNextPage = result.has_more;
+            // 总数只在第一页返回
+            if (result.total !== null) {
+                questionListTotal = result.total_is_estimate ? `${result.total}+` : result.total;
+                totalPages = Math.max(1, Math.ceil(result.total / 10));
+            }
             renderQuestionList();
             updatePagination();
         } else {
@@ -576,6 +694,11 @@ function renderQuestionList() {
             <div class="question-content">
                 ${renderMathContent(question.latex_content)}
             </div>
+            ${question.image && question.image.length > 0 ? `
+                <div class="question-thumbs">
+                    ${question.image.map(img => `<img src="${imageVariant(img, 'thumb')}" loading="lazy" alt="题目图片">`).join('')}
+                </div>
+            ` : ''}
             <div class="question-actions">
                 <button class="btn btn-primary btn-sm" onclick="viewQuestion(${question.id})">
                     <i class="fas fa-eye"></i> 查看详情
@@ -592,7 +715,7 @@ function renderQuestionList() {
     
     // 更新计数
     currentCount.textContent = currentQuestions.length;
-    totalCount.textContent = currentQuestions.length;
+    totalCount.textContent = questionListTotal;
     
     // 重新渲染数学公式
     renderMath();
@@ -609,9 +732,15 @@ async function viewQuestion(questionId) {
         if (result.success) {
             const question = result.question;
             
+            const questionImages = question.image || [];
             document.getElementById('modal-question-content').innerHTML = `
                 <h4>题目内容</h4>
                 <div class="question-detail">${renderMathContent(question.latex_content)}</div>
+                ${questionImages.length > 0 ? `
+                    <div class="question-images">
+                        ${questionImages.map(img => `<a href="${img}" target="_blank"><img src="${imageVariant(img, 'web')}" alt="题目图片"></a>`).join('')}
+                    </div>
+                ` : ''}
             `;
             
             document.getElementById('modal-question-tags').innerHTML = `
@@ -655,7 +784,7 @@ function closeModal() {
 // 切换页面
 function changePage(direction) {
     const newPage = currentPage + direction;
-    if (newPage >= 1 && newPage <= totalPages) {
+    if (newPage >= 1 && (direction < 0 || hasNextPage)) {
         currentPage = newPage;
         loadQuestions();
     }
@@ -665,7 +794,7 @@ function changePage(direction) {
 function updatePagination() {
     pageInfo.textContent = `第 ${currentPage} 页`;
     prevPageBtn.disabled = currentPage <= 1;
-    nextPageBtn.disabled = currentPage >= totalPages;
+    nextPageBtn.disabled = !hasNextPage;
 }
 
 // 渲染数学内容
@@ -784,12 +913,17 @@ async function handleImageUpload(e) {
     }
 }
 
+// 图片的缩略图/网页优化图地址（由服务端按需生成并长期缓存）
+function imageVariant(url, variant) {
+    return `${url}?variant=${variant}`;
+}
+
 // 添加图片预览
 function addImagePreview(url, filename) {
     const previewItem = document.createElement('div');
     previewItem.className = 'image-preview-item';
     previewItem.innerHTML = `
-        <img src="${url}" alt="${filename}">
+        <img src="${imageVariant(url, 'thumb')}" alt="${filename}" data-url="${url}">
         <button type="button" class="remove-btn" onclick="removeImage('${url}')">&times;</button>
     `;
     imagePreview.appendChild(previewItem);
@@ -800,7 +934,7 @@ function removeImage(url) {
     uploadedImages = uploadedImages.filter(img => img !== url);
     const previewItems = imagePreview.querySelectorAll('.image-preview-item');
     previewItems.forEach(item => {
-        if (item.querySelector('img').src === url) {
+        if (item.querySelector('img').dataset.url === url) {
             item.remove();
         }
     });
@@ -828,6 +962,23 @@ function removeExam() {
     parsedQuestionsDiv.style.display = 'none';
 }
 
+// 轮询后台任务直到结束，每次查询后回调 onProgress(job)
+async function pollJob(jobId, onProgress, interval = 1000) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.message);
+        }
+        
+        onProgress(result.job);
+        if (result.job.status === 'succeeded' || result.job.status === 'failed') {
+            return result.job;
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
 // 处理试卷解析
 async function handleParseExam() {
     const file = examUpload.files[0];
@@ -843,38 +994,45 @@ async function handleParseExam() {
         showLoading(true);
         console.log('开始解析试卷...');
         
-        const response = await fetch('/api/ocr-parse', {
+        // 提交后台任务后轮询进度，长时间解析不会因请求超时中断
+        const response = await fetch('/api/ocr-parse/jobs', {
             method: 'POST',
             body: formData
         });
         
-        const result = await response.json();
-        console.log('解析结果:', result);
+        const submitted = await response.json();
+        if (!submitted.success) {
+            console.error('解析失败:', submitted.message);
+            showMessage('试卷解析失败: ' + submitted.message, 'error');
+            return;
+        }
         
-        if (result.success) {
-            parsedQuestions = result.questions || [];
-            console.log('解析出的题目数量:', parsedQuestions.length);
-            console.log('题目详情:', parsedQuestions);
-            
-            // 检查每个题目的图片信息
-            parsedQuestions.forEach((question, index) => {
-                if (question.image && question.image.length > 0) {
-                    console.log(`题目 ${index + 1} 的图片:`, question.image);
-                }
-            });
+        parsedQuestions = [];
+        const job = await pollJob(submitted.job_id, (job) => {
+            console.log(`任务阶段: ${job.stage}, 进度: ${Math.round(job.progress * 100)}%`);
             
-            if (parsedQuestions.length === 0) {
-                showMessage('试卷解析完成，但没有识别出任何题目', 'warning');
-                parsedQuestionsDiv.style.display = 'none';
-            } else {
+            // 已解析出的题目先行展示
+            const questions = (job.result && job.result.questions) || [];
+            if (questions.length > parsedQuestions.length) {
+                parsedQuestions = questions;
+                showLoading(false);
                 renderParsedQuestions();
                 parsedQuestionsDiv.style.display = 'block';
                 document.getElementById('parsed-count').textContent = parsedQuestions.length;
-                showMessage(`试卷解析成功！共识别出 ${parsedQuestions.length} 道题目`, 'success');
             }
+        });
+        
+        console.log('解析出的题目数量:', parsedQuestions.length);
+        console.log('题目详情:', parsedQuestions);
+        
+        if (job.status === 'failed') {
+            console.error('解析失败:', job.error);
+            showMessage('试卷解析失败: ' + job.error, 'error');
+        } else if (parsedQuestions.length > 0) {
+            showMessage(`试卷解析成功！共识别出 ${parsedQuestions.length} 道题目`, 'success');
         } else {
-            console.error('解析失败:', result.message);
-            showMessage('试卷解析失败: ' + result.message, 'error');
+            showMessage('试卷解析完成，但没有识别出任何题目', 'warning');
+            parsedQuestionsDiv.style.display = 'none';
         }
     } catch (error) {
         console.error('解析过程中发生错误:', error);
@@ -909,7 +1067,7 @@ function renderParsedQuestions() {
                 </div>
                 ${questionImages.length > 0 ? `
                     <div class="question-images">
-                        ${questionImages.map(img => `<img src="${img}" style="max-width: 200px; margin: 5px;">`).join('')}
+                        ${questionImages.map(img => `<img src="${imageVariant(img, 'thumb')}" loading="lazy" style="max-width: 200px; margin: 5px;">`).join('')}
                     </div>
                 ` : ''}
                 ${questionTags.length > 0 ? `
@@ -956,32 +1114,35 @@ async function handleBatchSave() {
     
     try {
         showLoading(true);
-        let successCount = 0;
         
-        for (const index of selectedIndices) {
-            const question = parsedQuestions[index];
-            const response = await fetch('/api/questions', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    latex_content: question.question,
-                    tags: question.tags || [],
-                    reference_answer: question.answer || '',
-                    source: '试卷解析',
-                    image: question.image || [],
-                    visibility: visibility
+        // 一次请求保存全部选中题目，服务端在同一事务中写入
+        const response = await fetch('/api/questions/bulk', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                visibility: visibility,
+                questions: selectedIndices.map(index => {
+                    const question = parsedQuestions[index];
+                    return {
+                        latex_content: question.question,
+                        tags: question.tags || [],
+                        reference_answer: question.answer || '',
+                        source: '试卷解析',
+                        image: question.image || []
+                    };
                 })
-            });
-            
-            const result = await response.json();
-            if (result.success) {
-                successCount++;
-            }
+            })
+        });
+        
+        const result = await response.json();
+        if (!result.success) {
+            showMessage('批量保存失败: ' + result.message, 'error');
+            return;
         }
         
-        showMessage(`成功保存 ${successCount} 道题目！`, 'success');
+        showMessage(`成功保存 ${result.question_ids.length} 道题目！`, 'success');
         parsedQuestions = [];
         parsedQuestionsDiv.style.display = 'none';
         removeExam();
@@ -1132,6 +1293,7 @@ async function exportPaper() {
     const title = document.getElementById('export-title').value || '数学试卷';
     const mode = document.querySelector('input[name="export-mode"]:checked').value;
     const format = document.querySelector('input[name="export-format"]:checked').value;
+    const pdfEngine = document.querySelector('input[name="pdf-engine"]:checked').value;
     
     try {
         showLoading(true);
@@ -1142,14 +1304,28 @@ async function exportPaper() {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                questions: cart,
+                // 已入库的题目只提交ID，由服务端查询；未保存的解析题目提交内容
+                questions: cart.map(question => question.isParsed ? question : { id: question.id }),
                 title: title,
                 mode: mode,
-                format: format
+                format: format,
+                pdf_engine: pdfEngine
             })
         });
         
-        if (response.ok) {
+        if (response.status === 202) {
+            // Word/PDF在后台生成，完成后下载
+            const submitted = await response.json();
+            await waitForExport(submitted.status_url);
+            const a = document.createElement('a');
+            a.href = submitted.download_url;
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            
+            showMessage('试卷导出成功！', 'success');
+            closeCartModal();
+        } else if (response.ok) {
             const blob = await response.blob();
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
@@ -1173,6 +1349,24 @@ async function exportPaper() {
     }
 }
 
+// 等待后台导出完成（Word/PDF在服务端进程池中生成）
+async function waitForExport(statusUrl, interval = 1000) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.message);
+        }
+        if (result.job.status === 'succeeded') {
+            return result.job;
+        }
+        if (result.job.status === 'failed') {
+            throw new Error(result.job.error || '导出失败');
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
 // 删除题目
 async function deleteQuestion(questionId) {
     if (!confirm('确定要删除这道题目吗？此操作不可恢复。')) {
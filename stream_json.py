@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+流式JSON解析模块 - 在大模型逐段输出时尽早取出已完整的字段和数组元素
+"""
+
+import json
+from typing import Iterator, List, Tuple
+from json_repair import repair_json
+
+
+def _decode_value(text: str):
+    """解析单个JSON值，大模型输出中的非法转义（如LaTeX反斜杠）交给repair_json修复"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(repair_json('{"v": ' + text + '}'))['v']
+
+
+class IncrementalJSONParser:
+    """
+    增量解析大模型输出的JSON对象
+
+    只关心最外层对象：每个字段的值完整后产出 ('field', 字段名, 值)；
+    字段值为数组时，每个元素完整后先产出 ('item', 字段名, 下标, 元素)。
+    第一个 '{' 之前的内容（如 ```json 标记或说明文字）会被忽略。
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = True
+        self._key = None
+        self._value_start = None
+        self._item_start = None
+        self._item_index = 0
+
+    def feed(self, chunk: str) -> Iterator[Tuple]:
+        """
+        追加一段输出并产出其中新完成的事件
+
+        Args:
+            chunk: 大模型新输出的文本片段
+
+        Returns:
+            事件迭代器
+        """
+        if not chunk or self.done:
+            return
+        self.buffer += chunk
+
+        while self._pos < len(self.buffer) and not self.done:
+            i = self._pos
+            ch = self.buffer[i]
+            self._pos += 1
+
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._stack.append('{')
+                continue
+
+            depth = len(self._stack)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    yield from self._on_string_end(i, depth)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+                self._mark_value_start(i, depth)
+            elif ch in '{[':
+                self._mark_value_start(i, depth)
+                self._stack.append(ch)
+            elif ch in '}]':
+                if depth == 1:
+                    yield from self._end_primitive_value(i)
+                    self._stack.pop()
+                    self.done = True
+                    continue
+                if depth == 2 and self._stack[-1] == '[':
+                    yield from self._end_primitive_item(i)
+                self._stack.pop()
+                yield from self._on_container_end(i, len(self._stack))
+            elif ch == ',':
+                if depth == 1:
+                    yield from self._end_primitive_value(i)
+                    self._expect_key = True
+                elif depth == 2 and self._stack[-1] == '[':
+                    yield from self._end_primitive_item(i)
+            elif ch == ':':
+                if depth == 1:
+                    self._expect_key = False
+            elif not ch.isspace():
+                self._mark_value_start(i, depth)
+
+    def _mark_value_start(self, i: int, depth: int):
+        """记录最外层字段值或数组元素的起始位置"""
+        if depth == 1 and not self._expect_key and self._value_start is None:
+            self._value_start = i
+            self._item_index = 0
+        elif depth == 2 and self._stack[-1] == '[' and self._item_start is None:
+            self._item_start = i
+
+    def _on_string_end(self, i: int, depth: int) -> Iterator[Tuple]:
+        if depth == 1:
+            if self._expect_key:
+                self._key = _decode_value(self.buffer[self._string_start:i + 1])
+            else:
+                yield from self._emit_field(i + 1)
+        elif depth == 2 and self._stack[-1] == '[' and self._item_start == self._string_start:
+            yield from self._emit_item(i + 1)
+
+    def _on_container_end(self, i: int, depth: int) -> Iterator[Tuple]:
+        if depth == 1 and self._value_start is not None:
+            yield from self._emit_field(i + 1)
+        elif depth == 2 and self._stack[-1] == '[' and self._item_start is not None:
+            yield from self._emit_item(i + 1)
+
+    def _end_primitive_value(self, i: int) -> Iterator[Tuple]:
+        # 数字、true/false/null 在遇到分隔符时才算完整
+        if self._value_start is not None:
+            yield from self._emit_field(i)
+
+    def _end_primitive_item(self, i: int) -> Iterator[Tuple]:
+        if self._item_start is not None:
+            yield from self._emit_item(i)
+
+    def _emit_field(self, end: int) -> Iterator[Tuple]:
+        text = self.buffer[self._value_start:end].strip()
+        self._value_start = None
+        try:
+            value = _decode_value(text)
+        except ValueError:
+            return
+        yield ('field', self._key, value)
+
+    def _emit_item(self, end: int) -> Iterator[Tuple]:
+        text = self.buffer[self._item_start:end].strip()
+        self._item_start = None
+        index = self._item_index
+        self._item_index += 1
+        try:
+            value = _decode_value(text)
+        except ValueError:
+            return
+        yield ('item', self._key, index, value)
@@ -3,11 +3,17 @@
 系统管理模块 - 用户管理和标签管理
 """
 
-import sqlite3
+import atexit
 import hashlib
 import json
+import multiprocessing
+import threading
+import time
+from collections import Counter
 from typing import Optional, Dict, List
-from config import SYSTEM_DATABASE_PATH, QUESTION_TAGS
+from config import SYSTEM_DATABASE_PATH, QUESTION_TAGS, TAG_USAGE_CONFIG
+from db_pool import get_connection
+from logger import get_logger
 
 class SystemManager:
     """系统管理器类 - 管理用户和标签"""
@@ -20,12 +26,26 @@ class SystemManager:
             db_path: 系统数据库文件路径
         """
         self.db_path = db_path
+        self.logger = get_logger()
+
+        # 标签使用计数的内存累加器，由后台线程合并写入（见 start_tag_usage_flusher）
+        self._tag_usage = Counter()
+        self._tag_usage_lock = threading.Lock()
+        self._tag_flush_wakeup = threading.Event()
+        self._tag_flush_stop = threading.Event()
+        self._tag_flush_thread = None
+
+        # 按数量缓存的标签列表，标签表每次写入后版本号递增，缓存随之失效
+        self._tag_version = 0
+        self._tag_vocabulary: Dict[int, Dict] = {}
+        self._tag_vocabulary_lock = threading.Lock()
+
         self.init_database()
         self.seed_initial_tags()
     
     def init_database(self):
         """初始化系统数据库表结构"""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         # 创建用户表
@@ -70,11 +90,11 @@ class SystemManager:
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_export_user ON export_history(user_id)')
         
         conn.commit()
-        conn.close()
+        cursor.close()
     
     def seed_initial_tags(self):
         """将初始标签种子数据添加到数据库"""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -85,8 +105,11 @@ class SystemManager:
                 ''', (tag_name,))
             
             conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
         finally:
-            conn.close()
+            cursor.close()
     
     def hash_password(self, password: str) -> str:
         """
@@ -118,7 +141,7 @@ class SystemManager:
         if not password or len(password) < 6:
             return False, "密码至少需要6个字符"
         
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -141,7 +164,7 @@ class SystemManager:
             conn.rollback()
             return False, f"注册失败: {str(e)}"
         finally:
-            conn.close()
+            cursor.close()
     
     def authenticate_user(self, username: str, password: str) -> Optional[Dict]:
         """
@@ -154,7 +177,7 @@ class SystemManager:
         Returns:
             用户信息字典，如果验证失败返回None
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -177,7 +200,7 @@ class SystemManager:
             return None
             
         finally:
-            conn.close()
+            cursor.close()
     
     def get_user_by_id(self, user_id: int) -> Optional[Dict]:
         """
@@ -189,7 +212,7 @@ class SystemManager:
         Returns:
             用户信息字典，如果不存在返回None
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -211,7 +234,7 @@ class SystemManager:
             return None
             
         finally:
-            conn.close()
+            cursor.close()
     
     def get_user_by_username(self, username: str) -> Optional[Dict]:
         """
@@ -223,7 +246,7 @@ class SystemManager:
         Returns:
             用户信息字典，如果不存在返回None
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -245,7 +268,7 @@ class SystemManager:
             return None
             
         finally:
-            conn.close()
+            cursor.close()
     
     def update_password(self, user_id: int, old_password: str, new_password: str) -> tuple:
         """
@@ -262,7 +285,7 @@ class SystemManager:
         if not new_password or len(new_password) < 6:
             return False, "新密码至少需要6个字符"
         
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -291,7 +314,7 @@ class SystemManager:
             conn.rollback()
             return False, f"密码更新失败: {str(e)}"
         finally:
-            conn.close()
+            cursor.close()
     
     # 标签管理方法
     def get_all_tags(self, limit: int = 20) -> List[Dict]:
@@ -304,7 +327,7 @@ class SystemManager:
         Returns:
             标签列表
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -327,8 +350,43 @@ class SystemManager:
             return tags
             
         finally:
-            conn.close()
+            cursor.close()
     
+    def get_tag_vocabulary(self, limit: int = 20) -> Dict:
+        """
+        获取按使用频率排序的标签名列表（内存缓存，标签表变化或超过有效期后重新查询）
+
+        Args:
+            limit: 返回标签数量限制
+
+        Returns:
+            {'names': 标签名列表, 'joined': 以“, ”拼接的标签名（供提示词使用）,
+             'etag': 按内容计算的实体标签, 'version': 缓存版本号}
+        """
+        with self._tag_vocabulary_lock:
+            entry = self._tag_vocabulary.get(limit)
+            if (entry and entry['version'] == self._tag_version
+                    and time.time() - entry['loaded_at'] < TAG_USAGE_CONFIG["vocabulary_ttl"]):
+                return entry
+
+            version = self._tag_version
+            names = [tag['name'] for tag in self.get_all_tags(limit=limit)]
+            joined = ', '.join(names)
+            entry = {
+                'names': names,
+                'joined': joined,
+                'etag': hashlib.sha256(joined.encode('utf-8')).hexdigest()[:16],
+                'version': version,
+                'loaded_at': time.time()
+            }
+            self._tag_vocabulary[limit] = entry
+            return entry
+
+    def invalidate_tag_vocabulary(self):
+        """标签表已修改：使缓存的标签列表失效"""
+        with self._tag_vocabulary_lock:
+            self._tag_version += 1
+
     def add_tag(self, tag_name: str) -> bool:
         """
         添加标签或增加使用计数
@@ -339,27 +397,106 @@ class SystemManager:
         Returns:
             是否成功
         """
-        conn = sqlite3.connect(self.db_path)
+        return self.add_tags([tag_name])
+
+    def add_tags(self, tag_names: List[str]) -> bool:
+        """
+        批量添加标签或增加使用计数（同名标签合并计数）
+
+        后台写入线程运行时只累加到内存，由线程按间隔或累计量批量写入；
+        未启动时立即在一次事务中写入。
+
+        Args:
+            tag_names: 标签名称列表，可重复
+
+        Returns:
+            是否成功
+        """
+        counts = Counter(name for name in tag_names if isinstance(name, str) and name)
+        if not counts:
+            return True
+
+        if self._tag_flush_thread is None:
+            return self._write_tag_usage(counts)
+
+        with self._tag_usage_lock:
+            self._tag_usage.update(counts)
+            pending = sum(self._tag_usage.values())
+        if pending >= TAG_USAGE_CONFIG["flush_threshold"]:
+            self._tag_flush_wakeup.set()
+        return True
+
+    def flush_tag_usage(self) -> bool:
+        """
+        把内存中累计的标签使用计数写入数据库
+
+        Returns:
+            是否成功（失败时计数放回累加器，下次重试）
+        """
+        with self._tag_usage_lock:
+            counts, self._tag_usage = self._tag_usage, Counter()
+        if not counts:
+            return True
+
+        if self._write_tag_usage(counts):
+            return True
+        with self._tag_usage_lock:
+            self._tag_usage.update(counts)
+        return False
+
+    def start_tag_usage_flusher(self):
+        """启动标签计数的后台写入线程，并在进程退出时写入剩余计数（重复调用无副作用；在子进程中不启动）"""
+        if self._tag_flush_thread is not None or multiprocessing.current_process().name != 'MainProcess':
+            return
+        self._tag_flush_stop.clear()
+        self._tag_flush_thread = threading.Thread(target=self._tag_flush_loop, name='tag-usage-flusher',
+                                                  daemon=True)
+        self._tag_flush_thread.start()
+        atexit.register(self.stop_tag_usage_flusher)
+
+    def stop_tag_usage_flusher(self, timeout: float = 5.0):
+        """停止后台写入线程并写入剩余计数"""
+        thread, self._tag_flush_thread = self._tag_flush_thread, None
+        if thread is not None:
+            self._tag_flush_stop.set()
+            self._tag_flush_wakeup.set()
+            thread.join(timeout)
+        self.flush_tag_usage()
+
+    def _tag_flush_loop(self):
+        """后台线程：按间隔或在累计量达到阈值时写入标签计数"""
+        while not self._tag_flush_stop.is_set():
+            self._tag_flush_wakeup.wait(TAG_USAGE_CONFIG["flush_interval"])
+            self._tag_flush_wakeup.clear()
+            try:
+                self.flush_tag_usage()
+            except Exception as e:
+                self.logger.log_error(e, "写入标签使用计数失败")
+
+    def _write_tag_usage(self, counts: Counter) -> bool:
+        """在一次事务中批量插入标签或增加使用计数"""
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
-        
+
         try:
-            # 尝试插入新标签，如果已存在则增加使用计数
-            cursor.execute('''
+            cursor.executemany('''
                 INSERT INTO tags (name, usage_count)
-                VALUES (?, 1)
+                VALUES (?, ?)
                 ON CONFLICT(name) DO UPDATE SET
-                usage_count = usage_count + 1
-            ''', (tag_name,))
-            
+                usage_count = usage_count + excluded.usage_count
+            ''', list(counts.items()))
+
             conn.commit()
+            self.invalidate_tag_vocabulary()
             return True
-            
+
         except Exception as e:
             conn.rollback()
+            self.logger.log_error(e, f"写入标签使用计数失败 - 标签数: {len(counts)}")
             return False
         finally:
-            conn.close()
-    
+            cursor.close()
+
     def get_tag_by_name(self, name: str) -> Optional[Dict]:
         """
         根据名称获取标签
@@ -370,7 +507,7 @@ class SystemManager:
         Returns:
             标签信息字典，如果不存在返回None
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -391,7 +528,7 @@ class SystemManager:
             return None
             
         finally:
-            conn.close()
+            cursor.close()
     
     # 导出历史管理方法
     def save_export_history(self, user_id: int, title: str, question_ids: List[int], 
@@ -409,7 +546,7 @@ class SystemManager:
         Returns:
             导出历史ID
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -423,8 +560,11 @@ class SystemManager:
             conn.commit()
             return export_id
             
+        except Exception:
+            conn.rollback()
+            raise
         finally:
-            conn.close()
+            cursor.close()
     
     def get_export_history(self, user_id: int, limit: int = 50) -> List[Dict]:
         """
@@ -437,7 +577,7 @@ class SystemManager:
         Returns:
             导出历史列表
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -464,7 +604,7 @@ class SystemManager:
             return history
             
         finally:
-            conn.close()
+            cursor.close()
     
     def get_export_by_id(self, export_id: int) -> Optional[Dict]:
         """
@@ -476,7 +616,7 @@ class SystemManager:
         Returns:
             导出历史详情，如果不存在返回None
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cursor = conn.cursor()
         
         try:
@@ -501,4 +641,4 @@ class SystemManager:
             return None
             
         finally:
-            conn.close()
+            cursor.close()
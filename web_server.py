@@ -3,18 +3,26 @@
 高考题目录入和自动打标系统Web服务器
 """
 
-from flask import Flask, render_template, request, jsonify, send_from_directory, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, session, redirect, url_for, stream_with_context
 from functools import wraps
 import json
+import multiprocessing
 import os
 import uuid
 import time
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from question_manager import QuestionManager
 from ocr_client import DeepSeekOCRClient
 from system_manager import SystemManager
-from export_renderer import ExportRenderer
-from config import WEB_CONFIG, OCR_BASE_URL, LLM_CONFIG, SECRET_KEY, SYSTEM_DATABASE_PATH
+from export_renderer import ExportRenderer, PDF_ENGINES
+from export_service import ExportService, ExportQueueFull
+from scratch_manager import ScratchManager
+from job_queue import JobQueue
+from blob_store import BlobStore
+from image_derivatives import ImageDerivatives
+from exam_segmenter import segment_exam_markdown
+from config import WEB_CONFIG, OCR_BASE_URL, LLM_CONFIG, SECRET_KEY, SYSTEM_DATABASE_PATH, SEARCH_CONFIG, LLM_CONCURRENCY_CONFIG, IMAGE_DERIVATIVE_CONFIG, PDF_EXPORT_CONFIG, EXPORT_SERVICE_CONFIG
 from logger import get_logger
 
 app = Flask(__name__)
@@ -35,15 +43,28 @@ logger = get_logger()
 
 # 初始化系统管理器
 system_manager = SystemManager(SYSTEM_DATABASE_PATH)
+system_manager.start_tag_usage_flusher()
+
+# 初始化上传文件存储（按内容哈希去重），并回收长期未被引用的文件（导出工作进程重新导入本模块时不回收）
+blob_store = BlobStore(UPLOAD_FOLDER)
+image_derivatives = ImageDerivatives(UPLOAD_FOLDER, blob_store)
+if multiprocessing.current_process().name == 'MainProcess':
+    blob_store.collect_garbage(on_remove=image_derivatives.remove)
 
 # 初始化题目管理器
-question_manager = QuestionManager(system_manager=system_manager)
+question_manager = QuestionManager(system_manager=system_manager, blob_store=blob_store)
 
 # 初始化OCR客户端
 ocr_client = DeepSeekOCRClient(OCR_BASE_URL)
 
 # 初始化导出渲染器
-export_renderer = ExportRenderer(UPLOAD_FOLDER)
+export_scratch = ScratchManager(upload_folder=UPLOAD_FOLDER)
+export_scratch.start()
+export_renderer = ExportRenderer(UPLOAD_FOLDER, scratch=export_scratch)
+export_service = ExportService(UPLOAD_FOLDER)
+
+# 初始化后台任务队列（任务类型在下方注册后启动）
+job_queue = JobQueue(SYSTEM_DATABASE_PATH)
 
 # 登录验证装饰器
 def login_required(f):
@@ -57,6 +78,15 @@ def login_required(f):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def sse_event(event: str, data: dict) -> str:
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def sse_response(events) -> Response:
+    """把事件生成器包装为SSE响应（禁止代理缓冲，保证事件即时送达）"""
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/')
 @login_required
 def index():
@@ -177,7 +207,35 @@ def add_question():
             'message': '题目添加成功',
             'question_id': question_id
         })
-        
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/questions/bulk', methods=['POST'])
+@login_required
+def add_questions_bulk():
+    """批量添加题目API（试卷解析结果一次保存，全部成功或全部不保存）"""
+    try:
+        data = request.get_json()
+
+        if not data or not isinstance(data.get('questions'), list):
+            return jsonify({'success': False, 'message': '题目列表不能为空'}), 400
+
+        try:
+            question_ids = question_manager.add_questions_bulk(
+                data['questions'],
+                user_id=session['user_id'],
+                visibility=data.get('visibility', 'public')
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        return jsonify({
+            'success': True,
+            'message': f'成功保存 {len(question_ids)} 道题目',
+            'question_ids': question_ids
+        })
+
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -216,39 +274,135 @@ def auto_tag_question():
         logger.log_error(e, f"自动打标API失败 - 用户ID: {session.get('user_id')}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/questions/auto-tag/stream', methods=['POST'])
+@login_required
+def auto_tag_question_stream():
+    """流式自动打标API：以SSE推送已生成完整的字段（field事件），最后推送完整结果（done事件）"""
+    data = request.get_json(silent=True) or {}
+    if 'content' not in data:
+        return jsonify({'success': False, 'message': '题目内容不能为空'}), 400
+    
+    content = data['content']
+    source = data.get('source', '')
+    user_id = session.get('user_id')
+    
+    logger.log_user_action(user_id, "流式自动打标和LaTeX格式化", f"内容长度: {len(content)}")
+    
+    def generate():
+        start_time = time.time()
+        for event in question_manager.auto_tag_and_answer_stream(content, source):
+            if event[0] == 'field':
+                yield sse_event('field', {'name': event[1], 'value': event[2]})
+            else:
+                tags, answer, latex_content = event[1]
+                duration = time.time() - start_time
+                logger.log_performance("流式自动打标API", duration, f"用户ID: {user_id}")
+                yield sse_event('done', {
+                    'success': True,
+                    'tags': tags,
+                    'answer': answer,
+                    'latex_content': latex_content
+                })
+    
+    return sse_response(generate())
+
+@app.route('/api/questions/auto-tag/batch', methods=['POST'])
+@login_required
+def auto_tag_questions_batch():
+    """批量自动打标API：并发调用大模型，以NDJSON逐行流式返回每道题的结果（按完成顺序）"""
+    data = request.get_json(silent=True) or {}
+    contents = data.get('contents', [])
+    source = data.get('source', '')
+    user_id = session.get('user_id')
+    
+    if not contents or not isinstance(contents, list):
+        return jsonify({'success': False, 'message': '题目内容不能为空'}), 400
+    if len(contents) > LLM_CONCURRENCY_CONFIG['max_batch_size']:
+        return jsonify({
+            'success': False,
+            'message': f"单次最多批量打标{LLM_CONCURRENCY_CONFIG['max_batch_size']}道题目"
+        }), 400
+    
+    items = [{'content': str(content), 'source': source} for content in contents]
+    logger.log_user_action(user_id, "批量自动打标", f"题目数量: {len(items)}")
+    
+    def generate():
+        start_time = time.time()
+        completed = 0
+        failed = 0
+        # 客户端断开时关闭生成器，batch.close() 会取消尚未开始的大模型调用
+        batch = question_manager.auto_tag_batch(items)
+        try:
+            for index, result, error in batch:
+                if error is not None:
+                    failed += 1
+                    yield json.dumps({'index': index, 'success': False, 'message': error},
+                                     ensure_ascii=False) + '\n'
+                    continue
+                completed += 1
+                tags, answer, latex_content = result
+                yield json.dumps({
+                    'index': index,
+                    'success': True,
+                    'tags': tags,
+                    'answer': answer,
+                    'latex_content': latex_content
+                }, ensure_ascii=False) + '\n'
+        except Exception as e:
+            logger.log_error(e, f"批量自动打标失败 - 用户ID: {user_id}")
+            yield json.dumps({'done': True, 'success': False, 'message': str(e)}, ensure_ascii=False) + '\n'
+            return
+        finally:
+            batch.close()
+        
+        duration = time.time() - start_time
+        logger.log_performance("批量自动打标API", duration, f"用户ID: {user_id}, 题目数量: {completed + failed}")
+        yield json.dumps({
+            'done': True,
+            'success': failed == 0,
+            'count': completed,
+            'failed': failed
+        }, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/questions/search', methods=['GET'])
 @login_required
 def search_questions():
-    """搜索题目API"""
+    """搜索题目API（键集分页：首页不带cursor，之后传入上一页返回的next_cursor）"""
     try:
         # 获取查询参数
         tags = request.args.getlist('tags')
-        keyword = request.args.get('keyword', '')
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 20))
-        offset = (page - 1) * limit
+        match = request.args.get('match', 'any')  # 标签匹配方式: any(任一) / all(全部)
+        keyword = request.args.get('keyword', '').strip()
+        cursor = request.args.get('cursor') or None
+        limit = int(request.args.get('limit', SEARCH_CONFIG['default_limit']))
+        limit = max(1, min(limit, SEARCH_CONFIG['max_limit']))
         
         # 获取当前用户ID
         current_user_id = session['user_id']
         
-        questions = []
-        
-        if tags:
-            # 按标签查询
-            questions = question_manager.get_questions_by_tags(tags, current_user_id)
-        elif keyword:
-            # 关键词搜索
-            questions = question_manager.search_questions(keyword, current_user_id)
-        else:
-            # 获取所有题目
-            questions = question_manager.get_all_questions(limit, offset, current_user_id)
+        page = question_manager.search_page(
+            current_user_id=current_user_id,
+            tags=tags,
+            match=match,
+            keyword=keyword,
+            limit=limit,
+            cursor=cursor,
+            count_cap=SEARCH_CONFIG['count_cap']
+        )
         
         return jsonify({
             'success': True,
-            'questions': questions,
-            'total': len(questions)
+            'questions': page['questions'],
+            'total': page['total'],
+            'total_is_estimate': page['total_is_estimate'],
+            'next_cursor': page['next_cursor'],
+            'has_more': page['has_more']
         })
         
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -302,18 +456,20 @@ def upload_file():
             return jsonify({'success': False, 'message': '没有选择文件'}), 400
         
         if file and allowed_file(file.filename):
-            # 生成唯一文件名
+            # 按内容哈希保存，相同图片只存一份
             filename = secure_filename(file.filename)
             name, ext = os.path.splitext(filename)
-            unique_filename = f"{uuid.uuid4()}{ext}"
+            blob = blob_store.put_stream(file.stream, ext)
             
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
+            # 预先生成缩略图并记录尺寸
+            dimensions = image_derivatives.prepare(blob)
             
             return jsonify({
                 'success': True,
-                'filename': unique_filename,
-                'url': f'/uploads/{unique_filename}'
+                'filename': os.path.basename(blob['url']),
+                'url': blob['url'],
+                'width': dimensions[0] if dimensions else None,
+                'height': dimensions[1] if dimensions else None
             })
         else:
             return jsonify({'success': False, 'message': '不支持的文件类型'}), 400
@@ -321,10 +477,39 @@ def upload_file():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/uploads/<filename>')
+@app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """提供上传的图片文件"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """
+    提供上传的图片文件
+    
+    带 ?variant=thumb|web 时返回缩小后的衍生图（首次请求时生成）。内容寻址的文件不会变化，
+    以长期 immutable 缓存返回；旧路径文件缓存较短时间，过期后按ETag条件请求。
+    衍生图无法生成而退回原图时只短暂缓存，避免浏览器把原图长期缓存在衍生图地址下。
+    """
+    immutable = BlobStore.hash_from_url(f'/uploads/{filename}') is not None
+    max_age = IMAGE_DERIVATIVE_CONFIG['immutable_max_age'] if immutable else IMAGE_DERIVATIVE_CONFIG['max_age']
+    
+    variant = request.args.get('variant')
+    if variant:
+        source_path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+        if source_path is None or not os.path.isfile(source_path):
+            return jsonify({'success': False, 'message': '文件不存在'}), 404
+        try:
+            derived = image_derivatives.derive(source_path, filename, variant)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        if derived:
+            filename = derived
+        else:
+            # 无法生成衍生图时退回原图
+            immutable = False
+            max_age = IMAGE_DERIVATIVE_CONFIG['fallback_max_age']
+    
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=max_age)
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.immutable = True
+    return response
 
 @app.route('/api/questions/<int:question_id>', methods=['DELETE'])
 @login_required
@@ -348,6 +533,52 @@ def delete_question(question_id):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def save_exam_upload(file) -> str:
+    """把上传的试卷图片保存到内容寻址存储，返回本地文件路径"""
+    filename = secure_filename(file.filename)
+    name, ext = os.path.splitext(filename)
+    blob = blob_store.put_stream(file.stream, ext)
+    return blob_store.path_for(blob['hash'], blob['ext'])
+
+def save_ocr_images(ocr_images) -> dict:
+    """
+    保存OCR返回的图片（base64内嵌数据或需下载的引用）
+    
+    Returns:
+        原始文件名 -> 本地访问路径 的映射
+    """
+    image_filename_mapping = {}  # 原始文件名 -> 本地保存路径的映射
+    for img_data in ocr_images or []:
+        if not isinstance(img_data, dict) or 'filename' not in img_data:
+            continue
+        
+        original_filename = img_data['filename']  # 如 "images/0.jpg"
+        ext = os.path.splitext(original_filename)[1]
+        
+        if 'url' in img_data:
+            # 图片以引用返回：分块流式下载，边写入边计算哈希
+            blob = blob_store.put_chunks(ocr_client.iter_image(img_data['url']), ext)
+        elif 'data' in img_data:
+            image_data = img_data['data']
+            
+            # 处理base64编码的图片数据
+            if isinstance(image_data, str):
+                # 如果是base64字符串，解码为bytes
+                import base64
+                image_bytes = base64.b64decode(image_data)
+            else:
+                # 如果已经是bytes，直接使用
+                image_bytes = image_data
+            blob = blob_store.put_bytes(image_bytes, ext)
+        else:
+            continue
+        
+        # 记录映射关系：原始文件名 -> 本地相对路径
+        image_filename_mapping[original_filename] = blob['url']
+        logger.log_image_processing(original_filename, blob['url'], "保存")
+    
+    return image_filename_mapping
+
 @app.route('/api/ocr-parse', methods=['POST'])
 @login_required
 def ocr_parse():
@@ -361,14 +592,7 @@ def ocr_parse():
             return jsonify({'success': False, 'message': '没有选择文件'}), 400
         
         if file and allowed_file(file.filename):
-            # 保存上传的图片到/uplaod/upload_images/
-            if not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'upload_images')):
-                os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'upload_images'))
-            filename = secure_filename(file.filename)
-            name, ext = os.path.splitext(filename)
-            unique_filename = f"{uuid.uuid4()}{ext}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'upload_images', unique_filename)
-            file.save(file_path)
+            file_path = save_exam_upload(file)
             
             try:
                 # 调用OCR
@@ -380,40 +604,7 @@ def ocr_parse():
                 logger.log_ocr_result(ocr_result.get('request_id', 'unknown'), markdown_content, len(ocr_images))
                 
                 # 处理OCR返回的图片数据
-                image_filename_mapping = {}  # 原始文件名 -> 本地保存路径的映射
-                if ocr_images:
-                    # 创建集中的图片目录
-                    images_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'ocr_images')
-                    if not os.path.exists(images_dir):
-                        os.makedirs(images_dir)
-                    
-                    for img_data in ocr_images:
-                        if isinstance(img_data, dict) and 'filename' in img_data and 'data' in img_data:
-                            original_filename = img_data['filename']  # 如 "0.jpg", "1.jpg"
-                            image_data = img_data['data']
-                            
-                            # 处理base64编码的图片数据
-                            if isinstance(image_data, str):
-                                # 如果是base64字符串，解码为bytes
-                                import base64
-                                image_bytes = base64.b64decode(image_data)
-                            else:
-                                # 如果已经是bytes，直接使用
-                                image_bytes = image_data
-                            
-                            # 生成唯一文件名避免重名，但保留原始扩展名
-                            name, ext = os.path.splitext(original_filename)
-                            unique_filename = f"ocr_{uuid.uuid4().hex[:8]}_{original_filename}"
-                            dest_path = os.path.join(images_dir, unique_filename)
-                            
-                            # 保存图片数据到本地
-                            with open(dest_path, 'wb') as f:
-                                f.write(image_bytes)
-                            
-                            # 记录映射关系：原始文件名 -> 本地相对路径
-                            relative_path = f"/uploads/ocr_images/{unique_filename}"
-                            image_filename_mapping[original_filename] = relative_path
-                            logger.log_image_processing(original_filename, relative_path, "保存")
+                image_filename_mapping = save_ocr_images(ocr_images)
                 
                 # 调用大模型解析题目，传递文件名映射关系
                 logger.log_system_info(f"开始解析试卷，markdown内容长度: {len(markdown_content)}, 可用图片数量: {len(image_filename_mapping)}")
@@ -441,38 +632,213 @@ def ocr_parse():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/ocr-parse/stream', methods=['POST'])
+@login_required
+def ocr_parse_stream():
+    """
+    流式OCR解析试卷API
+    
+    以SSE推送处理进度（status事件），每解析完一道题推送一次（question事件，带题目序号），
+    结束时推送done事件（带题目数量，可能为0），出错时推送error事件。
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'success': False, 'message': '没有选择文件'}), 400
+    
+    file = request.files['file']
+    if not allowed_file(file.filename):
+        return jsonify({'success': False, 'message': '不支持的文件类型'}), 400
+    
+    file_path = save_exam_upload(file)
+    user_id = session.get('user_id')
+    
+    def generate():
+        start_time = time.time()
+        try:
+            yield sse_event('status', {'stage': 'ocr', 'message': '正在识别试卷'})
+            logger.log_system_info(f"开始OCR处理 - 文件: {file_path}")
+            ocr_result = ocr_client.ocr_image(file_path)
+            markdown_content = ocr_result.get('markdown', '')
+            ocr_images = ocr_result.get('images', [])
+            
+            logger.log_ocr_result(ocr_result.get('request_id', 'unknown'), markdown_content, len(ocr_images))
+            
+            image_filename_mapping = save_ocr_images(ocr_images)
+            
+            yield sse_event('status', {'stage': 'parse', 'message': '正在解析题目'})
+            logger.log_system_info(f"开始解析试卷，markdown内容长度: {len(markdown_content)}, 可用图片数量: {len(image_filename_mapping)}")
+            
+            count = 0
+            for index, question in question_manager.iter_exam_questions(markdown_content, image_filename_mapping):
+                count += 1
+                yield sse_event('question', {'index': index, 'question': question})
+            
+            logger.log_question_parsing(count, "试卷解析")
+            duration = time.time() - start_time
+            logger.log_performance("流式OCR解析API", duration, f"用户ID: {user_id}, 题目数量: {count}")
+            
+            yield sse_event('done', {'success': True, 'count': count})
+            
+        except Exception as e:
+            logger.log_error(e, f"流式OCR解析失败 - 用户ID: {user_id}")
+            yield sse_event('error', {'success': False, 'message': f'OCR解析失败: {str(e)}'})
+    
+    return sse_response(generate())
+
+def run_ocr_stage(state: dict, report) -> dict:
+    """OCR解析任务 - 识别阶段：调用OCR服务并保存返回的图片"""
+    file_path = state['file_path']
+    logger.log_system_info(f"开始OCR处理 - 文件: {file_path}")
+    ocr_result = ocr_client.ocr_image(file_path)
+    markdown_content = ocr_result.get('markdown', '')
+    ocr_images = ocr_result.get('images', [])
+    
+    logger.log_ocr_result(ocr_result.get('request_id', 'unknown'), markdown_content, len(ocr_images))
+    
+    return {
+        'markdown': markdown_content,
+        'image_filename_mapping': save_ocr_images(ocr_images)
+    }
+
+def run_parse_stage(state: dict, report) -> dict:
+    """OCR解析任务 - 解析阶段：逐题解析，每完成一道题更新进度和已解析的题目"""
+    markdown_content = state['markdown']
+    image_filename_mapping = state['image_filename_mapping']
+    logger.log_system_info(f"开始解析试卷，markdown内容长度: {len(markdown_content)}, 可用图片数量: {len(image_filename_mapping)}")
+    
+    # 本地切分出的题目数用于估算进度，切分失败时整卷解析无法预知题目数
+    expected = len(segment_exam_markdown(markdown_content))
+    parsed = {}
+    for index, question in question_manager.iter_exam_questions(markdown_content, image_filename_mapping):
+        parsed[index] = question
+        report(len(parsed) / expected if expected else 0.5,
+               {'questions': [parsed[i] for i in sorted(parsed)]})
+    
+    logger.log_question_parsing(len(parsed), "试卷解析")
+    return {'questions': [parsed[i] for i in sorted(parsed)]}
+
+job_queue.register('ocr_parse', [('ocr', run_ocr_stage), ('parse', run_parse_stage)])
+job_queue.start()
+
+@app.route('/api/ocr-parse/jobs', methods=['POST'])
+@login_required
+def submit_ocr_parse_job():
+    """提交OCR解析后台任务API：保存图片后立即返回任务ID，通过 /api/jobs/<id> 查询进度和结果"""
+    try:
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({'success': False, 'message': '没有选择文件'}), 400
+        
+        file = request.files['file']
+        if not allowed_file(file.filename):
+            return jsonify({'success': False, 'message': '不支持的文件类型'}), 400
+        
+        user_id = session.get('user_id')
+        file_path = save_exam_upload(file)
+        job_id = job_queue.submit('ocr_parse', {'file_path': file_path}, user_id=user_id)
+        logger.log_user_action(user_id, "提交OCR解析任务", f"任务ID: {job_id}")
+        
+        return jsonify({'success': True, 'job_id': job_id}), 202
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job_status(job_id):
+    """查询后台任务API：返回状态、当前阶段、进度（0~1）和（部分）结果"""
+    try:
+        job = job_queue.get_job(job_id, user_id=session.get('user_id'))
+        if not job:
+            return jsonify({'success': False, 'message': '任务不存在'}), 404
+        
+        return jsonify({'success': True, 'job': job})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/tags', methods=['GET'])
 def get_tags():
-    """获取所有可用标签API"""
+    """获取所有可用标签API（带ETag，标签列表未变化时返回304）"""
     try:
-        tags = system_manager.get_all_tags(limit=20)
-        tag_names = [tag['name'] for tag in tags]
-        return jsonify({
-            'success': True,
-            'tags': tag_names
-        })
+        vocabulary = system_manager.get_tag_vocabulary(limit=20)
+        if vocabulary['etag'] in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = jsonify({
+                'success': True,
+                'tags': vocabulary['names']
+            })
+        response.set_etag(vocabulary['etag'])
+        response.cache_control.no_cache = True
+        return response
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def is_question_id(value) -> bool:
+    """是否为已入库题目的ID（购物车中未保存的解析题目使用字符串临时ID）"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def resolve_export_questions(data: dict, user_id: int) -> list:
+    """
+    获取要导出的题目：已入库的题目只按ID在服务端查询（忽略客户端提交的内容），
+    未入库的解析题目使用提交的内容
+    
+    Args:
+        data: 请求体，包含 question_ids（ID列表）或 questions（按顺序的题目/ID对象列表）
+        user_id: 当前用户ID
+        
+    Returns:
+        按请求顺序排列的题目列表
+        
+    Raises:
+        ValueError: 请求体或题目列表格式不正确
+    """
+    if not isinstance(data, dict):
+        raise ValueError('请求体格式不正确')
+    items = data.get('questions')
+    if items is None:
+        question_ids = data.get('question_ids', [])
+        if not isinstance(question_ids, list) or not all(is_question_id(question_id) for question_id in question_ids):
+            raise ValueError('question_ids 必须是题目ID列表')
+        items = [{'id': question_id} for question_id in question_ids]
+    elif not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError('questions 必须是题目对象列表')
+    
+    fetched = question_manager.get_questions_by_ids(
+        [item.get('id') for item in items if is_question_id(item.get('id'))], user_id)
+    by_id = {question['id']: question for question in fetched}
+    
+    questions = []
+    for item in items:
+        if is_question_id(item.get('id')):
+            if item['id'] in by_id:
+                questions.append(by_id[item['id']])
+        else:
+            questions.append(item)
+    return questions
+
 @app.route('/api/export-paper', methods=['POST'])
 @login_required
 def export_paper():
     """导出试卷API"""
     try:
         data = request.get_json()
-        questions = data.get('questions', [])
+        user_id = session['user_id']
+        questions = resolve_export_questions(data, user_id)
         title = data.get('title', '数学试卷')
         mode = data.get('mode', 'questions')  # questions 或 with-answers
         format_type = data.get('format', 'latex')  # latex, docx, 或 pdf
+        pdf_engine = data.get('pdf_engine') or PDF_EXPORT_CONFIG['default_engine']  # latex 或 reportlab
         
         if not questions:
             return jsonify({'success': False, 'message': '没有题目可导出'}), 400
+        if format_type == 'pdf' and pdf_engine not in PDF_ENGINES:
+            return jsonify({'success': False, 'message': '不支持的PDF排版引擎'}), 400
         
-        # 保存导出历史
-        question_ids = [q.get('id') for q in questions if q.get('id')]
+        # 保存导出历史（只记录已入库的题目）
+        question_ids = [q['id'] for q in questions if is_question_id(q.get('id'))]
         if question_ids:
             system_manager.save_export_history(
-                user_id=session['user_id'],
+                user_id=user_id,
                 title=title,
                 question_ids=question_ids,
                 export_format=format_type,
@@ -484,25 +850,87 @@ def export_paper():
             content = export_renderer.render_latex(questions, mode, title)
             mimetype = 'text/plain'
             filename = f'{title}_{uuid.uuid4().hex[:8]}.tex'
-        elif format_type == 'docx':
-            file_path = export_renderer.render_docx(questions, mode, title)
-            return send_from_directory(os.path.dirname(file_path), os.path.basename(file_path), 
-                                     as_attachment=True, mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-        elif format_type == 'pdf':
-            file_path = export_renderer.render_pdf(questions, mode, title)
-            return send_from_directory(os.path.dirname(file_path), os.path.basename(file_path), 
-                                     as_attachment=True, mimetype='application/pdf')
+        elif format_type in ('docx', 'pdf'):
+            # Word/PDF交给导出进程池生成，返回任务ID，完成后通过 /api/exports/<id>/download 下载
+            try:
+                job_id = export_service.submit(format_type, questions, mode, title,
+                                               pdf_engine=pdf_engine, user_id=user_id)
+            except ExportQueueFull as e:
+                response = jsonify({'success': False, 'message': str(e)})
+                response.headers['Retry-After'] = str(EXPORT_SERVICE_CONFIG['retry_after'])
+                return response, 503
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status_url': f'/api/exports/{job_id}',
+                'download_url': f'/api/exports/{job_id}/download'
+            }), 202
         else:
             return jsonify({'success': False, 'message': '不支持的格式'}), 400
         
         # 对于LaTeX，直接返回内容
-        from flask import Response
         return Response(
             content,
             mimetype=mimetype,
             headers={"Content-disposition": f"attachment; filename={filename}"}
         )
         
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/exports/<job_id>', methods=['GET'])
+@login_required
+def get_export_job(job_id):
+    """查询导出任务API：status 为 queued/running/succeeded/failed"""
+    try:
+        job = export_service.get_job(job_id, user_id=session['user_id'])
+        if not job:
+            return jsonify({'success': False, 'message': '导出任务不存在或已过期'}), 404
+        
+        job.pop('file_path')
+        if job['status'] == 'succeeded':
+            job['download_url'] = f'/api/exports/{job_id}/download'
+        return jsonify({'success': True, 'job': job})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/exports/<job_id>/download', methods=['GET'])
+@login_required
+def download_export(job_id):
+    """下载导出结果API"""
+    try:
+        job = export_service.get_job(job_id, user_id=session['user_id'])
+        if not job:
+            return jsonify({'success': False, 'message': '导出任务不存在或已过期'}), 404
+        if job['status'] != 'succeeded':
+            return jsonify({'success': False, 'message': '导出尚未完成', 'status': job['status']}), 409
+        
+        file_path = job['file_path']
+        if not os.path.exists(file_path):
+            return jsonify({'success': False, 'message': '导出文件已过期，请重新导出'}), 410
+        
+        # PDF编译失败时渲染器返回LaTeX源文件
+        extension = os.path.splitext(file_path)[1]
+        mimetype = {
+            '.pdf': 'application/pdf',
+            '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        }.get(extension, 'text/plain')
+        return send_from_directory(os.path.dirname(file_path), os.path.basename(file_path),
+                                   as_attachment=True, mimetype=mimetype,
+                                   download_name=f"{job['title']}{extension}")
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/exports/scratch-metrics', methods=['GET'])
+@login_required
+def get_export_scratch_metrics():
+    """导出临时区统计API：当前占用及累计清理的文件数和字节数"""
+    try:
+        return jsonify({'success': True, 'metrics': export_scratch.get_metrics()})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -550,12 +978,8 @@ def get_re_export_data(export_id):
         if not export_data or export_data['user_id'] != user_id:
             return jsonify({'success': False, 'message': '导出记录不存在或无权访问'}), 404
         
-        # 根据题目ID获取题目详情
-        questions = []
-        for question_id in export_data['question_ids']:
-            question = question_manager.get_question_by_id(question_id, user_id)
-            if question:
-                questions.append(question)
+        # 根据题目ID获取题目详情（一次查询）
+        questions = question_manager.get_questions_by_ids(export_data['question_ids'], user_id)
         
         return jsonify({
             'success': True,